@@ -0,0 +1,346 @@
+"""
+Durable local journal for attendance and access events
+Events are appended to a SQLite database (WAL mode) next to the app before
+MySQL is touched, and replayed to MySQL in order by a background thread once
+the server is reachable again, at a bounded rate.
+
+Event status:
+    in_flight  the live path is still writing it to MySQL; never replayed
+    pending    handed off (MySQL unreachable) or spilled; replayed in order
+    done       stored in MySQL
+    discarded  the live write failed for another reason and the caller was told so
+    failed     replay gave up after max_attempts
+
+The live path appends with in_flight=True and then calls complete(),
+hand_off() or discard(). in_flight rows left by a crash become pending when
+the journal is next opened (replay is idempotent). done and discarded rows
+are pruned after `retention` seconds.
+
+Replay handlers are registered per event kind (see register_handler); a
+handler returns True when the event is stored (or known to be already
+stored), False when MySQL is unreachable (replay stops and retries later),
+and raises for any other failure (the event is retried up to max_attempts
+times, then parked as 'failed').
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from env_config import env_number
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+class AttendanceJournal:
+    """Append-only SQLite journal with ordered, rate-limited replay to MySQL"""
+
+    def __init__(self, path, replay_interval=5.0, replay_rate=20.0, max_attempts=10, db_down_backoff=30.0,
+                 retention=7 * 86400.0, prune_interval=3600.0):
+        self.path = path
+        self.retention = max(0.0, float(retention))
+        self.prune_interval = max(1.0, float(prune_interval))
+        self._next_prune = 0.0
+        self.replay_interval = max(0.1, float(replay_interval))
+        self.replay_rate = max(0.1, float(replay_rate))
+        self.max_attempts = max(1, int(max_attempts))
+        self.db_down_backoff = max(0.0, float(db_down_backoff))
+
+        self._conn = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._handlers = {}
+        self._db_down_until = 0.0
+        self._stats = {'appended': 0, 'replayed': 0, 'failed': 0, 'discarded': 0, 'pruned': 0,
+                       'last_replay_at': None}
+
+    def _connection(self):
+        """Open (once) the journal database; caller holds the lock"""
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # NORMAL in WAL mode survives application crashes; FULL also survives power loss
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_id TEXT NOT NULL UNIQUE,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    done_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS journal_status_id ON journal (status, id)")
+            # Live writes interrupted by a crash: the outcome is unknown, let replay settle it
+            recovered = conn.execute(
+                "UPDATE journal SET status = 'pending' WHERE status = 'in_flight'"
+            ).rowcount
+            if recovered:
+                print(f"[JOURNAL] {recovered} interrupted events queued for replay")
+            self._conn = conn
+        return self._conn
+
+    def register_handler(self, kind, handler):
+        """Register the replay function for an event kind: handler(payload) -> bool"""
+        self._handlers[kind] = handler
+
+    def append(self, kind, payload, in_flight=False):
+        """Durably record an event; returns its event_id, or None if the journal is unusable
+
+        With in_flight=True the caller is writing the event itself and the
+        replayer leaves it alone until hand_off().
+        """
+        event_id = str(uuid.uuid4())
+        try:
+            data = json.dumps(payload, default=_json_default)
+            with self._lock:
+                self._connection().execute(
+                    "INSERT INTO journal (event_id, kind, payload, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (event_id, kind, data, 'in_flight' if in_flight else 'pending', time.time())
+                )
+                self._stats['appended'] += 1
+            return event_id
+        except Exception as e:
+            print(f"[JOURNAL] Append error: {e}")
+            return None
+
+    def append_sql_rows(self, query, rows):
+        """Journal rows of a single-row INSERT template (used by the log writer to spill)"""
+        ok = True
+        for params in rows:
+            ok = self.append('sql', {'query': query, 'params': list(params)}) is not None and ok
+        self._wake.set()
+        return ok
+
+    def complete(self, event_id):
+        """Mark an event as stored in MySQL"""
+        if not event_id:
+            return
+        try:
+            with self._lock:
+                self._connection().execute(
+                    "UPDATE journal SET status = 'done', done_at = ? WHERE event_id = ?",
+                    (time.time(), event_id)
+                )
+        except Exception as e:
+            print(f"[JOURNAL] Complete error: {e}")
+
+    def hand_off(self, event_id):
+        """Let the replayer store an in_flight event (the live write could not reach MySQL)"""
+        if not event_id:
+            return
+        try:
+            with self._lock:
+                self._connection().execute(
+                    "UPDATE journal SET status = 'pending' WHERE event_id = ? AND status = 'in_flight'",
+                    (event_id,)
+                )
+            self._wake.set()
+        except Exception as e:
+            print(f"[JOURNAL] Hand-off error: {e}")
+
+    def discard(self, event_id, error=None):
+        """Drop an in_flight event whose live write failed for a reason replay would not fix"""
+        if not event_id:
+            return
+        try:
+            with self._lock:
+                self._connection().execute(
+                    "UPDATE journal SET status = 'discarded', done_at = ?, last_error = ? "
+                    "WHERE event_id = ? AND status = 'in_flight'",
+                    (time.time(), str(error)[:500] if error else None, event_id)
+                )
+                self._stats['discarded'] += 1
+        except Exception as e:
+            print(f"[JOURNAL] Discard error: {e}")
+
+    def prune(self, now=None):
+        """Delete done/discarded events older than the retention period; returns the count"""
+        cutoff = (time.time() if now is None else now) - self.retention
+        with self._lock:
+            deleted = self._connection().execute(
+                "DELETE FROM journal WHERE status IN ('done', 'discarded') AND done_at < ?",
+                (cutoff,)
+            ).rowcount
+            self._stats['pruned'] += deleted
+        if deleted:
+            print(f"[JOURNAL] Pruned {deleted} completed events")
+        return deleted
+
+    def db_available(self):
+        """False while MySQL is considered down (skip it and journal straight away)"""
+        return time.monotonic() >= self._db_down_until
+
+    def mark_db_down(self):
+        """Record a connectivity failure; callers skip MySQL for db_down_backoff seconds"""
+        self._db_down_until = time.monotonic() + self.db_down_backoff
+        self.start()
+
+    def _mark_db_up(self):
+        self._db_down_until = 0.0
+
+    def pending_count(self):
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT COUNT(*) FROM journal WHERE status = 'pending'"
+                ).fetchone()
+            return row[0]
+        except Exception:
+            return 0
+
+    def _next_pending(self, limit):
+        with self._lock:
+            return self._connection().execute(
+                "SELECT id, event_id, kind, payload, attempts FROM journal "
+                "WHERE status = 'pending' ORDER BY id LIMIT ?",
+                (limit,)
+            ).fetchall()
+
+    def _record_failure(self, row_id, attempts, error):
+        status = 'failed' if attempts + 1 >= self.max_attempts else 'pending'
+        with self._lock:
+            self._connection().execute(
+                "UPDATE journal SET attempts = attempts + 1, last_error = ?, status = ? WHERE id = ?",
+                (str(error)[:500], status, row_id)
+            )
+            if status == 'failed':
+                self._stats['failed'] += 1
+        if status == 'failed':
+            print(f"[JOURNAL] Event {row_id} parked as failed after {self.max_attempts} attempts: {error}")
+
+    def _probe_db(self):
+        from simple_database import simple_db
+        return simple_db.execute_query("SELECT 1") is not None
+
+    def replay(self, max_events=None):
+        """Replay pending events in order; returns the number replayed"""
+        if not self._probe_db():
+            self.mark_db_down()
+            return 0
+        self._mark_db_up()
+
+        replayed = 0
+        interval = 1.0 / self.replay_rate
+        while not self._stop.is_set():
+            batch = self._next_pending(50)
+            if not batch:
+                break
+            for row_id, event_id, kind, payload, attempts in batch:
+                started = time.monotonic()
+                handler = self._handlers.get(kind)
+                try:
+                    if handler is None:
+                        raise RuntimeError(f"No replay handler for '{kind}' events")
+                    if not handler(json.loads(payload)):
+                        # MySQL went away again: keep order, try later
+                        self.mark_db_down()
+                        return replayed
+                    self.complete(event_id)
+                    replayed += 1
+                    with self._lock:
+                        self._stats['replayed'] += 1
+                        self._stats['last_replay_at'] = datetime.now()
+                except Exception as e:
+                    self._record_failure(row_id, attempts, e)
+                if max_events is not None and replayed >= max_events:
+                    return replayed
+                # Bounded replay rate so a long outage does not flood the server
+                delay = interval - (time.monotonic() - started)
+                if delay > 0 and self._stop.wait(delay):
+                    return replayed
+        if replayed:
+            print(f"[JOURNAL] Replayed {replayed} journaled events to MySQL")
+        return replayed
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.replay_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            if time.monotonic() >= self._next_prune:
+                self._next_prune = time.monotonic() + self.prune_interval
+                try:
+                    self.prune()
+                except Exception as e:
+                    print(f"[JOURNAL] Prune error: {e}")
+            if not self.db_available():
+                continue
+            try:
+                if self.pending_count():
+                    self.replay()
+            except Exception as e:
+                print(f"[JOURNAL] Replay error: {e}")
+
+    def start(self):
+        """Start the background replayer (idempotent)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='attendance-journal', daemon=True)
+            self._thread.start()
+
+    def close(self, timeout=2.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pending'] = self.pending_count()
+        stats['db_down'] = not self.db_available()
+        return stats
+
+
+def _replay_sql_rows(payload):
+    """Replay handler for rows spilled by the write-behind log writer
+
+    True once written, False while MySQL is unreachable (the row keeps its
+    place in the queue); other MySQL errors are counted against the event.
+    """
+    from simple_database import is_connection_error, simple_db
+    try:
+        simple_db.execute_write(payload['query'], tuple(payload['params']))
+    except Exception as e:
+        if is_connection_error(e):
+            return False
+        raise
+    return True
+
+
+attendance_journal = AttendanceJournal(
+    os.getenv('ATTENDANCE_JOURNAL_PATH',
+              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'attendance_journal.db')),
+    replay_interval=env_number('ATTENDANCE_JOURNAL_REPLAY_INTERVAL', 5.0),
+    replay_rate=env_number('ATTENDANCE_JOURNAL_REPLAY_RATE', 20.0),
+    max_attempts=env_number('ATTENDANCE_JOURNAL_MAX_ATTEMPTS', 10, int),
+    db_down_backoff=env_number('ATTENDANCE_JOURNAL_DB_DOWN_BACKOFF', 30.0),
+    retention=env_number('ATTENDANCE_JOURNAL_RETENTION_DAYS', 7.0) * 86400.0,
+)
+attendance_journal.register_handler('sql', _replay_sql_rows)
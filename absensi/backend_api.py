@@ -5,19 +5,253 @@ except ImportError:
     REQUESTS_AVAILABLE = False
     print("⚠️  Requests library not available. Backend API features will use database fallback only.")
 
+import copy
 import os
+import threading
+import time
 from datetime import datetime
 from dotenv import load_dotenv
 
+from checkin_index import checkin_index
+from door_log_sender import requests_post, sender_from_env
+from env_config import env_number
+from schedule_index import schedule_index
+
 load_dotenv()
 
+DUPLICATE_KEY_ERRNO = 1062
+# Two check-ins racing on the once-per-day NOT EXISTS can deadlock under REPEATABLE READ
+DEADLOCK_ERRNO = 1213
+
+# Check if already attended today for this class
+EXISTING_ATTENDANCE_QUERY = """
+SELECT sa.id, sa.check_in_time, cc.class_name, c.course_name
+FROM student_attendances sa
+JOIN attendance_sessions ats ON sa.session_id = ats.id  
+JOIN course_classes cc ON ats.class_id = cc.id
+JOIN courses c ON cc.course_id = c.id
+WHERE sa.student_id = %s 
+AND ats.class_id = %s
+AND DATE(sa.check_in_time) = %s
+"""
+
+# The schema has no foreign keys, so the insert itself checks that the (possibly
+# cached) session still exists and is open; a deleted, completed or cancelled
+# session inserts no row instead of leaving an orphaned attendance record
+ATTENDANCE_INSERT = """
+INSERT INTO student_attendances 
+(session_id, student_id, status, check_in_time, attendance_method, confidence_score, created_at, updated_at)
+SELECT live.id, %s, %s, %s, %s, %s, %s, %s FROM attendance_sessions live
+WHERE live.id = %s AND live.status IN ('scheduled', 'ongoing')
+"""
+
+# One check-in per student, class and day (the same rule as EXISTING_ATTENDANCE_QUERY),
+# even when the class has several sessions that day; no row is inserted for a repeat
+# or when the session is no longer open (as in ATTENDANCE_INSERT). The day is a range
+# on check_in_time so its index can be used. Across sessions the rule is best-effort:
+# the unique key only covers (session_id, student_id), so two concurrent check-ins
+# into different sessions of the class can both pass NOT EXISTS
+ATTENDANCE_INSERT_ONCE_PER_DAY = """
+INSERT INTO student_attendances 
+(session_id, student_id, status, check_in_time, attendance_method, confidence_score, created_at, updated_at)
+SELECT live.id, %s, %s, %s, %s, %s, %s, %s FROM attendance_sessions live
+WHERE live.id = %s AND live.status IN ('scheduled', 'ongoing')
+AND NOT EXISTS (
+    SELECT 1 FROM student_attendances sa
+    JOIN attendance_sessions ats ON sa.session_id = ats.id
+    WHERE sa.student_id = %s
+    AND ats.class_id = %s
+    AND sa.check_in_time >= %s AND sa.check_in_time < %s + INTERVAL 1 DAY
+)
+"""
+
+LATEST_SESSION_QUERY = """
+SELECT id FROM attendance_sessions 
+WHERE class_id = %s AND session_date = %s
+ORDER BY created_at DESC
+LIMIT 1
+"""
+
+UNIQUE_KEYS_QUERY = """
+SELECT TABLE_NAME, GROUP_CONCAT(COLUMN_NAME ORDER BY SEQ_IN_INDEX) AS cols
+FROM information_schema.STATISTICS
+WHERE TABLE_SCHEMA = DATABASE()
+  AND TABLE_NAME = 'student_attendances'
+  AND NON_UNIQUE = 0
+GROUP BY TABLE_NAME, INDEX_NAME
+"""
+
+
+class SessionRegistry:
+    """attendance_sessions ids by (class_id, session_date), cached for `ttl` seconds.
+
+    The first caller for a key runs the loader (lookup, or creation) under a
+    per-key lock, so concurrent recognitions for a new class/day create the
+    session exactly once; everyone after that is served from memory until the
+    entry is `ttl` seconds old, so a session deleted or replaced in the backend
+    is picked up again. Entries for past days are evicted when the date rolls
+    over, and invalidate() drops a class at once (e.g. when an insert finds its
+    cached session deleted or closed).
+    """
+
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ids = {}        # (class_id, session_date) -> (session_id, stored_at)
+        self._key_locks = {}  # (class_id, session_date) -> Lock
+        self._today = None
+        self.hits = 0
+        self.misses = 0
+
+    def _roll_over(self):
+        """Drop entries from earlier days (caller holds the lock)"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        if today != self._today:
+            self._today = today
+            self._ids = {key: value for key, value in self._ids.items() if key[1] >= today}
+            self._key_locks = {key: lock for key, lock in self._key_locks.items() if key[1] >= today}
+
+    def _fresh(self, key):
+        """Cached id for key if younger than ttl, else None (caller holds the lock)"""
+        entry = self._ids.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] >= self.ttl:
+            del self._ids[key]
+            return None
+        return entry[0]
+
+    def cached(self, class_id, session_date):
+        with self._lock:
+            self._roll_over()
+            return self._fresh((class_id, str(session_date)))
+
+    def remember(self, class_id, session_date, session_id):
+        if not session_id:
+            return
+        with self._lock:
+            self._roll_over()
+            self._ids[(class_id, str(session_date))] = (session_id, time.monotonic())
+
+    def get(self, class_id, session_date, loader):
+        """Cached session id, or loader() run once per key; loader errors propagate"""
+        key = (class_id, str(session_date))
+        with self._lock:
+            self._roll_over()
+            session_id = self._fresh(key)
+            if session_id:
+                self.hits += 1
+                return session_id
+            self.misses += 1
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another thread may have resolved it while we waited
+            with self._lock:
+                session_id = self._fresh(key)
+            if session_id:
+                return session_id
+            session_id = loader()
+            if session_id:
+                with self._lock:
+                    self._ids[key] = (session_id, time.monotonic())
+            return session_id
+
+    def invalidate(self, class_id=None):
+        """Forget sessions for one class (e.g. a session was deleted), or all"""
+        with self._lock:
+            if class_id is None:
+                self._ids.clear()
+            else:
+                self._ids = {key: value for key, value in self._ids.items() if key[0] != class_id}
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._ids), 'hits': self.hits, 'misses': self.misses}
+
+
+class AccessDecisionCache:
+    """Per-user access decisions, each valid until that user's next schedule boundary.
+
+    An access decision can only change when a slot starts or ends (or when the
+    schedule data changes, which calls invalidate), so a cached answer is exact
+    until then and repeated recognitions of the same person cost nothing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # user_id -> (expires_at, decision)
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def generation(self):
+        return self._generation
+
+    def get(self, user_id, now):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now < entry[0]:
+                self.hits += 1
+                decision = entry[1]
+            else:
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+        # Callers get their own copy so nothing they do can change the cached answer
+        return copy.deepcopy(decision)
+
+    def put(self, user_id, decision, expires_at, generation):
+        """Store decision unless the cache was invalidated since generation was read"""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[user_id] = (expires_at, copy.deepcopy(decision))
+
+    def invalidate(self, user_ids=None):
+        """Drop cached decisions for user_ids, or all of them when user_ids is None"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if user_ids is None:
+                self._entries.clear()
+            else:
+                for user_id in user_ids:
+                    self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'invalidations': self.invalidations,
+            }
+
+
 class BackendAPI:
     def __init__(self):
         self.base_url = os.getenv('BACKEND_API_URL', 'http://localhost:5000')
         if REQUESTS_AVAILABLE:
             self.session = requests.Session()
+            self.door_log_sender = sender_from_env(self.base_url, requests_post(self.session),
+                                                   self._log_access_event_fallback)
         else:
             self.session = None
+            self.door_log_sender = None
+        
+        from attendance_journal import attendance_journal
+        attendance_journal.register_handler('attendance', self._replay_attendance)
+        
+        self._unique_keys = None
+        self.sessions = SessionRegistry(ttl=env_number('ATTENDANCE_SESSION_TTL', 300))
+        
+        # Enrolment/schedule reloads drop the affected cached decisions
+        self.access_cache = AccessDecisionCache()
+        schedule_index.add_change_listener(self.access_cache.invalidate)
         
     def check_user_room_access(self, user_id, date=None):
         """
@@ -27,10 +261,27 @@ class BackendAPI:
         if date is None:
             date = datetime.now().strftime('%Y-%m-%d')
         
-        # Use fallback database check immediately since backend requires auth
+        now = datetime.now()
+        cached = self.access_cache.get(user_id, now)
+        if cached is not None:
+            print(f"[BACKEND API] Access decision for {user_id} served from cache")
+            return cached
+        
+        # Backend requires auth: decide locally from the compiled schedule index
+        generation = self.access_cache.generation()
+        decision = schedule_index.check(user_id, now)
+        if decision is not None:
+            self.access_cache.put(user_id, decision, schedule_index.next_boundary(user_id, now), generation)
+            return decision
+        
+        # Index could not be loaded: query the database directly
         print(f"[BACKEND API] Using database fallback for user {user_id} on {date}")
         return self._check_access_fallback(user_id, date)
     
+    def invalidate_access_cache(self, user_id=None):
+        """Forget cached access decisions (one user, or everyone) after enrolment changes"""
+        self.access_cache.invalidate(None if user_id is None else [user_id])
+    
     def _check_access_fallback(self, user_id, date):
         """
         Fallback method to check access directly from database
@@ -228,33 +479,121 @@ class BackendAPI:
     def record_attendance(self, user_id, class_id, confidence_score=None):
         """
         Record attendance for a user in a specific class
+        The event is written to the local journal first; if MySQL is unreachable it
+        stays there and is replayed later, so the check-in is never lost
+        """
+        from attendance_journal import attendance_journal
+        
+        current_time = datetime.now()
+        
+        # Repeat entries (the common case at the door) are answered from memory
+        previous_checkin = checkin_index.checked_in(user_id, class_id)
+        if previous_checkin is not None:
+            cls = schedule_index.class_info(class_id) or {'course_name': '-', 'class_name': '-'}
+            print(f"[BACKEND API] ❌ Already attended today! Previous check-in: {previous_checkin}")
+            return {
+                'success': False,
+                'message': f"Sudah absen hari ini untuk {cls['course_name']} - {cls['class_name']}",
+                'previous_checkin': previous_checkin,
+                'reason': 'duplicate_attendance'
+            }
+        
+        # in_flight: the replayer leaves it alone while this thread writes it
+        event_id = attendance_journal.append('attendance', {
+            'user_id': user_id,
+            'class_id': class_id,
+            'confidence_score': confidence_score,
+            'check_in_time': current_time
+        }, in_flight=True)
+        
+        if event_id and not attendance_journal.db_available():
+            # MySQL failed recently: don't wait on another connect timeout
+            attendance_journal.hand_off(event_id)
+            return self._journaled_attendance_result(user_id, class_id, current_time, confidence_score)
+        
+        try:
+            result = self._record_attendance_db(user_id, class_id, confidence_score, current_time)
+        except Exception as e:
+            attendance_journal.discard(event_id, e)
+            raise
+        reason = result.get('reason')
+        if reason == 'database_unreachable':
+            attendance_journal.mark_db_down()
+            if event_id:
+                attendance_journal.hand_off(event_id)
+                return self._journaled_attendance_result(user_id, class_id, current_time, confidence_score)
+            return result
+        if result.get('success') or reason == 'duplicate_attendance':
+            attendance_journal.complete(event_id)
+        else:
+            # The caller is told the check-in failed; replaying it later would contradict that
+            attendance_journal.discard(event_id, reason)
+        return result
+    
+    def _journaled_attendance_result(self, user_id, class_id, check_in_time, confidence_score):
+        print(f"[BACKEND API] ⚠️ Database unreachable, attendance for {user_id} saved to local journal")
+        # The journal will store it; repeats until then must not queue more check-ins
+        checkin_index.add(user_id, class_id, check_in_time)
+        return {
+            'success': True,
+            'message': 'Absensi disimpan sementara (database offline)',
+            'session_id': None,
+            'check_in_time': check_in_time.isoformat(),
+            'confidence_score': confidence_score,
+            'journaled': True
+        }
+    
+    def _replay_attendance(self, payload):
+        """Journal replay handler: True once stored (or already present), False while MySQL is down"""
+        check_in_time = datetime.strptime(payload['check_in_time'], '%Y-%m-%d %H:%M:%S.%f')
+        result = self._record_attendance_db(
+            payload['user_id'], payload['class_id'], payload.get('confidence_score'), check_in_time
+        )
+        reason = result.get('reason')
+        if reason == 'database_unreachable':
+            return False
+        if result.get('success') or reason == 'duplicate_attendance':
+            # The duplicate check makes replay idempotent: a retried event finds its own row
+            return True
+        raise RuntimeError(result.get('message', reason))
+    
+    def _record_attendance_db(self, user_id, class_id, confidence_score, current_time):
+        """
+        Record attendance in MySQL for the day of current_time
         Prevents duplicate attendance for same class on same day
+        With the unique key from the attendance migration a first check-in is two
+        round trips (session lookup + attendance insert); without it the duplicate
+        check, session lookup/creation and insert run in one transaction
         """
         try:
-            from simple_database import simple_db
-            from datetime import datetime
-            
-            current_date = datetime.now().strftime('%Y-%m-%d')
-            current_time = datetime.now()
+            from simple_database import is_connection_error
+            from mysql.connector import Error
             
             print(f"[BACKEND API] Recording attendance for {user_id} in class {class_id}")
             
-            # Check if already attended today for this class
-            check_query = """
-            SELECT sa.id, sa.check_in_time, cc.class_name, c.course_name
-            FROM student_attendances sa
-            JOIN attendance_sessions ats ON sa.session_id = ats.id  
-            JOIN course_classes cc ON ats.class_id = cc.id
-            JOIN courses c ON cc.course_id = c.id
-            WHERE sa.student_id = %s 
-            AND ats.class_id = %s
-            AND DATE(sa.check_in_time) = %s
-            """
-            
-            existing = simple_db.execute_query(check_query, (user_id, class_id, current_date))
+            try:
+                session_id, existing_record = self._insert_attendance(
+                    user_id, class_id, confidence_score, current_time)
+            except Exception as e:
+                if is_connection_error(e):
+                    print(f"[BACKEND API] ❌ Database unreachable: {e}")
+                    return {
+                        'success': False,
+                        'message': 'Database tidak dapat dihubungi',
+                        'reason': 'database_unreachable'
+                    }
+                if not isinstance(e, Error):
+                    raise
+                print(f"[BACKEND API] ❌ Failed to insert attendance record: {e}")
+                return {
+                    'success': False,
+                    'message': 'Gagal mencatat absensi',
+                    'reason': 'database_insert_failed'
+                }
             
-            if existing and len(existing) > 0:
-                existing_record = existing[0]
+            if existing_record:
+                if existing_record.get('check_in_time'):
+                    checkin_index.add(user_id, class_id, existing_record['check_in_time'])
                 print(f"[BACKEND API] ❌ Already attended today! Previous check-in: {existing_record['check_in_time']}")
                 return {
                     'success': False,
@@ -263,9 +602,6 @@ class BackendAPI:
                     'reason': 'duplicate_attendance'
                 }
             
-            # Get or create attendance session for today
-            session_id = self._get_or_create_session(class_id, current_date)
-            
             if not session_id:
                 print("[BACKEND API] ❌ Failed to get/create attendance session")
                 return {
@@ -274,45 +610,19 @@ class BackendAPI:
                     'reason': 'session_creation_failed'
                 }
             
-            # Record attendance
-            attendance_query = """
-            INSERT INTO student_attendances 
-            (session_id, student_id, status, check_in_time, attendance_method, confidence_score, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """
+            checkin_index.add(user_id, class_id, current_time)
             
-            attendance_params = (
-                session_id,
-                user_id,
-                'present',
-                current_time,
-                'face_recognition',
-                confidence_score,
-                current_time,
-                current_time
-            )
-            
-            result = simple_db.execute_query(attendance_query, attendance_params)
-            
-            if result:
-                # Log face recognition
-                self._log_face_recognition(session_id, user_id, confidence_score)
+            # Log face recognition (queued, written in the background)
+            self._log_face_recognition(session_id, user_id, confidence_score)
                 
-                print(f"[BACKEND API] ✅ Attendance recorded successfully for {user_id}")
-                return {
-                    'success': True,
-                    'message': 'Absensi berhasil dicatat',
-                    'session_id': session_id,
-                    'check_in_time': current_time.isoformat(),
-                    'confidence_score': confidence_score
-                }
-            else:
-                print("[BACKEND API] ❌ Failed to insert attendance record")
-                return {
-                    'success': False,
-                    'message': 'Gagal mencatat absensi',
-                    'reason': 'database_insert_failed'
-                }
+            print(f"[BACKEND API] ✅ Attendance recorded successfully for {user_id}")
+            return {
+                'success': True,
+                'message': 'Absensi berhasil dicatat',
+                'session_id': session_id,
+                'check_in_time': current_time.isoformat(),
+                'confidence_score': confidence_score
+            }
                 
         except Exception as e:
             print(f"[BACKEND API] Record attendance error: {e}")
@@ -323,122 +633,256 @@ class BackendAPI:
                 'message': 'Error sistem saat mencatat absensi',
                 'reason': 'system_error'
             }
-
-    def _get_or_create_session(self, class_id, session_date):
+    
+    def _insert_attendance(self, user_id, class_id, confidence_score, current_time):
+        if self._attendance_unique_keys():
+            return self._insert_attendance_upsert(user_id, class_id, confidence_score, current_time)
+        return self._insert_attendance_checked(user_id, class_id, confidence_score, current_time)
+    
+    def _attendance_unique_keys(self):
         """
-        Get existing or create new attendance session for class on specific date
+        True once student_attendances has UNIQUE (session_id, student_id)
+        (backend/migrations/add-attendance-unique-key.js); checked once per process
         """
-        try:
-            from simple_database import simple_db
-            from datetime import datetime
-            
-            # Check if session already exists
-            check_query = """
-            SELECT id FROM attendance_sessions 
-            WHERE class_id = %s AND session_date = %s
-            ORDER BY created_at DESC
-            LIMIT 1
-            """
-            
-            existing = simple_db.execute_query(check_query, (class_id, session_date))
+        if self._unique_keys is not None:
+            return self._unique_keys
+        
+        from simple_database import simple_db
+        rows = simple_db.execute_query(UNIQUE_KEYS_QUERY)
+        if rows is None:
+            # Unknown (database unreachable): use the safe path and ask again next time
+            return False
+        found = {(row['TABLE_NAME'], row['cols']) for row in rows}
+        self._unique_keys = ('student_attendances', 'session_id,student_id') in found
+        if not self._unique_keys:
+            print("[BACKEND API] ⚠️ Attendance unique key missing, run backend/migrations/add-attendance-unique-key.js; "
+                  "using the slower check-then-insert path")
+        return self._unique_keys
+    
+    def _insert_attendance_upsert(self, user_id, class_id, confidence_score, current_time):
+        """
+        Session lookup + attendance insert, each a single self-committing statement
+        The insert skips students already checked in to this class today (any
+        session, as in the checked path); the unique key additionally stops
+        concurrent inserts into the same session. When nothing was inserted the
+        earlier record is looked up; if there is none the cached session was
+        deleted or closed, so it is reloaded and the insert tried once more
+        Returns (session_id, existing_record)
+        """
+        from simple_database import simple_db
+        from mysql.connector import Error
+        
+        current_date = current_time.strftime('%Y-%m-%d')
+        
+        def load_session():
+            existing = simple_db.execute_query(LATEST_SESSION_QUERY, (class_id, current_date))
+            if existing:
+                return existing[0]['id']
+            # First check-in of the day for this class (or the lookup failed): create it
+            # under the class row lock; errors propagate from the transaction
+            with simple_db.transaction() as tx:
+                return self._get_or_create_session(class_id, current_date, tx=tx)
+        
+        for attempt in (1, 2):
+            # After the first check-in per class and day this is a memory lookup
+            session_id = self.sessions.get(class_id, current_date, load_session)
+            if not session_id:
+                return None, None
             
+            try:
+                inserted, _ = simple_db.execute_write(ATTENDANCE_INSERT_ONCE_PER_DAY, (
+                    user_id,
+                    'present',
+                    current_time,
+                    'face_recognition',
+                    confidence_score,
+                    current_time,
+                    current_time,
+                    session_id,
+                    user_id,
+                    class_id,
+                    current_date,
+                    current_date
+                ))
+            except Error as e:
+                errno = getattr(e, 'errno', None)
+                if errno not in (DUPLICATE_KEY_ERRNO, DEADLOCK_ERRNO):
+                    raise
+                existing = simple_db.execute_query(EXISTING_ATTENDANCE_QUERY, (user_id, class_id, current_date))
+                if errno == DEADLOCK_ERRNO and not existing:
+                    # The deadlock was not with this student's own check-in: retry once
+                    if attempt == 2:
+                        raise
+                    print(f"[BACKEND API] ⚠️ Attendance insert for {user_id} deadlocked, retrying")
+                    continue
+                return session_id, (existing[0] if existing else {
+                    'check_in_time': None, 'course_name': '-', 'class_name': '-'
+                })
+            if inserted:
+                return session_id, None
+            existing = simple_db.execute_query(EXISTING_ATTENDANCE_QUERY, (user_id, class_id, current_date))
+            if existing:
+                return session_id, existing[0]
+            # No row and no earlier check-in: the session was deleted or closed in the
+            # backend since it was cached; look it up (or create it) again, once
+            print(f"[BACKEND API] ⚠️ Attendance session {session_id} for class {class_id} is no longer open")
+            self.sessions.invalidate(class_id)
+        return None, None
+    
+    def _insert_attendance_checked(self, user_id, class_id, confidence_score, current_time):
+        """
+        Duplicate check, session lookup/creation and insert in one transaction
+        (used until the attendance unique keys exist)
+        Returns (session_id, existing_record)
+        """
+        from simple_database import simple_db
+        
+        current_date = current_time.strftime('%Y-%m-%d')
+        with simple_db.transaction() as tx:
+            existing = tx.execute(EXISTING_ATTENDANCE_QUERY, (user_id, class_id, current_date))
             if existing and len(existing) > 0:
-                session_id = existing[0]['id']
-                print(f"[BACKEND API] Using existing session {session_id}")
-                return session_id
-            
-            # Create new session
-            current_time = datetime.now()
-            
-            # Get class schedule for session times
-            class_query = """
-            SELECT schedule, class_name FROM course_classes WHERE id = %s
-            """
-            
-            class_info = simple_db.execute_query(class_query, (class_id,))
-            
-            if not class_info:
-                print(f"[BACKEND API] Class {class_id} not found")
-                return None
-                
-            # Parse schedule to get times
-            schedule_json = class_info[0].get('schedule', '[]')
-            start_time = '08:00:00'
-            end_time = '17:00:00'
+                return None, existing[0]
+            
+            def insert(session_id):
+                return tx.execute(ATTENDANCE_INSERT, (
+                    user_id,
+                    'present',
+                    current_time,
+                    'face_recognition',
+                    confidence_score,
+                    current_time,
+                    current_time,
+                    session_id
+                ))
+            
+            # Cached session for today, unless it was deleted or closed since
+            session_id = self.sessions.cached(class_id, current_date)
+            if session_id:
+                if insert(session_id):
+                    return session_id, None
+                print(f"[BACKEND API] ⚠️ Attendance session {session_id} for class {class_id} is no longer open")
+                self.sessions.invalidate(class_id)
             
+            # Get or create attendance session for today
+            session_id = self._get_or_create_session(class_id, current_date, tx=tx)
+            if not session_id or not insert(session_id):
+                return None, None
+        # Only remember the session once the transaction that may have created it committed
+        self.sessions.remember(class_id, current_date, session_id)
+        return session_id, None
+
+    def _get_or_create_session(self, class_id, session_date, tx=None):
+        """
+        Get existing or create new attendance session for class on specific date
+        Creation locks the class row so concurrent recognitions cannot create duplicate sessions
+        """
+        from simple_database import simple_db
+        
+        if tx is None:
             try:
-                import json
-                schedule = json.loads(schedule_json) if isinstance(schedule_json, str) else schedule_json
-                if isinstance(schedule, str):
-                    schedule = json.loads(schedule)
-                    
-                if schedule and len(schedule) > 0:
-                    first_slot = schedule[0]
-                    if isinstance(first_slot, dict):
-                        start_time = first_slot.get('start_time', '08:00') + ':00'
-                        end_time = first_slot.get('end_time', '17:00') + ':00'
-            except:
-                pass
-            
-            # Insert new session
-            session_query = """
-            INSERT INTO attendance_sessions 
-            (class_id, session_number, session_date, start_time, end_time, topic, 
-             session_type, attendance_method, status, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            # Get next session number
-            count_query = """
-            SELECT COUNT(*) as count FROM attendance_sessions WHERE class_id = %s
-            """
-            count_result = simple_db.execute_query(count_query, (class_id,))
-            session_number = (count_result[0]['count'] if count_result else 0) + 1
-            
-            session_params = (
-                class_id,
-                session_number,
-                session_date,
-                start_time,
-                end_time,
-                f"Pertemuan {session_number} - Face Recognition",
-                'regular',
-                'face_recognition',
-                'ongoing',
-                current_time,
-                current_time
-            )
-            
-            result = simple_db.execute_query(session_query, session_params)
-            
-            if result:
-                # Get the inserted session ID
-                get_id_query = """
-                SELECT id FROM attendance_sessions 
-                WHERE class_id = %s AND session_date = %s 
-                ORDER BY created_at DESC LIMIT 1
-                """
+                with simple_db.transaction() as own_tx:
+                    return self._get_or_create_session(class_id, session_date, tx=own_tx)
+            except Exception as e:
+                print(f"[BACKEND API] Get/create session error: {e}")
+                return None
+        
+        from datetime import datetime
+        
+        # Check if session already exists
+        check_query = LATEST_SESSION_QUERY
+        
+        existing = tx.execute(check_query, (class_id, session_date))
+        
+        if existing and len(existing) > 0:
+            session_id = existing[0]['id']
+            print(f"[BACKEND API] Using existing session {session_id}")
+            return session_id
+        
+        # Create new session
+        current_time = datetime.now()
+        
+        # Get class schedule for session times; FOR UPDATE serializes session creation per class
+        class_query = """
+        SELECT schedule, class_name FROM course_classes WHERE id = %s FOR UPDATE
+        """
+        
+        class_info = tx.execute(class_query, (class_id,))
+        
+        if not class_info:
+            print(f"[BACKEND API] Class {class_id} not found")
+            return None
+        
+        # Another thread may have created the session while we waited for the lock
+        existing = tx.execute(check_query, (class_id, session_date))
+        if existing and len(existing) > 0:
+            session_id = existing[0]['id']
+            print(f"[BACKEND API] Using existing session {session_id}")
+            return session_id
+            
+        # Parse schedule to get times
+        schedule_json = class_info[0].get('schedule', '[]')
+        start_time = '08:00:00'
+        end_time = '17:00:00'
+        
+        try:
+            import json
+            schedule = json.loads(schedule_json) if isinstance(schedule_json, str) else schedule_json
+            if isinstance(schedule, str):
+                schedule = json.loads(schedule)
                 
-                session_result = simple_db.execute_query(get_id_query, (class_id, session_date))
+            if schedule and len(schedule) > 0:
+                first_slot = schedule[0]
+                if isinstance(first_slot, dict):
+                    start_time = first_slot.get('start_time', '08:00') + ':00'
+                    end_time = first_slot.get('end_time', '17:00') + ':00'
+        except:
+            pass
+        
+        # Insert new session
+        session_query = """
+        INSERT INTO attendance_sessions 
+        (class_id, session_number, session_date, start_time, end_time, topic, 
+         session_type, attendance_method, status, created_at, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        
+        # Get next session number
+        count_query = """
+        SELECT COUNT(*) as count FROM attendance_sessions WHERE class_id = %s
+        """
+        count_result = tx.execute(count_query, (class_id,))
+        session_number = (count_result[0]['count'] if count_result else 0) + 1
+        
+        session_params = (
+            class_id,
+            session_number,
+            session_date,
+            start_time,
+            end_time,
+            f"Pertemuan {session_number} - Face Recognition",
+            'regular',
+            'face_recognition',
+            'ongoing',
+            current_time,
+            current_time
+        )
+        
+        tx.execute(session_query, session_params)
+        session_id = tx.lastrowid
+        
+        if session_id:
+            print(f"[BACKEND API] Created new session {session_id}")
+            return session_id
                 
-                if session_result:
-                    session_id = session_result[0]['id']
-                    print(f"[BACKEND API] Created new session {session_id}")
-                    return session_id
-                    
-            print("[BACKEND API] Failed to create session")
-            return None
-            
-        except Exception as e:
-            print(f"[BACKEND API] Get/create session error: {e}")
-            return None
+        print("[BACKEND API] Failed to create session")
+        return None
 
     def _log_face_recognition(self, session_id, user_id, confidence_score):
         """
-        Log face recognition attempt
+        Log face recognition attempt (queued on the write-behind log writer)
         """
         try:
-            from simple_database import simple_db
+            from log_writer import log_writer
             from datetime import datetime
             
             log_query = """
@@ -458,8 +902,8 @@ class BackendAPI:
                 datetime.now()
             )
             
-            simple_db.execute_query(log_query, log_params)
-            print(f"[BACKEND API] Face recognition logged for user {user_id}")
+            log_writer.submit(log_query, log_params)
+            print(f"[BACKEND API] Face recognition log queued for user {user_id}")
             
         except Exception as e:
             print(f"[BACKEND API] Log face recognition error: {e}")
@@ -469,48 +913,45 @@ class BackendAPI:
                        reason=None, session_id=None):
         """
         Log door access attempt to backend
+        (queued on the background sender, so the door decision never waits on HTTP)
         """
         # If requests is not available, use fallback immediately
-        if not REQUESTS_AVAILABLE or self.session is None:
-            return self._log_access_fallback(user_id, access_type, access_status, 
-                                           confidence_score, reason, session_id)
-            
-        try:
-            url = f"{self.base_url}/api/door-access/log"
-            data = {
-                'user_id': user_id,
-                'access_type': access_type,
-                'access_status': access_status,
-                'confidence_score': confidence_score,
-                'reason': reason,
-                'session_id': session_id,
-                'accessed_at': datetime.now().isoformat()
-            }
-            
-            response = self.session.post(url, json=data, timeout=5)
-            
-            if response.status_code == 200:
-                print(f"[BACKEND API] Access logged successfully for user {user_id}")
-                return True
-            else:
-                # If backend returns non-200 (e.g., 404), fall back to DB logging
-                print(f"[BACKEND API] Error logging access: {response.status_code}, falling back to DB log")
-                return self._log_access_fallback(user_id, access_type, access_status, 
-                                               confidence_score, reason, session_id)
-                
-        except Exception as e:
-            print(f"[BACKEND API] Request error logging access: {e}")
-            # Fallback to database logging
+        if self.door_log_sender is None:
             return self._log_access_fallback(user_id, access_type, access_status, 
                                            confidence_score, reason, session_id)
+        
+        return self.door_log_sender.submit({
+            'user_id': user_id,
+            'access_type': access_type,
+            'access_status': access_status,
+            'confidence_score': confidence_score,
+            'reason': reason,
+            'session_id': session_id,
+            'accessed_at': datetime.now().isoformat()
+        })
+    
+    def _log_access_event_fallback(self, event):
+        """DB fallback for one event the sender could not deliver"""
+        accessed_at = event.get('accessed_at')
+        return self._log_access_fallback(
+            event['user_id'], event['access_type'], event['access_status'],
+            event['confidence_score'], event['reason'], event['session_id'],
+            accessed_at=datetime.fromisoformat(accessed_at) if accessed_at else None
+        )
+    
+    def close(self):
+        """Flush queued door access events (anything unsent goes to the DB log queue)"""
+        if self.door_log_sender is not None:
+            self.door_log_sender.close()
     
     def _log_access_fallback(self, user_id, access_type, access_status, 
-                           confidence_score, reason, session_id):
+                           confidence_score, reason, session_id, accessed_at=None):
         """
         Fallback method to log access directly to database
+        (queued on the write-behind log writer so the door decision does not wait)
         """
         try:
-            from simple_database import simple_db
+            from log_writer import log_writer
             
             query = """
             INSERT INTO door_access_logs 
@@ -520,11 +961,10 @@ class BackendAPI:
             
             values = (
                 user_id, access_type, access_status, confidence_score, 
-                reason, session_id, datetime.now()
+                reason, session_id, accessed_at or datetime.now()
             )
             
-            result = simple_db.execute_query(query, values)
-            return result is not None
+            return log_writer.submit(query, values)
             
         except Exception as e:
             print(f"[BACKEND API] Fallback logging error: {e}")
@@ -0,0 +1,158 @@
+"""
+Benchmark: log-table write throughput, per-row execute_query vs. execute_many
+
+Writes door_access_logs-shaped rows through SimpleDatabaseConnection. By
+default a file-backed SQLite database stands in for MySQL (through a small
+adapter that speaks the mysql.connector calls simple_database uses); pass
+--mysql to use the DB_* settings from .env against a scratch table instead.
+
+Usage:
+    python bench_db_writes.py --rows 2000
+    python bench_db_writes.py --mysql --rows 5000 --chunk 500
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+TABLE = 'bench_door_access_logs'
+INSERT = f"""
+INSERT INTO {TABLE}
+(user_id, access_type, access_status, confidence_score, reason, session_id, accessed_at)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+class _SqliteCursor:
+    def __init__(self, connection, dictionary=False):
+        self._cursor = connection.cursor()
+        self._dictionary = dictionary
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, query, params=None):
+        self._cursor.execute(query.replace('%s', '?'), params or ())
+
+    def executemany(self, query, rows):
+        self._cursor.executemany(query.replace('%s', '?'), rows)
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if not self._dictionary:
+            return rows
+        columns = [d[0] for d in self._cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self):
+        self._cursor.close()
+
+
+class SqliteStandIn:
+    """Just enough of a mysql.connector connection for SimpleDatabaseConnection"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level='DEFERRED')
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def is_connected(self):
+        return True
+
+    def ping(self, **kwargs):
+        self._conn.execute('SELECT 1')
+
+    def cursor(self, dictionary=False, buffered=True):
+        return _SqliteCursor(self._conn, dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def make_rows(count):
+    now = datetime.now().isoformat(sep=' ')
+    return [
+        (f"student{i % 300:03d}", 'face_recognition', 'granted', 0.8123, 'Door access granted (attendance already marked)', None, now)
+        for i in range(count)
+    ]
+
+
+def run(db, rows, chunk):
+    quiet = io.StringIO()
+    with contextlib.redirect_stdout(quiet):
+        start = time.perf_counter()
+        for row in rows:
+            db.execute_query(INSERT, row)
+        per_row = time.perf_counter() - start
+
+        start = time.perf_counter()
+        written = db.execute_many(INSERT, rows, chunk_size=chunk)
+        bulk = time.perf_counter() - start
+    return per_row, bulk, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--chunk', type=int, default=500, help='rows per multi-row INSERT / commit')
+    parser.add_argument('--mysql', action='store_true', help='use the MySQL server configured in .env')
+    args = parser.parse_args()
+
+    from simple_database import SimpleDatabaseConnection
+
+    db = SimpleDatabaseConnection()
+    columns = ("id INTEGER PRIMARY KEY AUTOINCREMENT, user_id VARCHAR(255), access_type VARCHAR(32), "
+               "access_status VARCHAR(16), confidence_score DECIMAL(5,4), reason VARCHAR(200), "
+               "session_id INT, accessed_at DATETIME")
+    tmpdir = None
+    if args.mysql:
+        backend = 'MySQL'
+        db.execute_query(f"DROP TABLE IF EXISTS {TABLE}")
+        db.execute_query(f"CREATE TABLE {TABLE} ({columns.replace('AUTOINCREMENT', 'AUTO_INCREMENT')})")
+    else:
+        backend = 'SQLite stand-in'
+        tmpdir = tempfile.mkdtemp(prefix='bench_db_')
+        path = os.path.join(tmpdir, 'bench.db')
+        db.pool._connect = lambda: SqliteStandIn(path)
+        setup = SqliteStandIn(path)
+        setup._conn.execute(f"CREATE TABLE {TABLE} ({columns})")
+        setup.close()
+
+    rows = make_rows(args.rows)
+    per_row, bulk, written = run(db, rows, args.chunk)
+
+    print(f"Backend: {backend}, rows: {args.rows}, chunk: {args.chunk}")
+    print(f"{'path':>22} {'seconds':>9} {'rows/sec':>11}")
+    print(f"{'execute_query per row':>22} {per_row:>9.3f} {args.rows / per_row:>11.0f}")
+    print(f"{'execute_many':>22} {bulk:>9.3f} {written / bulk if bulk else 0:>11.0f}")
+    print(f"Speed-up: {per_row / bulk if bulk else 0:.1f}x")
+
+    if args.mysql:
+        db.execute_query(f"DROP TABLE IF EXISTS {TABLE}")
+    db.close()
+    if tmpdir:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
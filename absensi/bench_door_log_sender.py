@@ -0,0 +1,165 @@
+"""
+Harness: door access logging through DoorLogSender against a local stub backend
+
+Starts an HTTP server on localhost that accepts POST /api/door-access/log,
+sleeps --latency-ms per request and answers --error-rate of them with 503
+(--down makes every request fail). Door events are submitted at --rate per
+second, the way the recognition threads do, and the harness reports how long
+callers were blocked, how many events reached the stub vs the DB fallback,
+and what the circuit breaker did. The fallback here only counts events; the
+database is never touched.
+
+With --blocking the old path is measured instead: one synchronous POST per
+event with a 5 s timeout, falling back on any error.
+
+Usage:
+    python bench_door_log_sender.py --events 500 --latency-ms 80 --error-rate 0.1
+    python bench_door_log_sender.py --events 200 --down
+    python bench_door_log_sender.py --events 200 --latency-ms 80 --blocking
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from door_log_sender import CircuitBreaker, DoorLogSender, requests_post
+
+
+class StubBackend(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency, error_rate, down):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.down = down
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.events = 0
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(server.latency)
+        failed = server.down or random.random() < server.error_rate
+        if not failed and self.path == '/api/door-access/log':
+            payload = json.loads(body)
+            with server.lock:
+                server.requests += 1
+                server.events += len(payload['logs']) if 'logs' in payload else 1
+            status = 200
+        else:
+            status = 503 if failed else 404
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def run_blocking(url, events, interval):
+    """Old behaviour: the caller waits for its own POST"""
+    session = requests.Session()
+    fallback = 0
+    blocked = []
+    for event in events:
+        started = time.perf_counter()
+        try:
+            if session.post(url, json=event, timeout=5).status_code != 200:
+                fallback += 1
+        except Exception:
+            fallback += 1
+        blocked.append((time.perf_counter() - started) * 1000.0)
+        time.sleep(interval)
+    return blocked, fallback, None
+
+
+def run_sender(url, events, interval, args):
+    fallback = []
+    sender = DoorLogSender(
+        url, requests_post(requests.Session()), fallback.append,
+        batch_size=args.batch_size, flush_interval=args.flush_interval, timeout=args.timeout,
+        max_attempts=args.max_attempts, backoff_base=args.backoff,
+        breaker=CircuitBreaker(args.breaker_threshold, args.breaker_reset),
+    )
+    blocked = []
+    for event in events:
+        started = time.perf_counter()
+        sender.submit(event)
+        blocked.append((time.perf_counter() - started) * 1000.0)
+        time.sleep(interval)
+    drain_started = time.perf_counter()
+    sender.close(timeout=60)
+    stats = sender.stats()
+    stats['drain_ms'] = (time.perf_counter() - drain_started) * 1000.0
+    return blocked, len(fallback), stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=300)
+    parser.add_argument('--rate', type=float, default=50.0, help='events submitted per second')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='stub latency per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered 503')
+    parser.add_argument('--down', action='store_true', help='stub fails every request')
+    parser.add_argument('--blocking', action='store_true', help='measure the old synchronous POST path')
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--flush-interval', type=float, default=0.5)
+    parser.add_argument('--timeout', type=float, default=2.0)
+    parser.add_argument('--max-attempts', type=int, default=3)
+    parser.add_argument('--backoff', type=float, default=0.1)
+    parser.add_argument('--breaker-threshold', type=int, default=3)
+    parser.add_argument('--breaker-reset', type=float, default=2.0)
+    args = parser.parse_args()
+
+    server = StubBackend(args.latency_ms / 1000.0, args.error_rate, args.down)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/door-access/log"
+
+    events = [{
+        'user_id': f"bench-{i:05d}",
+        'access_type': 'face_recognition',
+        'access_status': 'granted',
+        'confidence_score': 0.9,
+        'reason': None,
+        'session_id': None,
+        'accessed_at': datetime.now().isoformat(),
+    } for i in range(args.events)]
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+
+    mode = 'blocking POST' if args.blocking else f"sender, batch {args.batch_size}"
+    print(f"Stub: {args.latency_ms} ms latency, {'down' if args.down else f'{args.error_rate:.0%} errors'}; "
+          f"{args.events} events at {args.rate}/s; {mode}")
+
+    started = time.perf_counter()
+    if args.blocking:
+        blocked, fallback, stats = run_blocking(url, events, interval)
+    else:
+        blocked, fallback, stats = run_sender(url, events, interval, args)
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    p95 = sorted(blocked)[max(0, int(len(blocked) * 0.95) - 1)]
+    print(f"caller blocked: p50 {statistics.median(blocked):.3f} ms, p95 {p95:.3f} ms, max {max(blocked):.3f} ms")
+    print(f"delivered to stub: {server.events} events in {server.requests} requests; "
+          f"DB fallback: {fallback}; total {elapsed:.2f} s")
+    if stats:
+        print(f"retries {stats['retries']}, breaker trips {stats['breaker_trips']} "
+              f"(final state {stats['breaker_state']}), avg post {stats['avg_post_ms']:.1f} ms, "
+              f"drain at close {stats['drain_ms']:.1f} ms")
+    lost = args.events - server.events - fallback
+    if lost:
+        raise SystemExit(f"{lost} events neither delivered nor handed to the fallback")
+
+
+if __name__ == "__main__":
+    main()
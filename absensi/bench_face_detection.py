@@ -0,0 +1,77 @@
+"""
+Benchmark: Haar detection time vs. recall at different detection scales
+
+Runs detect_scaled() over a recorded clip for each combination of
+--scales, --scale-factors and --min-neighbors. Each row reports the mean
+and p95 detection time per frame (including the resize) and the recall
+against the reference setting (full resolution, scaleFactor 1.3,
+minNeighbors 5, the previous hard-coded values): the share of reference
+faces found by a mapped-back box with IoU >= --iou. "extra" counts boxes
+the reference did not have.
+
+Usage:
+    python bench_face_detection.py door.avi
+    python bench_face_detection.py door.avi --scales 1 0.5 0.33 --scale-factors 1.1 1.3 --min-size 60
+"""
+import argparse
+import itertools
+import statistics
+import time
+
+import cv2
+
+from bench_face_tracking import iou, load_frames
+from face_tracker import detect_scaled
+
+
+def run(cascade, grays, scale, scale_factor, min_neighbors, min_size):
+    boxes, timings = [], []
+    for gray in grays:
+        started = time.perf_counter()
+        boxes.append(detect_scaled(cascade, gray, scale, scale_factor, min_neighbors, min_size))
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return boxes, timings
+
+
+def compare(reference, boxes, threshold):
+    expected = matched = extra = 0
+    for truth, found in zip(reference, boxes):
+        expected += len(truth)
+        matched += sum(1 for t in truth if any(iou(t, b) >= threshold for b in found))
+        extra += sum(1 for b in found if not any(iou(t, b) >= threshold for t in truth))
+    return (matched / expected if expected else 1.0), extra
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', help='recorded video file')
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--scales', type=float, nargs='+', default=[1.0, 0.75, 0.5, 0.33, 0.25])
+    parser.add_argument('--scale-factors', type=float, nargs='+', default=[1.3])
+    parser.add_argument('--min-neighbors', type=int, nargs='+', default=[5])
+    parser.add_argument('--min-size', type=int, default=0, help='smallest face in full-resolution pixels')
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--cascade', default=cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    args = parser.parse_args()
+
+    cascade = cv2.CascadeClassifier(args.cascade)
+    if cascade.empty():
+        raise SystemExit(f"Cannot load cascade {args.cascade}")
+    grays = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in load_frames(args.video, args.frames)]
+
+    reference, ref_times = run(cascade, grays, 1.0, 1.3, 5, 0)
+    ref_ms = statistics.mean(ref_times)
+    print(f"{len(grays)} frames, {sum(len(b) for b in reference)} reference faces, "
+          f"reference {ref_ms:.2f} ms/frame")
+    print(f"{'scale':>6} {'factor':>7} {'neigh':>6} {'mean ms':>8} {'p95 ms':>8} {'speedup':>8} {'recall':>7} {'extra':>6}")
+    for scale, scale_factor, min_neighbors in itertools.product(args.scales, args.scale_factors, args.min_neighbors):
+        boxes, timings = run(cascade, grays, scale, scale_factor, min_neighbors, args.min_size)
+        recall, extra = compare(reference, boxes, args.iou)
+        mean = statistics.mean(timings)
+        p95 = sorted(timings)[max(0, int(len(timings) * 0.95) - 1)]
+        print(f"{scale:>6.2f} {scale_factor:>7.2f} {min_neighbors:>6} {mean:>8.2f} {p95:>8.2f} "
+              f"{ref_ms / mean:>7.2f}x {recall:>7.3f} {extra:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark: detect-every-frame vs. detect-once-then-track on a recorded video
+
+Runs Haar detection on every frame as the baseline, then FaceTracker with
+each requested tracker and detection interval. Reports localisation FPS
+(grayscale conversion + detection/tracking, no recognition) and recall:
+the share of baseline detections matched by a tracked box with IoU >=
+--iou. Precision shows how many tracked boxes had a baseline detection.
+"matches" is how many gallery matches TrackIdentities would request for
+the tracked faces (every face is matched in the baseline).
+
+Record a clip with --record (from camera 0) or pass any video file.
+
+Usage:
+    python bench_face_tracking.py --record door.avi --seconds 20
+    python bench_face_tracking.py door.avi --every 3 5 10 --trackers template flow kcf
+"""
+import argparse
+import time
+
+import cv2
+
+from face_tracker import FaceTracker, TRACKERS
+from track_identity import TrackIdentities
+
+
+def record(path, seconds, camera=0):
+    cap = cv2.VideoCapture(camera)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open camera {camera}")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (640, 480))
+    end = time.time() + seconds
+    frames = 0
+    while time.time() < end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        writer.write(cv2.resize(frame, (640, 480)))
+        frames += 1
+    writer.release()
+    cap.release()
+    print(f"Recorded {frames} frames to {path}")
+
+
+def load_frames(path, limit):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        # Same preprocessing as the camera capture stage
+        frames.append(cv2.resize(frame, (640, 480)))
+    cap.release()
+    if not frames:
+        raise SystemExit(f"No frames read from {path}")
+    return frames
+
+
+def iou(a, b):
+    left, top = max(a[0], b[0]), max(a[1], b[1])
+    right, bottom = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def run(frames, locate):
+    """Per-frame boxes and frames per second for locate(frame, gray)"""
+    results = []
+    started = time.perf_counter()
+    for frame in frames:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        results.append(locate(frame, gray))
+    return results, len(frames) / (time.perf_counter() - started)
+
+
+def count_matches(frames, face_tracker):
+    """Gallery matches the identity cache asks for over the clip"""
+    identities = TrackIdentities()
+    face_tracker.reset()
+    for frame in frames:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        boxes, track_ids = face_tracker.locate_tracked(frame, gray)
+        identities.resolve(track_ids, boxes, lambda index: None)
+    return identities.matches
+
+
+def score(baseline, tracked, threshold):
+    expected = matched = produced = correct = 0
+    for truth, boxes in zip(baseline, tracked):
+        expected += len(truth)
+        produced += len(boxes)
+        matched += sum(1 for t in truth if any(iou(t, b) >= threshold for b in boxes))
+        correct += sum(1 for b in boxes if any(iou(t, b) >= threshold for t in truth))
+    recall = matched / expected if expected else 1.0
+    precision = correct / produced if produced else 1.0
+    return recall, precision
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', nargs='?', help='recorded video file')
+    parser.add_argument('--record', metavar='PATH', help='record a clip from the camera first')
+    parser.add_argument('--seconds', type=float, default=20.0)
+    parser.add_argument('--frames', type=int, default=900, help='max frames to use')
+    parser.add_argument('--every', type=int, nargs='+', default=[3, 5, 10])
+    parser.add_argument('--trackers', nargs='+', default=['template', 'flow', 'kcf'], choices=TRACKERS)
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--cascade', default=cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record, args.seconds)
+    path = args.video or args.record
+    if not path:
+        parser.error('give a video file or --record PATH')
+
+    cascade = cv2.CascadeClassifier(args.cascade)
+    if cascade.empty():
+        raise SystemExit(f"Cannot load cascade {args.cascade}")
+
+    def detect(gray):
+        # Full-resolution detection with the original 1.3 / 5 settings
+        return [(x, y, x + w, y + h) for (x, y, w, h) in cascade.detectMultiScale(gray, 1.3, 5)]
+
+    frames = load_frames(path, args.frames)
+    baseline, base_fps = run(frames, lambda frame, gray: detect(gray))
+    faces = sum(len(boxes) for boxes in baseline)
+    print(f"{len(frames)} frames, {faces} baseline detections")
+    print(f"{'mode':>18} {'fps':>8} {'speedup':>8} {'recall':>7} {'precision':>9} {'detects':>8} {'matches':>8}")
+    print(f"{'every frame':>18} {base_fps:>8.1f} {1.0:>7.2f}x {1.0:>7.3f} {1.0:>9.3f} {len(frames):>8} {faces:>8}")
+    for tracker in args.trackers:
+        for every in args.every:
+            face_tracker = FaceTracker(detect, every=every, tracker=tracker)
+            if face_tracker.tracker != tracker:
+                break
+            tracked, fps = run(frames, face_tracker.locate)
+            recall, precision = score(baseline, tracked, args.iou)
+            detections = face_tracker.detections
+            matches = count_matches(frames, face_tracker)
+            print(f"{f'{tracker}, K={every}':>18} {fps:>8.1f} {fps / base_fps:>7.2f}x "
+                  f"{recall:>7.3f} {precision:>9.3f} {detections:>8} {matches:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark: per-frame memory allocation in the camera hot loop, before and after buffer reuse
+
+Replays a recorded clip through the per-frame work of the camera pipeline
+(camera read + resize, motion gate, grayscale + scaled Haar detection, the
+200x200 recognition crop, and the display copy, RGB conversion and Tk
+image) twice: the legacy path that allocates new arrays for every step,
+and the buffered path that writes into reused arrays via OpenCV dst=
+parameters and updates one PhotoImage with paste(). Under tracemalloc
+(numpy registers its array memory with it) each frame reports the peak
+bytes allocated above the level before the frame; "retained" is what is
+still allocated after it. ms/frame is measured in a separate run without
+tracemalloc.
+
+The Tk part only runs when a display is available (use --no-tk to skip it).
+Haar detection itself still returns a small array of boxes per frame.
+
+Usage:
+    python bench_frame_allocations.py door.avi
+    python bench_frame_allocations.py door.avi --frames 300 --detect-scale 0.5 --no-tk
+"""
+import argparse
+import statistics
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from bench_face_tracking import load_frames
+from face_tracker import detect_scaled, scaled_size
+from motion_gate import MotionGate
+
+
+def legacy_step(state, raw):
+    """Per-frame work as the camera loop did it: a new array at every step"""
+    frame = cv2.resize(raw.copy(), (640, 480))
+    small = cv2.cvtColor(cv2.resize(frame, (160, 120), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    small = cv2.GaussianBlur(small, (5, 5), 0)
+    if state.get('previous') is not None:
+        _, mask = cv2.threshold(cv2.absdiff(small, state['previous']), 25, 255, cv2.THRESH_BINARY)
+        cv2.countNonZero(mask)
+    state['previous'] = small
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    boxes = detect_scaled(state['cascade'], gray, state['scale'])
+    for left, top, right, bottom in boxes:
+        cv2.resize(gray[top:bottom, left:right], (200, 200))
+    shown = frame.copy()
+    for left, top, right, bottom in boxes:
+        cv2.rectangle(shown, (left, top), (right, bottom), (0, 255, 0), 2)
+    image = state['Image'].fromarray(cv2.cvtColor(shown, cv2.COLOR_BGR2RGB))
+    if state.get('tk') is not None:
+        state['photo'] = state['ImageTk'].PhotoImage(image)
+
+
+def buffered_step(state, raw):
+    """The same work writing into arrays kept in `state` between frames"""
+    if 'raw' not in state:
+        state['raw'] = np.empty_like(raw)
+        state['frame'] = np.empty((480, 640, 3), np.uint8)
+        state['gray'] = np.empty((480, 640), np.uint8)
+        width, height = scaled_size(state['gray'].shape, state['scale'])
+        state['small'] = np.empty((height, width), np.uint8)
+        state['face'] = np.empty((200, 200), np.uint8)
+        state['shown'] = np.empty((480, 640, 3), np.uint8)
+        # RGBA: PIL only shares the memory of 4-byte-per-pixel buffers
+        state['rgba'] = np.empty((480, 640, 4), np.uint8)
+        state['image'] = state['Image'].frombuffer('RGBA', (640, 480), state['rgba'], 'raw', 'RGBA', 0, 1)
+        state['gate'] = MotionGate()
+        if state.get('tk') is not None:
+            state['photo'] = state['ImageTk'].PhotoImage(state['image'])
+    np.copyto(state['raw'], raw)   # camera.read(buffer)
+    frame = cv2.resize(state['raw'], (640, 480), dst=state['frame'])
+    state['gate'].update(frame)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=state['gray'])
+    boxes = detect_scaled(state['cascade'], gray, state['scale'], buffer=state['small'])
+    for left, top, right, bottom in boxes:
+        cv2.resize(gray[top:bottom, left:right], (200, 200), dst=state['face'])
+    shown = state['shown']
+    np.copyto(shown, frame)
+    for left, top, right, bottom in boxes:
+        cv2.rectangle(shown, (left, top), (right, bottom), (0, 255, 0), 2)
+    cv2.cvtColor(shown, cv2.COLOR_BGR2RGBA, dst=state['rgba'])
+    if state.get('tk') is not None:
+        state['photo'].paste(state['image'])
+
+
+def measure(step, state, frames):
+    """(peak bytes per frame, retained bytes per frame) under tracemalloc, first frame excluded"""
+    peaks, retained = [], []
+    step(state, frames[0])   # warm-up: buffers are allocated once here
+    tracemalloc.start()
+    for raw in frames[1:]:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        step(state, raw)
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+        retained.append(current - before)
+    tracemalloc.stop()
+    return peaks, retained
+
+
+def timed(step, state, frames):
+    step(state, frames[0])
+    started = time.perf_counter()
+    for raw in frames[1:]:
+        step(state, raw)
+    return (time.perf_counter() - started) * 1000.0 / max(1, len(frames) - 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', help='recorded video file')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--detect-scale', type=float, default=0.5)
+    parser.add_argument('--no-tk', action='store_true', help='skip the PhotoImage part')
+    parser.add_argument('--cascade', default=cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    args = parser.parse_args()
+
+    cascade = cv2.CascadeClassifier(args.cascade)
+    if cascade.empty():
+        raise SystemExit(f"Cannot load cascade {args.cascade}")
+    frames = load_frames(args.video, args.frames)
+
+    from PIL import Image, ImageTk
+    tk_root = None
+    if not args.no_tk:
+        try:
+            import tkinter
+            tk_root = tkinter.Tk()
+            tk_root.withdraw()
+        except Exception as e:
+            print(f"No Tk display ({e}), skipping PhotoImage")
+
+    print(f"{len(frames)} frames, detect scale {args.detect_scale}, "
+          f"Tk {'on' if tk_root is not None else 'off'}")
+    print(f"{'path':>9} {'peak KiB/frame':>15} {'max KiB':>9} {'retained B':>11} {'ms/frame':>9}")
+    for name, step in (('legacy', legacy_step), ('buffered', buffered_step)):
+        def fresh():
+            return {'cascade': cascade, 'scale': args.detect_scale, 'tk': tk_root,
+                    'Image': Image, 'ImageTk': ImageTk}
+        peaks, retained = measure(step, fresh(), frames)
+        ms = timed(step, fresh(), frames)
+        print(f"{name:>9} {statistics.mean(peaks) / 1024:>15.1f} {max(peaks) / 1024:>9.1f} "
+              f"{statistics.mean(retained):>11.0f} {ms:>9.2f}")
+    if tk_root is not None:
+        tk_root.destroy()
+
+
+if __name__ == "__main__":
+    main()
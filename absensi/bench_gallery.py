@@ -0,0 +1,101 @@
+"""
+Benchmark: per-face recognition latency vs. number of enrolled employees
+
+Compares the shared FaceGallery matcher against the previous approach of
+calling predict() on one LBPHFaceRecognizer per employee.
+
+Usage:
+    python bench_gallery.py
+    python bench_gallery.py --sizes 10 100 1000 5000 --samples 1 --repeat 20
+"""
+import argparse
+import time
+
+import numpy as np
+
+from face_gallery import FaceGallery, lbph_histogram, LBPH_GRID_X, LBPH_GRID_Y, LBPH_NEIGHBORS
+
+
+def random_face(rng):
+    """Smooth random 200x200 grey image so LBP codes are not pure noise"""
+    import cv2
+    img = rng.integers(0, 256, (200, 200), dtype=np.uint8)
+    return cv2.GaussianBlur(img, (7, 7), 0)
+
+
+def synthetic_histograms(rng, count):
+    """Per-cell normalised random histograms with the LBPH feature layout"""
+    cells = LBPH_GRID_X * LBPH_GRID_Y
+    bins = 2 ** LBPH_NEIGHBORS
+    hists = rng.random((count, cells, bins), dtype=np.float32) ** 4
+    hists /= hists.sum(axis=2, keepdims=True)
+    return hists.reshape(count, cells * bins)
+
+
+def time_per_face(fn, probes, repeat):
+    fn(probes[0])  # warm-up
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(probes[i % len(probes)])
+    return (time.perf_counter() - start) * 1000.0 / repeat
+
+
+def bench_gallery(rng, employees, samples, probes, repeat, metric='chisqr_alt'):
+    gallery = FaceGallery(metric=metric)
+    for eid in range(employees):
+        gallery.add(f"emp{eid}", f"Employee {eid}", synthetic_histograms(rng, samples))
+    return time_per_face(gallery.match, probes, repeat)
+
+
+def bench_legacy(rng, employees, samples, probes, repeat):
+    import cv2
+    recognizers = []
+    for eid in range(employees):
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.train([random_face(rng) for _ in range(samples)], np.full(samples, eid, dtype=np.int32))
+        recognizers.append(recognizer)
+
+    def predict_all(face):
+        best = float('inf')
+        for recognizer in recognizers:
+            _, raw_conf = recognizer.predict(face)
+            best = min(best, raw_conf)
+        return best
+
+    return time_per_face(predict_all, probes, max(1, repeat // 4))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--samples', type=int, default=1, help='enrolled samples per employee')
+    parser.add_argument('--repeat', type=int, default=20, help='probe faces timed per size')
+    parser.add_argument('--metric', default='chisqr_alt', help='gallery distance metric')
+    parser.add_argument('--legacy-max', type=int, default=1000,
+                        help='largest size for the per-recognizer baseline (0 disables it)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    try:
+        probes = [random_face(rng) for _ in range(8)]
+    except ImportError:
+        print("OpenCV is required to generate probe faces")
+        return
+
+    start = time.perf_counter()
+    lbph_histogram(probes[0])
+    print(f"Probe histogram extraction: {(time.perf_counter() - start) * 1000.0:.2f} ms")
+    print(f"{'employees':>10} {'samples':>8} {'gallery ms/face':>16} {'per-model ms/face':>18}")
+    for size in args.sizes:
+        gallery_ms = bench_gallery(rng, size, args.samples, probes, args.repeat, args.metric)
+        legacy = '-'
+        if size <= args.legacy_max:
+            try:
+                legacy = f"{bench_legacy(rng, size, args.samples, probes, args.repeat):.2f}"
+            except (ImportError, AttributeError):
+                legacy = 'n/a'
+        print(f"{size:>10} {args.samples:>8} {gallery_ms:>16.2f} {legacy:>18}")
+
+
+if __name__ == "__main__":
+    main()
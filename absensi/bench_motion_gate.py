@@ -0,0 +1,121 @@
+"""
+Benchmark: motion-gated detection with idle throttling vs. detecting every frame
+
+Replays a recorded clip in real time (--fps) twice: once running Haar
+detection on every frame, once through MotionGate (quiet frames skip
+detection; after --idle-after seconds of quiet only --idle-fps frames are
+looked at until motion wakes it). Reports process CPU use over the replay,
+average per-frame processing time, how many frames ran detection, and the
+wake latency: for each face arrival in the baseline (first detection after
+at least a second without one), how long until the gated run detected it.
+
+Footage should include empty-corridor stretches; record some with
+bench_face_tracking.py --record.
+
+Usage:
+    python bench_motion_gate.py corridor.avi
+    python bench_motion_gate.py corridor.avi --idle-after 5 --idle-fps 1 --min-changed 0.01
+"""
+import argparse
+import statistics
+import time
+
+import cv2
+
+from bench_face_tracking import load_frames
+from motion_gate import MotionGate
+
+
+def replay(frames, fps, process):
+    """Call process(index, frame, now) for frames in real time; returns (cpu %, per-frame ms, results)"""
+    interval = 1.0 / fps
+    results, timings = [], []
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for index, frame in enumerate(frames):
+        due = started + index * interval
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.perf_counter()
+        result = process(index, frame, now)
+        if result is not None:
+            timings.append((time.perf_counter() - now) * 1000.0)
+        results.append(result)
+    wall = time.perf_counter() - started
+    cpu = (time.process_time() - cpu_started) / wall * 100.0
+    return cpu, statistics.mean(timings) if timings else 0.0, results
+
+
+def arrivals(found, fps):
+    """Frame indexes where a face shows up after at least a second without one"""
+    gap = int(fps)
+    events, last = [], -gap - 1
+    for index, present in enumerate(found):
+        if present:
+            if index - last > gap:
+                events.append(index)
+            last = index
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', help='recorded video file')
+    parser.add_argument('--fps', type=float, default=30.0, help='replay rate (camera frame rate)')
+    parser.add_argument('--frames', type=int, default=3000)
+    parser.add_argument('--pixel-threshold', type=int, default=25)
+    parser.add_argument('--min-changed', type=float, default=0.005)
+    parser.add_argument('--scale-width', type=int, default=160)
+    parser.add_argument('--idle-after', type=float, default=10.0)
+    parser.add_argument('--idle-fps', type=float, default=2.0)
+    parser.add_argument('--cascade', default=cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    args = parser.parse_args()
+
+    cascade = cv2.CascadeClassifier(args.cascade)
+    if cascade.empty():
+        raise SystemExit(f"Cannot load cascade {args.cascade}")
+    frames = load_frames(args.video, args.frames)
+
+    def detect(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return len(cascade.detectMultiScale(gray, 1.3, 5)) > 0
+
+    base_cpu, base_ms, base_found = replay(frames, args.fps, lambda index, frame, now: detect(frame))
+
+    gate = MotionGate(args.pixel_threshold, args.min_changed, args.scale_width, args.idle_after, args.idle_fps)
+    state = {'faces': False, 'next_idle': 0.0, 'detections': 0}
+
+    def gated(index, frame, now):
+        if gate.idle(now):
+            if now < state['next_idle']:
+                return None   # grabbed, not decoded
+            state['next_idle'] = now + 1.0 / args.idle_fps
+        if not gate.update(frame, now) and not state['faces']:
+            return False
+        state['detections'] += 1
+        state['faces'] = detect(frame)
+        return state['faces']
+
+    gate.reset()
+    gate_cpu, gate_ms, gate_found = replay(frames, args.fps, gated)
+    gate_found = [bool(found) for found in gate_found]
+
+    latencies = []
+    for start in arrivals(base_found, args.fps):
+        hit = next((i for i in range(start, len(frames)) if gate_found[i]), None)
+        latencies.append((hit - start) / args.fps * 1000.0 if hit is not None else float('inf'))
+
+    seconds = len(frames) / args.fps
+    print(f"{len(frames)} frames ({seconds:.1f} s at {args.fps} fps), "
+          f"{sum(base_found)} with a face, {len(latencies)} arrivals")
+    print(f"{'mode':>12} {'cpu %':>7} {'ms/frame':>9} {'detections':>11}")
+    print(f"{'every frame':>12} {base_cpu:>7.1f} {base_ms:>9.2f} {len(frames):>11}")
+    print(f"{'gated':>12} {gate_cpu:>7.1f} {gate_ms:>9.2f} {state['detections']:>11}")
+    if latencies:
+        shown = ', '.join('missed' if latency == float('inf') else f"{latency:.0f}" for latency in latencies)
+        print(f"wake latency per arrival (ms): {shown}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Benchmark: end-to-end BackendAPI.record_attendance latency, before/after upserts
+
+Compares the transactional check-then-insert path (used while the unique key
+from backend/migrations/add-attendance-unique-key.js is missing) with the
+lookup + single INSERT path, for first-time check-ins and for repeats.
+
+By default a stand-in connection answers the handful of statements involved,
+counts round trips (statements, START TRANSACTION, COMMIT, ROLLBACK, PING)
+and sleeps --rtt-ms for each one, so the numbers show what the round trips
+cost on a given network. --mysql runs against the server configured in .env
+instead; it needs --class-id of an existing class and deletes the bench-*
+attendance rows it created afterwards.
+
+Usage:
+    python bench_record_attendance.py --checkins 200 --rtt-ms 1.5
+    python bench_record_attendance.py --mysql --class-id 15 --checkins 100
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+
+class _StandInCursor:
+    def __init__(self, conn, dictionary=False):
+        self._conn = conn
+        self._rows = []
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, query, params=None):
+        self._conn.round_trip()
+        self._rows, self.rowcount, self.lastrowid = self._conn.server.run(' '.join(query.split()), params or ())
+        if not query.strip().upper().startswith('SELECT'):
+            self._conn.in_transaction = self._conn.in_transaction or not self._conn.autocommit
+
+    def executemany(self, query, rows):
+        for row in rows:
+            self.execute(query, row)
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class StandInServer:
+    """Minimal state for the statements record_attendance issues"""
+
+    def __init__(self, unique_key):
+        from mysql.connector import errors
+        self._errors = errors
+        self.unique_key = unique_key
+        self.attendance = {}   # (session_id, student_id) -> check_in_time
+        self.next_id = 1
+
+    def run(self, query, params):
+        if 'information_schema.STATISTICS' in query:
+            rows = [{'TABLE_NAME': 'student_attendances', 'cols': 'session_id,student_id'}] if self.unique_key else []
+            return rows, len(rows), None
+        if query.startswith('SELECT id FROM attendance_sessions'):
+            return [{'id': 1}], 1, None
+        if query.startswith('SELECT sa.id, sa.check_in_time'):
+            student_id = params[0]
+            check_in = self.attendance.get((1, student_id))
+            rows = [{'id': 1, 'check_in_time': check_in, 'class_name': 'A', 'course_name': 'Bench'}] if check_in else []
+            return rows, len(rows), None
+        if query.startswith('INSERT INTO student_attendances'):
+            key = (params[0], params[1])
+            if self.unique_key and key in self.attendance:
+                raise self._errors.IntegrityError(msg="Duplicate entry", errno=1062)
+            self.attendance[key] = params[3]
+            self.next_id += 1
+            return [], 1, self.next_id
+        # Log inserts and anything else: accept
+        return [], 1, None
+
+
+class StandInConnection:
+    def __init__(self, server, rtt):
+        self.server = server
+        self.rtt = rtt
+        self.autocommit = True
+        self.in_transaction = False
+        self.round_trips = 0
+
+    def round_trip(self):
+        self.round_trips += 1
+        StandInConnection.total_round_trips += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    def is_connected(self):
+        return True
+
+    def ping(self, **kwargs):
+        self.round_trip()
+
+    def cursor(self, dictionary=False, buffered=True):
+        return _StandInCursor(self, dictionary)
+
+    def start_transaction(self, **kwargs):
+        self.round_trip()
+        self.in_transaction = True
+
+    def commit(self):
+        self.round_trip()
+        self.in_transaction = False
+
+    def rollback(self):
+        self.round_trip()
+        self.in_transaction = False
+
+    def close(self):
+        pass
+
+
+StandInConnection.total_round_trips = 0
+
+
+def measure(api, student_ids, class_id, count_round_trips):
+    """Latencies (ms) and round trips per call for one pass over student_ids"""
+    latencies, trips = [], []
+    quiet = io.StringIO()
+    for student_id in student_ids:
+        before = StandInConnection.total_round_trips
+        with contextlib.redirect_stdout(quiet):
+            started = time.perf_counter()
+            result = api.record_attendance(student_id, class_id, confidence_score=0.85)
+            latencies.append((time.perf_counter() - started) * 1000.0)
+        if not result or result.get('journaled'):
+            raise SystemExit(f"record_attendance did not reach the database: {result}")
+        if count_round_trips:
+            trips.append(StandInConnection.total_round_trips - before)
+    return latencies, trips
+
+
+def summarize(label, latencies, trips):
+    p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    trips_text = f"{statistics.mean(trips):>6.1f}" if trips else f"{'-':>6}"
+    print(f"{label:>28} {statistics.median(latencies):>9.2f} {p95:>9.2f} {trips_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkins', type=int, default=200, help='distinct students per pass')
+    parser.add_argument('--rtt-ms', type=float, default=1.0, help='simulated round-trip time (stand-in only)')
+    parser.add_argument('--mysql', action='store_true', help='use the MySQL server configured in .env')
+    parser.add_argument('--class-id', type=int, default=15, help='existing course_classes.id (--mysql)')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench_attendance_')
+    os.environ['ATTENDANCE_JOURNAL_PATH'] = os.path.join(tmpdir, 'journal.db')
+
+    from simple_database import ConnectionPool, simple_db
+    from backend_api import backend_api
+    from log_writer import log_writer
+
+    if not args.mysql:
+        # Keep background log flushes off the stand-in so round-trip counts stay per call
+        log_writer._writer = lambda query, rows: len(rows)
+
+    runs = [('check-then-insert', False), ('lookup + INSERT', True)]
+    stamp = datetime.now().strftime('%H%M%S')
+    available = None
+    print(f"Backend: {'MySQL' if args.mysql else f'stand-in, {args.rtt_ms} ms RTT'}, "
+          f"{args.checkins} students per pass")
+    print(f"{'path':>28} {'p50 ms':>9} {'p95 ms':>9} {'trips':>6}")
+    try:
+        for label, unique_key in runs:
+            if args.mysql:
+                if available is None:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        available = backend_api._attendance_unique_keys()
+                if unique_key and not available:
+                    print(f"{label:>28} skipped: unique key not present (run the migration)")
+                    continue
+            else:
+                server = StandInServer(unique_key)
+                simple_db.pool = ConnectionPool(lambda: StandInConnection(server, args.rtt_ms / 1000.0))
+            backend_api._unique_keys = unique_key
+
+            students = [f"bench-{stamp}-{int(unique_key)}-{i:04d}" for i in range(args.checkins)]
+            first, first_trips = measure(backend_api, students, args.class_id, not args.mysql)
+            repeat, repeat_trips = measure(backend_api, students, args.class_id, not args.mysql)
+            summarize(f"{label}, first", first, first_trips)
+            summarize(f"{label}, repeat", repeat, repeat_trips)
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            log_writer.close()
+            if args.mysql:
+                simple_db.execute_query("DELETE FROM face_recognition_logs WHERE recognized_user_id LIKE %s", (f"bench-{stamp}-%",))
+                simple_db.execute_query("DELETE FROM student_attendances WHERE student_id LIKE %s", (f"bench-{stamp}-%",))
+        simple_db.close()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
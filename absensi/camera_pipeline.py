@@ -0,0 +1,441 @@
+"""
+Staged camera pipeline: capture -> detect -> recognize -> decide, plus display
+Each stage runs on its own thread so a slow recognition no longer stalls frame
+grabbing:
+
+    capture    reads the camera as fast as it delivers; only the latest frame is kept
+    detect     takes the newest captured frame, finds faces
+    recognize  matches the detected faces (bounded queue from detect)
+    decide     hands recognized people to the access/attendance logic (bounded queue)
+    display    draws the latest faces on the latest frame, at most display_fps,
+               shrunk to display_width; paused while show_display(False)
+
+Queues between stages hold a few items and drop the oldest when full, so
+work never piles up behind a slow stage. Frame-sized arrays are reused
+rather than allocated per frame: capture fills the back buffer of a
+FrameSlot, detect and display copy the front into their own buffers, and
+the grey frames handed to recognize come from a free list: a grey buffer
+goes back on it only once recognize is done with it or the queue dropped
+it, so detect never overwrites a frame that is still being matched. With a MotionGate, detection is
+skipped for quiet frames while no face is on screen, and after a quiet
+period capture only hands on gate.idle_fps frames per second (the frames
+in between are grabbed without decoding, so the next one is still fresh).
+With a QualityGovernor, detect and recognize times are reported to it, and
+its current level sets how often recognition runs (recognize_every) and the
+display resolution (display_scale). Every stage keeps StageMetrics
+(throughput over a sliding window, processing latency, frame age, drops).
+"""
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from env_config import env_number
+
+STAGES = ('capture', 'detect', 'recognize', 'decide', 'display')
+
+
+class LatestSlot:
+    """Single-item channel: put() overwrites, peek() returns the newest item"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._item = None
+
+    def put(self, item):
+        with self._lock:
+            self._item = item
+
+    def peek(self):
+        with self._lock:
+            return self._item
+
+
+class FrameSlot:
+    """Latest camera frame, double-buffered so frame arrays are reused
+
+    The producer fills back_buffer() and publish()es it; the previous front
+    becomes the next back buffer. Consumers copy the front into their own
+    buffer while holding the lock, so the producer never overwrites a frame
+    that is still being copied.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._front = None
+        self._back = None
+        self._stamp = None
+        self._seq = 0
+        self._taken = 0
+        self.overwritten = 0
+
+    def back_buffer(self):
+        """Array the producer may overwrite (None until two frames were published)"""
+        return self._back
+
+    def publish(self, frame, stamp):
+        with self._cond:
+            if self._seq > self._taken:
+                self.overwritten += 1
+            self._back = self._front if self._front is not frame else None
+            self._front = frame
+            self._stamp = stamp
+            self._seq += 1
+            self._cond.notify_all()
+
+    def copy_newer(self, seen, timeout, dst=None, scale=1.0, max_width=0):
+        """(seq, frame, stamp) once a frame newer than `seen` exists, else (seen, None, None)
+
+        The frame is copied (or resized by `scale`, and further to at most
+        max_width pixels wide) into dst when dst has the right shape;
+        otherwise a new array is returned for the caller to keep.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > seen, timeout):
+                return seen, None, None
+            self._taken = max(self._taken, self._seq)
+            front = self._front
+            height, width = front.shape[:2]
+            if 0 < max_width < width * scale:
+                scale = max_width / width
+            if scale < 1.0:
+                size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+                if dst is not None and dst.shape != (size[1], size[0]) + front.shape[2:]:
+                    dst = None
+                dst = cv2.resize(front, size, dst=dst, interpolation=cv2.INTER_AREA)
+            else:
+                if dst is None or dst.shape != front.shape or dst.dtype != front.dtype:
+                    dst = np.empty_like(front)
+                np.copyto(dst, front)
+            return self._seq, dst, self._stamp
+
+
+class BoundedQueue:
+    """Small FIFO that drops its oldest item instead of blocking the producer
+
+    on_drop(item), if given, is called for every dropped item (outside the lock).
+    """
+
+    def __init__(self, maxsize, on_drop=None):
+        self.maxsize = max(1, int(maxsize))
+        self._on_drop = on_drop
+        self._cond = threading.Condition()
+        self._items = deque()
+        self.dropped = 0
+
+    def put(self, item):
+        dropped = None
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+        if dropped is not None and self._on_drop is not None:
+            self._on_drop(dropped)
+
+    def get(self, timeout):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout):
+                return None
+            return self._items.popleft()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class StageMetrics:
+    """Per-stage counters; throughput is measured over the last `window` seconds"""
+
+    def __init__(self, name, window=5.0):
+        self.name = name
+        self.window = window
+        self._created = time.perf_counter()
+        self._lock = threading.Lock()
+        self._finished = deque()
+        self.items = 0
+        self.errors = 0
+        self.busy_total = 0.0
+        self.latency_max = 0.0
+        self.age_total = 0.0
+
+    def record(self, started, finished, captured_at=None):
+        with self._lock:
+            self.items += 1
+            latency = finished - started
+            self.busy_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if captured_at is not None:
+                self.age_total += finished - captured_at
+            self._finished.append(finished)
+            while self._finished and finished - self._finished[0] > self.window:
+                self._finished.popleft()
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    def stats(self, now=None):
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            while self._finished and now - self._finished[0] > self.window:
+                self._finished.popleft()
+            items = self.items
+            span = min(self.window, now - self._created)
+            return {
+                'items': items,
+                'errors': self.errors,
+                'fps': len(self._finished) / span if span > 0 else 0.0,
+                'avg_ms': (self.busy_total / items * 1000.0) if items else 0.0,
+                'max_ms': self.latency_max * 1000.0,
+                'avg_age_ms': (self.age_total / items * 1000.0) if items else 0.0,
+            }
+
+
+class CameraPipeline:
+    """Runs the stages on their own threads until stop() or until read_frame() returns None.
+
+    read_frame(out) -> frame or None, filling `out` when it is given;
+    detect(frame, gray) -> (gray, face_locations, track_ids), filling `gray` when given;
+    recognize(gray, face_locations, track_ids) -> recognized list (None for unknown);
+    decide(recognized) -> None; display(frame, face_locations, recognized) -> False if the
+    frame was skipped; the frame passed to display is the stage's own buffer and may be drawn on;
+    grab_frame() -> bool skips a frame without decoding it (used while idle).
+    """
+
+    def __init__(self, read_frame, detect, recognize, decide, display,
+                 queue_size=2, display_fps=30.0, on_stopped=None, gate=None, grab_frame=None,
+                 governor=None, display_width=0):
+        self._read_frame = read_frame
+        self._detect = detect
+        self._recognize = recognize
+        self._decide = decide
+        self._display = display
+        self._on_stopped = on_stopped
+        self._gate = gate
+        self._grab_frame = grab_frame
+        self._faces_present = False
+        self._governor = governor
+        self._recognize_count = 0
+        self.gated = 0
+        self.display_interval = 1.0 / display_fps if display_fps > 0 else 0.0
+        self.display_width = display_width
+        # Cleared while nobody can see the preview: the display stage then does no work
+        self._display_active = threading.Event()
+        self._display_active.set()
+
+        self._frames = FrameSlot()        # capture -> detect, display
+        self._detections = BoundedQueue(queue_size, on_drop=lambda item: self._release_gray(item[0]))   # detect -> recognize
+        # Grey buffers nobody is reading; detect takes one (or allocates), recognize returns it
+        self._free_grays = deque()
+        self._decisions = BoundedQueue(queue_size)    # recognize -> decide
+        self._faces = LatestSlot()        # recognize -> display overlay (boxes, recognized, frame width)
+        self.metrics = {stage: StageMetrics(stage) for stage in STAGES}
+        self._running = threading.Event()
+        self._threads = []
+
+    @property
+    def running(self):
+        return self._running.is_set()
+
+    def start(self):
+        self._running.set()
+        for stage in STAGES:
+            thread = threading.Thread(target=getattr(self, f"_{stage}_stage"), name=f"camera-{stage}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=1.0):
+        """Signal every stage and wait briefly for them to finish"""
+        self._running.clear()
+        current = threading.current_thread()
+        for thread in self._threads:
+            if thread is not current:
+                thread.join(timeout)
+
+    def show_display(self, active):
+        """Pause (False) or resume (True) the display stage, e.g. when its tab is hidden"""
+        if active:
+            self._display_active.set()
+        else:
+            self._display_active.clear()
+
+    def _release_gray(self, gray):
+        self._free_grays.append(gray)
+
+    def _take_gray(self):
+        try:
+            return self._free_grays.pop()
+        except IndexError:
+            return None
+
+    def _quality(self, key, default):
+        return self._governor.settings[key] if self._governor is not None else default
+
+    def _run_stage(self, stage, step):
+        """Call step() until stopped; errors are counted and the stage keeps going"""
+        metrics = self.metrics[stage]
+        while self._running.is_set():
+            try:
+                step(metrics)
+            except Exception as e:
+                metrics.error()
+                print(f"[CAMERA PIPELINE] {stage} error: {e}")
+                time.sleep(0.05)
+
+    def _wait_idle_frame(self, due):
+        """While idle, drop frames until the next idle frame is due"""
+        while self._running.is_set() and self._gate.idle():
+            remaining = due - time.perf_counter()
+            if remaining <= 0:
+                return
+            if self._grab_frame is None or not self._grab_frame():
+                time.sleep(min(remaining, 0.05))
+
+    def _capture_stage(self):
+        last_read = [0.0]
+
+        def step(metrics):
+            if self._gate is not None and self._gate.idle():
+                self._wait_idle_frame(last_read[0] + 1.0 / self._gate.idle_fps)
+            started = time.perf_counter()
+            last_read[0] = started
+            frame = self._read_frame(self._frames.back_buffer())
+            if frame is None:
+                print("[CAMERA PIPELINE] Camera returned no frame, stopping")
+                self._running.clear()
+                if self._on_stopped:
+                    self._on_stopped()
+                return
+            finished = time.perf_counter()
+            self._frames.publish(frame, finished)
+            metrics.record(started, finished)
+        self._run_stage('capture', step)
+
+    def _detect_stage(self):
+        seen = [0]
+        buffers = {'frame': None}
+
+        def step(metrics):
+            seen[0], frame, captured_at = self._frames.copy_newer(seen[0], 0.1, buffers['frame'])
+            if frame is None:
+                return
+            buffers['frame'] = frame
+            started = time.perf_counter()
+            # Nothing moved and nobody on screen: the result would be the same empty list
+            if self._gate is not None and not self._gate.update(frame) and not self._faces_present:
+                self.gated += 1
+                return
+            gray_buffer = self._take_gray()
+            try:
+                gray, face_locations, track_ids = self._detect(frame, gray_buffer)
+            except Exception:
+                if gray_buffer is not None:
+                    self._release_gray(gray_buffer)
+                raise
+            self._faces_present = bool(face_locations)
+            finished = time.perf_counter()
+            if self._governor is not None:
+                self._governor.observe('detect', (finished - started) * 1000.0)
+            self._detections.put((gray, face_locations, track_ids, captured_at))
+            metrics.record(started, finished, captured_at)
+        self._run_stage('detect', step)
+
+    def _recognize_stage(self):
+        def step(metrics):
+            item = self._detections.get(0.1)
+            if item is None:
+                return
+            gray, face_locations, track_ids, captured_at = item
+            started = time.perf_counter()
+            self._recognize_count += 1
+            try:
+                if face_locations and self._recognize_count % self._quality('recognize_every', 1):
+                    # Sampled out: keep showing the last results for the same faces
+                    previous = self._faces.peek()
+                    recognized = previous[1] if previous and len(previous[1]) == len(face_locations) else [None] * len(face_locations)
+                    self._faces.put((face_locations, recognized, gray.shape[1]))
+                    return
+                recognized = self._recognize(gray, face_locations, track_ids) if face_locations else []
+            finally:
+                self._release_gray(gray)
+            finished = time.perf_counter()
+            if self._governor is not None:
+                # Spread over the frames this recognition stands for
+                self._governor.observe('recognize', (finished - started) * 1000.0 / self._quality('recognize_every', 1))
+            self._faces.put((face_locations, recognized, gray.shape[1]))
+            if any(recognized):
+                self._decisions.put((recognized, captured_at))
+            metrics.record(started, finished, captured_at)
+        self._run_stage('recognize', step)
+
+    def _decide_stage(self):
+        def step(metrics):
+            item = self._decisions.get(0.1)
+            if item is None:
+                return
+            recognized, captured_at = item
+            started = time.perf_counter()
+            self._decide(recognized)
+            metrics.record(started, time.perf_counter(), captured_at)
+        self._run_stage('decide', step)
+
+    def _display_stage(self):
+        seen = [0]
+        next_due = [0.0]
+        buffer = [None]
+
+        def step(metrics):
+            if not self._display_active.wait(0.1):
+                return
+            delay = next_due[0] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Copy (or shrink) the latest frame into this stage's buffer, which display may draw on
+            scale = self._quality('display_scale', 1.0)
+            seen[0], frame, captured_at = self._frames.copy_newer(seen[0], 0.1, buffer[0], scale, self.display_width)
+            if frame is None:
+                return
+            buffer[0] = frame
+            started = time.perf_counter()
+            next_due[0] = started + self.display_interval
+            face_locations, recognized, width = self._faces.peek() or ([], [], 0)
+            if face_locations and frame.shape[1] != width:
+                # Boxes are in full-frame coordinates
+                ratio = frame.shape[1] / width
+                face_locations = [tuple(int(v * ratio) for v in box) for box in face_locations]
+            if self._display(frame, face_locations, recognized) is not False:
+                metrics.record(started, time.perf_counter(), captured_at)
+        self._run_stage('display', step)
+
+    def stats(self):
+        now = time.perf_counter()
+        stats = {stage: metrics.stats(now) for stage, metrics in self.metrics.items()}
+        stats['capture']['overwritten'] = self._frames.overwritten
+        stats['capture']['idle'] = self._gate.idle() if self._gate is not None else False
+        stats['detect']['gated'] = self.gated
+        stats['display']['paused'] = not self._display_active.is_set()
+        if self._governor is not None:
+            stats['quality'] = self._governor.stats()
+        stats['recognize']['queued'] = len(self._detections)
+        stats['recognize']['dropped'] = self._detections.dropped
+        stats['decide']['queued'] = len(self._decisions)
+        stats['decide']['dropped'] = self._decisions.dropped
+        return stats
+
+
+def pipeline_from_env(read_frame, detect, recognize, decide, display, on_stopped=None,
+                      gate=None, grab_frame=None, governor=None):
+    return CameraPipeline(
+        read_frame, detect, recognize, decide, display,
+        queue_size=env_number('CAMERA_PIPELINE_QUEUE_SIZE', 2, int),
+        display_fps=env_number('CAMERA_DISPLAY_FPS', 30.0),
+        on_stopped=on_stopped,
+        gate=gate,
+        grab_frame=grab_frame,
+        governor=governor,
+        display_width=env_number('CAMERA_DISPLAY_WIDTH', 480, int),
+    )
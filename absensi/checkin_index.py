@@ -0,0 +1,109 @@
+"""
+In-memory index of today's check-ins
+Holds the (student_id, class_id) pairs that already have attendance today so
+repeat door events can be answered without a duplicate-check query. Only hits
+are trusted: a pair missing from the index (e.g. written by another process)
+still goes through the normal database path, which then adds it here.
+
+Warmed from one query at startup, updated on every recorded check-in, and
+emptied automatically when the date rolls over.
+"""
+import threading
+from datetime import datetime, timedelta
+
+WARM_QUERY = """
+SELECT sa.student_id, ats.class_id, sa.check_in_time
+FROM student_attendances sa
+LEFT JOIN attendance_sessions ats ON sa.session_id = ats.id
+WHERE sa.check_in_time >= %s AND sa.check_in_time < %s
+"""
+
+
+class CheckinIndex:
+    """(student_id, class_id) -> first check-in time, for the current day only"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = None
+        self._checkins = {}   # (student_id, class_id) -> check_in_time
+        self._students = {}   # student_id -> earliest check_in_time (any class)
+        self.hits = 0
+        self.misses = 0
+
+    def _roll_over(self, today):
+        """Start an empty day (caller holds the lock)"""
+        if today != self._day:
+            self._day = today
+            self._checkins = {}
+            self._students = {}
+
+    def warm(self):
+        """Load today's check-ins with one query; returns False if the database is unreachable"""
+        from simple_database import simple_db
+
+        today = datetime.now().date()
+        start = datetime.combine(today, datetime.min.time())
+        rows = simple_db.execute_query(WARM_QUERY, (start, start + timedelta(days=1)))
+        if rows is None:
+            print("[CHECKIN INDEX] Warm-up failed, starting empty")
+            return False
+        with self._lock:
+            self._roll_over(today)
+            for row in rows:
+                self._add(row['student_id'], row['class_id'], row['check_in_time'])
+            size = len(self._checkins)
+        print(f"[CHECKIN INDEX] Warmed with {size} check-ins for {today}")
+        return True
+
+    def _add(self, student_id, class_id, check_in_time):
+        key = (student_id, class_id)
+        if key not in self._checkins:
+            self._checkins[key] = check_in_time
+        previous = self._students.get(student_id)
+        if previous is None or (check_in_time is not None and check_in_time < previous):
+            self._students[student_id] = check_in_time
+
+    def add(self, student_id, class_id, check_in_time=None):
+        """Record a check-in (ignored unless it is for today)"""
+        check_in_time = check_in_time or datetime.now()
+        today = datetime.now().date()
+        if check_in_time.date() != today:
+            return
+        with self._lock:
+            self._roll_over(today)
+            self._add(student_id, class_id, check_in_time)
+
+    def checked_in(self, student_id, class_id):
+        """Check-in time if (student_id, class_id) is known to be recorded today, else None"""
+        with self._lock:
+            self._roll_over(datetime.now().date())
+            check_in_time = self._checkins.get((student_id, class_id))
+            if check_in_time is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return check_in_time
+
+    def student_checked_in(self, student_id):
+        """Earliest check-in time today for student_id in any class, else None"""
+        with self._lock:
+            self._roll_over(datetime.now().date())
+            check_in_time = self._students.get(student_id)
+            if check_in_time is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return check_in_time
+
+    def stats(self):
+        with self._lock:
+            return {
+                'day': self._day.isoformat() if self._day else None,
+                'checkins': len(self._checkins),
+                'students': len(self._students),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+checkin_index = CheckinIndex()
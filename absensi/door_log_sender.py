@@ -0,0 +1,236 @@
+"""
+Background sender for door access logs to the Node backend
+Events are queued and posted in batches ({"logs": [...]}, at most 500) to
+/api/door-access/log (backend logDoorAccessBatch, one multi-row INSERT into
+door_access_logs) by one worker thread, so the door decision never waits
+on HTTP. Failed posts are retried with exponential backoff; repeated failures
+open a circuit breaker, after which events go straight to the database
+fallback until a probe request succeeds again.
+"""
+import random
+import threading
+import time
+from collections import deque
+
+from env_config import env_number
+
+
+class CircuitBreaker:
+    """closed -> open after failure_threshold consecutive failures;
+    open -> half_open after reset_timeout seconds (one probe allowed);
+    half_open -> closed on success, back to open on failure."""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self.trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = 'half_open'
+            return self._state
+
+    def allow(self):
+        """True if a request may be attempted now"""
+        return self.state != 'open'
+
+    def record_success(self):
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    self.trips += 1
+                    print(f"[DOOR LOG] Circuit opened after {self._failures} failures")
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+
+
+class DoorLogSender:
+    """Queue + batching worker in front of the backend door-access log endpoint.
+
+    post(url, payload, timeout) -> status code (raises on network errors);
+    fallback(event) stores one event some other way (the DB log queue).
+    """
+
+    def __init__(self, url, post, fallback, batch_size=20, flush_interval=0.5, max_queue=1000,
+                 timeout=2.0, max_attempts=3, backoff_base=0.5, backoff_max=10.0, breaker=None):
+        self.url = url
+        self._post = post
+        self._fallback = fallback
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.01, float(flush_interval))
+        self.max_queue = max(1, int(max_queue))
+        self.timeout = timeout
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._stats = {
+            'submitted': 0,
+            'sent': 0,
+            'fallback': 0,
+            'retries': 0,
+            'batches': 0,
+            'post_time_total': 0.0,
+            'post_time_max': 0.0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._cond:
+            self._stats[key] += amount
+
+    def _to_fallback(self, events):
+        for event in events:
+            try:
+                self._fallback(event)
+            except Exception as e:
+                print(f"[DOOR LOG] Fallback error: {e}")
+        self._count('fallback', len(events))
+
+    def submit(self, event):
+        """Queue one event; returns immediately (True if it was accepted somewhere)"""
+        self._count('submitted')
+        if not self.breaker.allow():
+            # Backend known to be down: skip the queue and the timeouts entirely
+            self._to_fallback([event])
+            return True
+        with self._cond:
+            if not self._closed and len(self._queue) < self.max_queue:
+                self._queue.append(event)
+                if len(self._queue) >= self.batch_size:
+                    self._cond.notify_all()
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='door-log-sender', daemon=True)
+                    self._thread.start()
+                return True
+        # Closed or full: don't block the caller
+        self._to_fallback([event])
+        return True
+
+    def _send(self, batch):
+        """Post one batch with retries; returns True if the backend accepted it"""
+        for attempt in range(self.max_attempts):
+            if not self.breaker.allow():
+                return False
+            started = time.perf_counter()
+            try:
+                status = self._post(self.url, {'logs': batch}, self.timeout)
+            except Exception as e:
+                print(f"[DOOR LOG] Request error: {e}")
+                status = None
+            elapsed = time.perf_counter() - started
+            with self._cond:
+                self._stats['batches'] += 1
+                self._stats['post_time_total'] += elapsed
+                self._stats['post_time_max'] = max(self._stats['post_time_max'], elapsed)
+
+            if status is not None and 200 <= status < 300:
+                self.breaker.record_success()
+                return True
+            self.breaker.record_failure()
+            if status is not None and 400 <= status < 500 and status != 429:
+                # The request itself is rejected (e.g. 400: invalid event); retrying won't help
+                print(f"[DOOR LOG] Backend rejected batch with {status}")
+                return False
+            if attempt + 1 < self.max_attempts:
+                self._count('retries')
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                with self._cond:
+                    # Sleep with jitter, but wake up early on close
+                    self._cond.wait_for(lambda: self._closed, delay * (0.5 + random.random() / 2))
+                    if self._closed:
+                        return False
+        return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._queue) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                closing = self._closed
+            if batch:
+                if self._send(batch):
+                    self._count('sent', len(batch))
+                else:
+                    self._to_fallback(batch)
+            if closing:
+                with self._cond:
+                    rest = list(self._queue)
+                    self._queue.clear()
+                self._to_fallback(rest)
+                return
+
+    def close(self, timeout=5.0):
+        """Stop the worker; anything unsent goes to the fallback"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            rest = list(self._queue)
+            self._queue.clear()
+        self._to_fallback(rest)
+
+    def stats(self):
+        with self._cond:
+            batches = self._stats['batches']
+            return {
+                'depth': len(self._queue),
+                'submitted': self._stats['submitted'],
+                'sent': self._stats['sent'],
+                'fallback': self._stats['fallback'],
+                'retries': self._stats['retries'],
+                'batches': batches,
+                'avg_post_ms': (self._stats['post_time_total'] / batches * 1000.0) if batches else 0.0,
+                'max_post_ms': self._stats['post_time_max'] * 1000.0,
+                'breaker_state': self.breaker.state,
+                'breaker_trips': self.breaker.trips,
+            }
+
+
+def requests_post(session):
+    """post() for DoorLogSender backed by a requests.Session (keep-alive)"""
+    def post(url, payload, timeout):
+        return session.post(url, json=payload, timeout=timeout).status_code
+    return post
+
+
+def sender_from_env(base_url, post, fallback):
+    return DoorLogSender(
+        f"{base_url}/api/door-access/log",
+        post,
+        fallback,
+        batch_size=env_number('DOOR_LOG_BATCH_SIZE', 20, int),
+        flush_interval=env_number('DOOR_LOG_FLUSH_INTERVAL', 0.5),
+        max_queue=env_number('DOOR_LOG_MAX_QUEUE', 1000, int),
+        timeout=env_number('DOOR_LOG_TIMEOUT', 2.0),
+        max_attempts=env_number('DOOR_LOG_MAX_ATTEMPTS', 3, int),
+        backoff_base=env_number('DOOR_LOG_BACKOFF', 0.5),
+        breaker=CircuitBreaker(
+            failure_threshold=env_number('DOOR_LOG_BREAKER_THRESHOLD', 3, int),
+            reset_timeout=env_number('DOOR_LOG_BREAKER_RESET', 30.0),
+        ),
+    )
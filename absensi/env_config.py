@@ -0,0 +1,12 @@
+"""
+Environment-variable settings shared by the attendance modules
+"""
+import os
+
+
+def env_number(name, default, cast=float):
+    """os.getenv(name) converted with cast, or cast(default) if unset or malformed"""
+    try:
+        return cast(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return cast(default)
@@ -0,0 +1,493 @@
+"""
+Shared LBPH face gallery
+Extracts the LBP histogram of a probe face once and compares it against every
+enrolled sample, instead of running one LBPHFaceRecognizer.predict per employee.
+Histograms and distances follow OpenCV's LBPH implementation so raw distances
+stay comparable with LBPH_CONFIDENCE_THRESHOLD.
+
+The gallery can be persisted as one binary file (see save_gallery/load_gallery)
+which is memory-mapped at startup instead of parsing one YAML model per employee.
+"""
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# Same defaults as cv2.face.LBPHFaceRecognizer_create()
+LBPH_RADIUS = 1
+LBPH_NEIGHBORS = 8
+LBPH_GRID_X = 8
+LBPH_GRID_Y = 8
+
+
+def _lbp_sample_offsets(radius, neighbors):
+    """Bilinear sampling offsets/weights used by OpenCV's extended LBP operator"""
+    offsets = []
+    for n in range(neighbors):
+        x = np.float32(radius * np.cos(2.0 * np.pi * n / float(neighbors)))
+        y = np.float32(-radius * np.sin(2.0 * np.pi * n / float(neighbors)))
+        fx, fy = int(np.floor(x)), int(np.floor(y))
+        cx, cy = int(np.ceil(x)), int(np.ceil(y))
+        ty = np.float32(y - fy)
+        tx = np.float32(x - fx)
+        w1 = np.float32((1 - tx) * (1 - ty))
+        w2 = np.float32(tx * (1 - ty))
+        w3 = np.float32((1 - tx) * ty)
+        w4 = np.float32(tx * ty)
+        offsets.append((fx, fy, cx, cy, w1, w2, w3, w4))
+    return offsets
+
+
+def lbph_histogram(face_gray, radius=LBPH_RADIUS, neighbors=LBPH_NEIGHBORS,
+                   grid_x=LBPH_GRID_X, grid_y=LBPH_GRID_Y):
+    """Compute the spatial LBP histogram OpenCV's LBPH recognizer stores per sample.
+
+    Returns a 1-D float32 vector of length grid_x * grid_y * 2**neighbors.
+    """
+    src = np.asarray(face_gray, dtype=np.float32)
+    rows, cols = src.shape
+    inner_h, inner_w = rows - 2 * radius, cols - 2 * radius
+    center = src[radius:radius + inner_h, radius:radius + inner_w]
+    codes = np.zeros((inner_h, inner_w), dtype=np.int32)
+    eps = np.finfo(np.float32).eps
+
+    def window(dy, dx):
+        return src[radius + dy:radius + dy + inner_h, radius + dx:radius + dx + inner_w]
+
+    for n, (fx, fy, cx, cy, w1, w2, w3, w4) in enumerate(_lbp_sample_offsets(radius, neighbors)):
+        t = w1 * window(fy, fx) + w2 * window(fy, cx) + w3 * window(cy, fx) + w4 * window(cy, cx)
+        bit = (t > center) | (np.abs(t - center) < eps)
+        codes |= bit.astype(np.int32) << n
+
+    num_patterns = 2 ** neighbors
+    cell_h, cell_w = inner_h // grid_y, inner_w // grid_x
+    cells = codes[:cell_h * grid_y, :cell_w * grid_x]
+    cells = cells.reshape(grid_y, cell_h, grid_x, cell_w).transpose(0, 2, 1, 3).reshape(grid_y * grid_x, -1)
+    # One bincount over offset codes builds every cell histogram at once
+    offset_codes = cells + (np.arange(grid_y * grid_x, dtype=np.int32) * num_patterns)[:, None]
+    hist = np.bincount(offset_codes.ravel(), minlength=grid_y * grid_x * num_patterns).astype(np.float32)
+    if cell_h * cell_w > 0:
+        hist /= np.float32(cell_h * cell_w)
+    return hist
+
+
+DISTANCE_METRICS = ('chisqr_alt', 'l1', 'l2')
+
+
+def chi_square_alt(samples, probe):
+    """OpenCV HISTCMP_CHISQR_ALT between each row of samples and the probe"""
+    total = samples + probe
+    diff = samples - probe
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(total > 0, diff * diff / total, 0.0)
+    return 2.0 * terms.sum(axis=1)
+
+
+def _chi_square_alt_sparse(block, block_sums, probe, probe_cols):
+    """CHISQR_ALT restricted to the probe's non-zero bins.
+
+    Where the probe bin is empty the term reduces to the sample value, so those
+    bins are covered by the precomputed row sums instead of being visited.
+    """
+    g = block[:, probe_cols]
+    q = probe[probe_cols]
+    diff = g - q
+    partial = (diff * diff / (g + q)).sum(axis=1, dtype=np.float64)
+    rest = block_sums - g.sum(axis=1, dtype=np.float64)
+    return 2.0 * (partial + rest)
+
+
+class FaceGallery:
+    """Packed gallery of enrolled LBPH histograms.
+
+    All samples live in one contiguous float32 matrix (one row per sample) with
+    rows grouped by employee, so a probe is scored with a single vectorized
+    distance reduction followed by per-employee min-pooling.
+    """
+
+    def __init__(self, metric='chisqr_alt', chunk_rows=512):
+        if metric not in DISTANCE_METRICS:
+            raise ValueError(f"Unknown gallery distance '{metric}', expected one of {DISTANCE_METRICS}")
+        self.metric = metric
+        self.chunk_rows = max(1, int(chunk_rows))
+        # employee_id -> {'name': str, 'histograms': (samples, features) array, 'source_mtime': float|None}
+        self._entries = {}
+        self._packed = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, employee_id):
+        return employee_id in self._entries
+
+    @property
+    def num_samples(self):
+        return sum(entry['histograms'].shape[0] for entry in self._entries.values())
+
+    def employee_ids(self):
+        return list(self._entries.keys())
+
+    def entry(self, employee_id):
+        """Return the stored {'name', 'histograms', 'source_mtime'} for an employee, or None"""
+        return self._entries.get(employee_id)
+
+    def add(self, employee_id, name, histograms, source_mtime=None):
+        """Enroll (or replace) an employee's histogram samples.
+
+        source_mtime records the modification time of the model file the samples
+        came from, so a persisted gallery can tell when it is stale.
+        """
+        hists = np.asarray(histograms, dtype=np.float32)
+        if hists.ndim == 1:
+            hists = hists.reshape(1, -1)
+        if hists.size == 0:
+            return
+        with self._lock:
+            self._entries[employee_id] = {'name': name, 'histograms': hists, 'source_mtime': source_mtime}
+            self._packed = None
+
+    def add_recognizer(self, employee_id, name, recognizer, source_mtime=None):
+        """Enroll histograms pulled out of a trained/loaded LBPHFaceRecognizer"""
+        hists = recognizer_histograms(recognizer)
+        if hists is not None:
+            self.add(employee_id, name, hists, source_mtime=source_mtime)
+
+    def rename(self, employee_id, name):
+        """Update an employee's display name without touching the packed samples"""
+        with self._lock:
+            entry = self._entries.get(employee_id)
+            if entry is not None and entry['name'] != name:
+                entry['name'] = name
+                if self._packed is not None:
+                    self._packed['names'][self._packed['rows'][employee_id]] = name
+
+    def remove(self, employee_id):
+        with self._lock:
+            if self._entries.pop(employee_id, None) is not None:
+                self._packed = None
+
+    def _pack(self):
+        """Build the contiguous sample matrix, row sums, labels and per-employee row offsets"""
+        with self._lock:
+            if self._packed is not None:
+                return self._packed
+            employee_ids = list(self._entries.keys())
+            names = [self._entries[eid]['name'] for eid in employee_ids]
+            blocks = [self._entries[eid]['histograms'] for eid in employee_ids]
+            counts = np.array([b.shape[0] for b in blocks], dtype=np.int64)
+            if blocks:
+                matrix = np.ascontiguousarray(np.vstack(blocks), dtype=np.float32)
+            else:
+                matrix = np.empty((0, 0), dtype=np.float32)
+            labels = np.repeat(np.arange(len(employee_ids), dtype=np.int32), counts)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+            # Entries become views into the packed matrix so samples are stored once
+            for eid, start, count in zip(employee_ids, starts, counts):
+                self._entries[eid]['histograms'] = matrix[start:start + count]
+            self._packed = {
+                'matrix': matrix,
+                'labels': labels,
+                'starts': starts,
+                'row_sums': matrix.sum(axis=1, dtype=np.float64),
+                'employee_ids': employee_ids,
+                'names': names,
+                # employee_id -> position in employee_ids/names, so rename() is O(1)
+                'rows': {eid: row for row, eid in enumerate(employee_ids)},
+            }
+            return self._packed
+
+    def _sample_distances(self, packed, probe):
+        matrix = packed['matrix']
+        probe = np.asarray(probe, dtype=np.float32).ravel()
+        out = np.empty(matrix.shape[0], dtype=np.float64)
+        probe_cols = np.flatnonzero(probe)
+        # Chunk rows so temporaries stay bounded on small-memory devices
+        for lo in range(0, matrix.shape[0], self.chunk_rows):
+            hi = min(lo + self.chunk_rows, matrix.shape[0])
+            block = matrix[lo:hi]
+            if block.dtype != np.float32:
+                # float16 galleries are widened one chunk at a time
+                block = block.astype(np.float32)
+            if self.metric == 'chisqr_alt':
+                out[lo:hi] = _chi_square_alt_sparse(block, packed['row_sums'][lo:hi], probe, probe_cols)
+            elif self.metric == 'l1':
+                out[lo:hi] = np.abs(block - probe).sum(axis=1, dtype=np.float64)
+            else:
+                diff = block - probe
+                out[lo:hi] = np.sqrt(np.einsum('ij,ij->i', diff, diff, dtype=np.float64))
+        return out
+
+    def sample_distances(self, probe):
+        """Distance from a probe histogram to every packed sample row"""
+        return self._sample_distances(self._pack(), probe)
+
+    def employee_distances(self, probe):
+        """Per-employee best (minimum) distance, returned with the matching employee ids"""
+        packed = self._pack()
+        return packed['employee_ids'], self._pool(packed, probe)
+
+    def _pool(self, packed, probe):
+        if packed['matrix'].shape[0] == 0:
+            return np.empty(0)
+        return np.minimum.reduceat(self._sample_distances(packed, probe), packed['starts'])
+
+    def match_histogram(self, probe):
+        """Return (employee_id, name, raw_distance) of the closest employee, or None if empty"""
+        packed = self._pack()
+        pooled = self._pool(packed, probe)
+        if pooled.size == 0:
+            return None
+        best = int(np.argmin(pooled))
+        return packed['employee_ids'][best], packed['names'][best], float(pooled[best])
+
+    def match(self, face_gray):
+        """Return (employee_id, name, raw_distance) of the closest sample, or None if empty"""
+        if not self._entries:
+            return None
+        return self.match_histogram(lbph_histogram(face_gray))
+
+
+def recognizer_histograms(recognizer):
+    """Stack the per-sample histograms held by an LBPHFaceRecognizer, or None if untrained"""
+    hists = [np.asarray(h, dtype=np.float32).ravel() for h in recognizer.getHistograms()]
+    return np.vstack(hists) if hists else None
+
+
+# ---------------------------------------------------------------------------
+# Binary gallery file
+#
+#   [header, padded to one page]
+#   [histogram matrix, float32 or float16, (samples, features), C order]
+#   [row sums, float64, (samples,)]
+#   [labels, int32, (samples,)  -> index into the employee list]
+#   [metadata, UTF-8 JSON: employee ids, names, sample counts, source mtimes]
+#
+# The header carries CRC32 checksums of the metadata and of the array section.
+# ---------------------------------------------------------------------------
+
+GALLERY_MAGIC = b'FGAL'
+GALLERY_VERSION = 1
+GALLERY_FILENAME = 'face_gallery.bin'
+_PAGE = 4096
+_ALIGN = 64
+_DTYPES = {0: np.float32, 1: np.float16}
+_HEADER = struct.Struct('<4sHHIIQQQQQQII')
+
+
+class GalleryFileError(Exception):
+    """Raised when a gallery file is missing, truncated, corrupt or of an unknown version"""
+
+
+def _align(offset, alignment=_ALIGN):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _crc_arrays(arrays, chunk_bytes=16 * 1024 * 1024):
+    crc = 0
+    for arr in arrays:
+        raw = np.ascontiguousarray(arr).reshape(-1).view(np.uint8)
+        for lo in range(0, raw.size, chunk_bytes):
+            crc = zlib.crc32(raw[lo:lo + chunk_bytes], crc)
+    return crc & 0xFFFFFFFF
+
+
+def save_gallery(gallery, path, float16=False):
+    """Write a gallery to a single binary file (atomically via a temp file + rename)"""
+    packed = gallery._pack()
+    dtype = np.float16 if float16 else np.float32
+    dtype_code = 1 if float16 else 0
+    matrix = np.ascontiguousarray(packed['matrix'], dtype=dtype)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(0, 0)
+    num_samples, num_features = matrix.shape
+    row_sums = np.ascontiguousarray(matrix.astype(np.float32).sum(axis=1, dtype=np.float64)
+                                    if float16 else packed['row_sums'], dtype=np.float64)
+    labels = np.ascontiguousarray(packed['labels'], dtype=np.int32)
+
+    counts = np.diff(np.append(packed['starts'], num_samples)).tolist() if packed['employee_ids'] else []
+    meta = {
+        'created_at': time.time(),
+        'metric': gallery.metric,
+        'employees': [
+            {
+                'employee_id': eid,
+                'name': name,
+                'samples': int(count),
+                'source_mtime': (gallery.entry(eid) or {}).get('source_mtime'),
+            }
+            for eid, name, count in zip(packed['employee_ids'], packed['names'], counts)
+        ],
+    }
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+
+    data_offset = _PAGE
+    row_sums_offset = _align(data_offset + matrix.nbytes)
+    labels_offset = _align(row_sums_offset + row_sums.nbytes)
+    meta_offset = _align(labels_offset + labels.nbytes)
+
+    header = _HEADER.pack(
+        GALLERY_MAGIC, GALLERY_VERSION, dtype_code, len(packed['employee_ids']), num_features,
+        num_samples, data_offset, row_sums_offset, labels_offset, meta_offset, len(meta_bytes),
+        _crc_arrays([matrix, row_sums, labels]), zlib.crc32(meta_bytes) & 0xFFFFFFFF
+    )
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(data_offset, b'\0'))
+        for offset, arr in ((data_offset, matrix), (row_sums_offset, row_sums), (labels_offset, labels)):
+            f.seek(offset)
+            f.write(arr.tobytes(order='C'))
+        f.seek(meta_offset)
+        f.write(meta_bytes)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_gallery_header(path):
+    """Parse and sanity-check a gallery file header"""
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read(_HEADER.size)
+    except OSError as e:
+        raise GalleryFileError(f"Cannot read gallery file {path}: {e}")
+    if len(raw) < _HEADER.size:
+        raise GalleryFileError(f"Gallery file {path} is truncated")
+    fields = _HEADER.unpack(raw)
+    header = dict(zip(
+        ('magic', 'version', 'dtype', 'num_employees', 'num_features', 'num_samples', 'data_offset',
+         'row_sums_offset', 'labels_offset', 'meta_offset', 'meta_length', 'data_crc', 'meta_crc'),
+        fields
+    ))
+    if header['magic'] != GALLERY_MAGIC:
+        raise GalleryFileError(f"{path} is not a face gallery file")
+    if header['version'] != GALLERY_VERSION:
+        raise GalleryFileError(f"Unsupported gallery version {header['version']} in {path}")
+    if header['dtype'] not in _DTYPES:
+        raise GalleryFileError(f"Unknown histogram dtype code {header['dtype']} in {path}")
+    expected_size = header['meta_offset'] + header['meta_length']
+    if os.path.getsize(path) < expected_size:
+        raise GalleryFileError(f"Gallery file {path} is truncated")
+    return header
+
+
+def load_gallery(path, metric='chisqr_alt', verify=False):
+    """Memory-map a gallery file written by save_gallery.
+
+    Histograms stay on disk and are paged in on demand (and shared between
+    processes mapping the same file). The metadata checksum is always checked;
+    verify=True also checksums the histogram data, which reads the whole file.
+    """
+    header = read_gallery_header(path)
+    with open(path, 'rb') as f:
+        f.seek(header['meta_offset'])
+        meta_bytes = f.read(header['meta_length'])
+    if zlib.crc32(meta_bytes) & 0xFFFFFFFF != header['meta_crc']:
+        raise GalleryFileError(f"Gallery metadata checksum mismatch in {path}")
+    meta = json.loads(meta_bytes.decode('utf-8'))
+
+    num_samples, num_features = header['num_samples'], header['num_features']
+    if num_samples:
+        matrix = np.memmap(path, dtype=_DTYPES[header['dtype']], mode='r',
+                           offset=header['data_offset'], shape=(num_samples, num_features))
+        row_sums = np.memmap(path, dtype=np.float64, mode='r',
+                             offset=header['row_sums_offset'], shape=(num_samples,))
+        labels = np.memmap(path, dtype=np.int32, mode='r',
+                           offset=header['labels_offset'], shape=(num_samples,))
+    else:
+        matrix = np.empty((0, num_features), dtype=_DTYPES[header['dtype']])
+        row_sums = np.empty(0, dtype=np.float64)
+        labels = np.empty(0, dtype=np.int32)
+
+    if verify and _crc_arrays([matrix, row_sums, labels]) != header['data_crc']:
+        raise GalleryFileError(f"Gallery data checksum mismatch in {path}")
+
+    employees = meta.get('employees', [])
+    counts = np.array([e['samples'] for e in employees], dtype=np.int64)
+    if int(counts.sum()) != num_samples or len(employees) != header['num_employees']:
+        raise GalleryFileError(f"Gallery metadata does not match sample table in {path}")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+
+    gallery = FaceGallery(metric=metric)
+    for e, start, count in zip(employees, starts, counts):
+        gallery._entries[e['employee_id']] = {
+            'name': e['name'],
+            'histograms': matrix[start:start + count],
+            'source_mtime': e.get('source_mtime'),
+        }
+    gallery._packed = {
+        'matrix': matrix,
+        'labels': labels,
+        'starts': starts,
+        'row_sums': row_sums,
+        'employee_ids': [e['employee_id'] for e in employees],
+        'names': [e['name'] for e in employees],
+        'rows': {e['employee_id']: row for row, e in enumerate(employees)},
+    }
+    return gallery
+
+
+def convert_yml_models(models_dir, out_path=None, names=None, float16=False):
+    """One-shot converter: pack every models/employee_<id>_model.yml into a gallery file.
+
+    names optionally maps employee_id -> display name; missing names fall back
+    to the employee id. Returns (out_path, converted_count, failed_paths).
+    """
+    import glob
+    import cv2
+
+    out_path = out_path or os.path.join(models_dir, GALLERY_FILENAME)
+    names = names or {}
+    gallery = FaceGallery()
+    failed = []
+    for path in sorted(glob.glob(os.path.join(models_dir, "employee_*_model.yml"))):
+        filename = os.path.basename(path)
+        eid = filename[len("employee_"):filename.rfind("_model.yml")]
+        try:
+            recognizer = cv2.face.LBPHFaceRecognizer_create()
+            recognizer.read(path)
+            gallery.add_recognizer(eid, names.get(eid, eid), recognizer, source_mtime=os.path.getmtime(path))
+        except Exception as e:
+            print(f"[GALLERY] Failed to convert {path}: {e}")
+            failed.append(path)
+    save_gallery(gallery, out_path, float16=float16)
+    return out_path, len(gallery), failed
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert per-employee LBPH .yml models into one gallery file")
+    parser.add_argument('--models', default='models', help='directory containing employee_<id>_model.yml files')
+    parser.add_argument('--out', default=None, help=f'output file (default: <models>/{GALLERY_FILENAME})')
+    parser.add_argument('--float16', action='store_true', help='store histograms as float16 (half the size)')
+    parser.add_argument('--no-db', action='store_true', help='do not look up employee names in the database')
+    parser.add_argument('--verify', action='store_true', help='re-open the written file and verify its checksums')
+    args = parser.parse_args()
+
+    names = {}
+    if not args.no_db:
+        try:
+            from simple_database import simple_db
+            rows = simple_db.execute_query("SELECT user_id, fullname FROM users") or []
+            names = {str(r['user_id']): r['fullname'] for r in rows}
+        except Exception as e:
+            print(f"[GALLERY] Name lookup skipped: {e}")
+
+    start = time.perf_counter()
+    out_path, converted, failed = convert_yml_models(args.models, args.out, names, float16=args.float16)
+    print(f"[GALLERY] Wrote {converted} employees to {out_path} "
+          f"in {time.perf_counter() - start:.2f}s ({len(failed)} failed)")
+    if args.verify:
+        gallery = load_gallery(out_path, verify=True)
+        print(f"[GALLERY] Verified {len(gallery)} employees, {gallery.num_samples} samples")
+
+
+if __name__ == "__main__":
+    main()
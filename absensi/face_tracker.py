@@ -0,0 +1,253 @@
+"""
+Detect-once-then-track face localisation
+Full Haar detection runs every `every` frames, or as soon as a tracked face
+is lost. Frames in between only follow the known faces with a cheap tracker:
+
+    template  normalised template matching in a window around the last box (default)
+    flow      Lucas-Kanade optical flow of corner points inside the box
+    kcf, csrt, mil, mosse, medianflow
+              OpenCV's built-in trackers (opencv-contrib)
+
+Output is the same [(left, top, right, bottom), ...] list detect_faces()
+returns, so recognition and drawing code does not change. locate_tracked()
+also returns a stable id per face: a re-detected face that overlaps a
+tracked box keeps that track's id, which lets recognition cache identities.
+"""
+import itertools
+import os
+
+import cv2
+import numpy as np
+
+from env_config import env_number
+
+TRACKERS = ('template', 'flow', 'kcf', 'csrt', 'mil', 'mosse', 'medianflow')
+
+
+def _iou(a, b):
+    left, top = max(a[0], b[0]), max(a[1], b[1])
+    right, bottom = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def _clip_box(box, shape):
+    """(left, top, right, bottom) as ints inside the frame, or None if empty"""
+    height, width = shape[:2]
+    left, top, right, bottom = (int(round(v)) for v in box)
+    left, top = max(0, left), max(0, top)
+    right, bottom = min(width, right), min(height, bottom)
+    if right - left < 2 or bottom - top < 2:
+        return None
+    return (left, top, right, bottom)
+
+
+def scaled_size(shape, scale):
+    """(width, height) of an image of `shape` resized by `scale`"""
+    height, width = shape[:2]
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+
+def detect_scaled(cascade, gray, scale=1.0, scale_factor=1.3, min_neighbors=5, min_size=0, buffer=None):
+    """detectMultiScale on gray resized by `scale`, boxes mapped back to gray's coordinates
+
+    buffer, if given with the scaled shape, receives the resized image instead of a new array.
+    """
+    small = gray
+    if scale < 1.0:
+        width, height = scaled_size(gray.shape, scale)
+        if buffer is not None and buffer.shape != (height, width):
+            buffer = None
+        small = cv2.resize(gray, (width, height), dst=buffer, interpolation=cv2.INTER_AREA)
+    options = {}
+    if min_size:
+        side = max(1, int(round(min_size * scale)))
+        options['minSize'] = (side, side)
+    faces = cascade.detectMultiScale(small, scale_factor, min_neighbors, **options)
+    return [(int(x / scale), int(y / scale), int((x + w) / scale), int((y + h) / scale))
+            for (x, y, w, h) in faces]
+
+
+class TemplateTrack:
+    """Search for the detected face patch around its last position"""
+
+    def __init__(self, frame, gray, box, min_score=0.6, margin=0.5):
+        left, top, right, bottom = box
+        self.template = gray[top:bottom, left:right].copy()
+        self.box = box
+        self.min_score = min_score
+        self.margin = margin
+        self._scores = None
+
+    def update(self, frame, gray):
+        left, top, right, bottom = self.box
+        width, height = right - left, bottom - top
+        pad_x, pad_y = int(width * self.margin), int(height * self.margin)
+        area = _clip_box((left - pad_x, top - pad_y, right + pad_x, bottom + pad_y), gray.shape)
+        if area is None or area[2] - area[0] < width or area[3] - area[1] < height:
+            return None
+        search = gray[area[1]:area[3], area[0]:area[2]]
+        shape = (search.shape[0] - height + 1, search.shape[1] - width + 1)
+        if self._scores is None or self._scores.shape != shape:
+            self._scores = np.empty(shape, np.float32)
+        scores = cv2.matchTemplate(search, self.template, cv2.TM_CCOEFF_NORMED, result=self._scores)
+        _, best, _, (x, y) = cv2.minMaxLoc(scores)
+        if best < self.min_score:
+            return None
+        self.box = (area[0] + x, area[1] + y, area[0] + x + width, area[1] + y + height)
+        return self.box
+
+
+class FlowTrack:
+    """Shift the box by the median optical flow of corner points inside it"""
+
+    def __init__(self, frame, gray, box, min_points=5):
+        self.box = box
+        self.min_points = min_points
+        # Own copy: the caller reuses its grey buffers between frames
+        self.prev_gray = gray.copy()
+        left, top, right, bottom = box
+        mask = np.zeros_like(gray)
+        mask[top:bottom, left:right] = 255
+        self.points = cv2.goodFeaturesToTrack(gray, maxCorners=40, qualityLevel=0.01, minDistance=4, mask=mask)
+
+    def update(self, frame, gray):
+        if self.points is None or len(self.points) < self.min_points:
+            return None
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, self.points, None,
+                                                   winSize=(15, 15), maxLevel=2)
+        ok = status.reshape(-1) == 1
+        if ok.sum() < self.min_points:
+            return None
+        dx, dy = np.median((moved[ok] - self.points[ok]).reshape(-1, 2), axis=0)
+        left, top, right, bottom = self.box
+        box = _clip_box((left + dx, top + dy, right + dx, bottom + dy), gray.shape)
+        if box is None:
+            return None
+        self.box = box
+        self.points = moved[ok].reshape(-1, 1, 2)
+        np.copyto(self.prev_gray, gray)
+        return box
+
+
+class OpenCVTrack:
+    """Wrapper around cv2.Tracker* (KCF, CSRT, ...)"""
+
+    def __init__(self, frame, gray, box, kind='kcf'):
+        self.tracker = create_opencv_tracker(kind)
+        left, top, right, bottom = box
+        self.tracker.init(frame, (left, top, right - left, bottom - top))
+
+    def update(self, frame, gray):
+        ok, (x, y, w, h) = self.tracker.update(frame)
+        if not ok:
+            return None
+        return _clip_box((x, y, x + w, y + h), frame.shape)
+
+
+def create_opencv_tracker(kind):
+    name = {'kcf': 'KCF', 'csrt': 'CSRT', 'mil': 'MIL', 'mosse': 'MOSSE', 'medianflow': 'MedianFlow'}[kind]
+    factory = getattr(cv2, f"Tracker{name}_create", None)
+    if factory is None and hasattr(cv2, 'legacy'):
+        factory = getattr(cv2.legacy, f"Tracker{name}_create", None)
+    if factory is None:
+        raise ValueError(f"OpenCV tracker {kind} not available (needs opencv-contrib-python)")
+    return factory()
+
+
+class FaceTracker:
+    """Run detect(gray) every `every` frames (or when a track is lost) and track in between"""
+
+    def __init__(self, detect, every=5, tracker='template', match_iou=0.3):
+        if tracker not in TRACKERS:
+            print(f"[FACE TRACKER] Unknown tracker {tracker!r}, using template")
+            tracker = 'template'
+        if tracker not in ('template', 'flow'):
+            try:
+                create_opencv_tracker(tracker)
+            except Exception as e:
+                print(f"[FACE TRACKER] {e}, using template")
+                tracker = 'template'
+        self._detect = detect
+        self.every = max(1, int(every))
+        self.tracker = tracker
+        self.match_iou = match_iou
+        self._tracks = []
+        self._ids = []
+        self._boxes = []
+        self._next_id = itertools.count(1)
+        self._since_detect = None
+        self.frames = 0
+        self.detections = 0
+        self.lost = 0
+
+    def reset(self):
+        """Forget current tracks; the next frame runs full detection"""
+        self._tracks = []
+        self._ids = []
+        self._boxes = []
+        self._since_detect = None
+
+    def _assign_ids(self, boxes):
+        """Give each detected box the id of the best-overlapping previous box, or a new id"""
+        ids = []
+        free = list(zip(self._ids, self._boxes))
+        for box in boxes:
+            best = max(free, key=lambda item: _iou(item[1], box), default=None)
+            if best is not None and _iou(best[1], box) >= self.match_iou:
+                free.remove(best)
+                ids.append(best[0])
+            else:
+                ids.append(next(self._next_id))
+        return ids
+
+    def _new_track(self, frame, gray, box):
+        if self.tracker == 'template':
+            return TemplateTrack(frame, gray, box)
+        if self.tracker == 'flow':
+            return FlowTrack(frame, gray, box)
+        return OpenCVTrack(frame, gray, box, self.tracker)
+
+    def locate(self, frame, gray):
+        """Face boxes for this frame as [(left, top, right, bottom), ...]"""
+        return self.locate_tracked(frame, gray)[0]
+
+    def locate_tracked(self, frame, gray):
+        """(boxes, track_ids) for this frame"""
+        self.frames += 1
+        if self._since_detect is not None and self._since_detect + 1 < self.every:
+            boxes = [track.update(frame, gray) for track in self._tracks]
+            if all(box is not None for box in boxes):
+                self._since_detect += 1
+                self._boxes = boxes
+                return boxes, list(self._ids)
+            self.lost += 1
+            # Keep the last known position of surviving tracks for id matching
+            self._boxes = [box or old for box, old in zip(boxes, self._boxes)]
+
+        boxes = [_clip_box(box, gray.shape) for box in self._detect(gray)]
+        boxes = [box for box in boxes if box is not None]
+        self._ids = self._assign_ids(boxes)
+        self._boxes = boxes
+        self._tracks = [self._new_track(frame, gray, box) for box in boxes]
+        self._since_detect = 0
+        self.detections += 1
+        return boxes, list(self._ids)
+
+    def stats(self):
+        return {
+            'tracker': self.tracker,
+            'every': self.every,
+            'frames': self.frames,
+            'detections': self.detections,
+            'lost': self.lost,
+        }
+
+
+def tracker_from_env(detect):
+    """FaceTracker configured by FACE_TRACK_EVERY / FACE_TRACKER, or None when every frame is detected"""
+    every = env_number('FACE_TRACK_EVERY', 5, int)
+    if every <= 1:
+        return None
+    return FaceTracker(detect, every=every, tracker=os.getenv('FACE_TRACKER', 'template').strip().lower())
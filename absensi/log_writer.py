@@ -0,0 +1,296 @@
+"""
+Write-behind queue for log tables (door_access_logs, face_recognition_logs)
+Callers hand over a row and return immediately; a background thread groups
+rows by INSERT statement and writes them with simple_db.execute_many, flushing
+when a batch fills up or the flush interval passes. Rows that cannot be written
+(MySQL down) or are still queued at shutdown are handed to the spill callback,
+by default the durable attendance journal, instead of being dropped.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from env_config import env_number
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block', 'sync')
+
+
+class WriteBehindLog:
+    """Bounded in-process log queue with group commit.
+
+    Overflow policies when max_queue rows are already waiting:
+      drop_oldest - discard the oldest queued row (default, keeps recent events)
+      drop_newest - discard the row being submitted
+      block       - wait up to block_timeout for space, then discard the new row
+      sync        - write the row in the caller's thread
+
+    spill(query, rows) -> bool takes rows that failed to write; without it
+    failed rows are retried up to max_attempts times and then dropped.
+    """
+
+    def __init__(self, writer=None, batch_size=200, flush_interval=1.0, max_queue=5000,
+                 overflow='drop_oldest', block_timeout=0.5, max_attempts=3, spill=None):
+        if overflow not in OVERFLOW_POLICIES:
+            print(f"[LOG QUEUE] Unknown overflow policy '{overflow}', using drop_oldest")
+            overflow = 'drop_oldest'
+        self._writer = writer
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.01, float(flush_interval))
+        self.max_queue = max(1, int(max_queue))
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.max_attempts = max(1, int(max_attempts))
+        self._spill = spill
+
+        self._queue = deque()  # (query, params, attempts)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._flushing = False
+        self._flush_requested = False
+
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'sync_writes': 0,
+            'spilled': 0,
+            'flushes': 0,
+            'flush_time_total': 0.0,
+            'flush_time_max': 0.0,
+            'last_flush_ms': 0.0,
+            'max_depth': 0,
+        }
+
+    def _write(self, query, rows):
+        if self._writer is not None:
+            return self._writer(query, rows)
+        from simple_database import simple_db
+        return simple_db.execute_many(query, rows, chunk_size=self.batch_size)
+
+    def _spill_rows(self, query, rows):
+        """Hand unwritten rows to the spill callback; returns True if it took them"""
+        if self._spill is None or not rows:
+            return False
+        try:
+            return bool(self._spill(query, rows))
+        except Exception as e:
+            print(f"[LOG QUEUE] Spill error: {e}")
+            return False
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, query, params):
+        """Queue one row for query; returns False if it was dropped"""
+        with self._cond:
+            if self._closed:
+                sync = True
+            else:
+                sync = False
+                if len(self._queue) >= self.max_queue:
+                    if self.overflow == 'drop_oldest':
+                        self._queue.popleft()
+                        self._stats['dropped'] += 1
+                    elif self.overflow == 'drop_newest':
+                        self._stats['dropped'] += 1
+                        return False
+                    elif self.overflow == 'block':
+                        deadline = time.monotonic() + self.block_timeout
+                        while len(self._queue) >= self.max_queue and not self._closed:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                self._stats['dropped'] += 1
+                                return False
+                            self._cond.wait(remaining)
+                        sync = self._closed
+                    else:
+                        sync = True
+                if not sync:
+                    self._queue.append((query, params, 0))
+                    self._stats['enqueued'] += 1
+                    self._stats['max_depth'] = max(self._stats['max_depth'], len(self._queue))
+                    if len(self._queue) >= self.batch_size:
+                        self._cond.notify_all()
+                    self._ensure_thread()
+                    return True
+
+        # Closed queue or 'sync' overflow: write in the caller's thread
+        written = self._write(query, [params])
+        spilled = not written and self._spill_rows(query, [params])
+        with self._cond:
+            self._stats['sync_writes'] += 1
+            if written:
+                self._stats['written'] += 1
+            elif spilled:
+                self._stats['spilled'] += 1
+            else:
+                self._stats['failed'] += 1
+        return bool(written or spilled)
+
+    def _take_batch(self):
+        """Pop the next run of rows sharing one query (caller holds the lock)"""
+        query = self._queue[0][0]
+        batch = []
+        while self._queue and self._queue[0][0] == query and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        return query, batch
+
+    def _flush_once(self):
+        """Write everything currently queued; returns rows written"""
+        with self._cond:
+            if not self._queue:
+                return 0
+            self._flushing = True
+            pending = []
+            while self._queue:
+                pending.append(self._take_batch())
+            self._cond.notify_all()
+
+        started = time.perf_counter()
+        written_total = 0
+        retry = []
+        dropped = 0
+        spilled = 0
+        # Group non-adjacent runs of the same query so each table gets one bulk insert
+        grouped = {}
+        for query, batch in pending:
+            grouped.setdefault(query, []).extend(batch)
+        for query, items in grouped.items():
+            try:
+                written = self._write(query, [params for _, params, _ in items]) or 0
+            except Exception as e:
+                print(f"[LOG QUEUE] Flush error: {e}")
+                written = 0
+            written_total += written
+            unwritten = items[written:]
+            if self._spill_rows(query, [params for _, params, _ in unwritten]):
+                spilled += len(unwritten)
+                continue
+            for q, params, attempts in unwritten:
+                if attempts + 1 < self.max_attempts:
+                    retry.append((q, params, attempts + 1))
+                else:
+                    dropped += 1
+
+        elapsed = time.perf_counter() - started
+        with self._cond:
+            # Failed rows go back to the front, still bounded by max_queue
+            for item in reversed(retry):
+                if len(self._queue) >= self.max_queue:
+                    dropped += 1
+                    continue
+                self._queue.appendleft(item)
+            self._stats['written'] += written_total
+            self._stats['failed'] += dropped
+            self._stats['spilled'] += spilled
+            self._stats['flushes'] += 1
+            self._stats['flush_time_total'] += elapsed
+            self._stats['flush_time_max'] = max(self._stats['flush_time_max'], elapsed)
+            self._stats['last_flush_ms'] = elapsed * 1000.0
+            self._flushing = False
+            self._cond.notify_all()
+        if dropped:
+            print(f"[LOG QUEUE] Gave up on {dropped} log rows after {self.max_attempts} attempts")
+        return written_total
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while (not self._closed and not self._flush_requested
+                       and len(self._queue) < self.batch_size):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._flush_requested = False
+                closing = self._closed
+            self._flush_once()
+            if closing:
+                with self._cond:
+                    if not self._queue or self._flush_failed_on_close():
+                        return
+
+    def _flush_failed_on_close(self):
+        # Rows still queued after a flush while closing are retries; stop once they have used their attempts
+        return all(attempts + 1 >= self.max_attempts for _, _, attempts in self._queue)
+
+    def flush(self, timeout=5.0):
+        """Ask the worker to write everything now and wait until the queue is empty"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._thread is None:
+                return not self._queue
+            self._flush_requested = True
+            self._cond.notify_all()
+            while (self._queue or self._flushing) and self._thread.is_alive():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return not self._queue
+
+    def close(self, timeout=5.0):
+        """Flush pending rows and stop the worker (call on application shutdown)"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            leftover = list(self._queue)
+            self._queue.clear()
+        if leftover:
+            grouped = {}
+            for query, params, _ in leftover:
+                grouped.setdefault(query, []).append(params)
+            for query, rows in grouped.items():
+                if self._spill_rows(query, rows):
+                    with self._cond:
+                        self._stats['spilled'] += len(rows)
+                    leftover = [item for item in leftover if item[0] != query]
+        leftover = len(leftover)
+        if leftover:
+            print(f"[LOG QUEUE] {leftover} log rows could not be written before shutdown")
+        return leftover == 0
+
+    def stats(self):
+        """Queue depth and flush counters (latencies in ms)"""
+        with self._cond:
+            flushes = self._stats['flushes']
+            return {
+                'depth': len(self._queue),
+                'max_depth': self._stats['max_depth'],
+                'enqueued': self._stats['enqueued'],
+                'written': self._stats['written'],
+                'dropped': self._stats['dropped'],
+                'failed': self._stats['failed'],
+                'sync_writes': self._stats['sync_writes'],
+                'spilled': self._stats['spilled'],
+                'flushes': flushes,
+                'last_flush_ms': self._stats['last_flush_ms'],
+                'avg_flush_ms': (self._stats['flush_time_total'] / flushes * 1000.0) if flushes else 0.0,
+                'max_flush_ms': self._stats['flush_time_max'] * 1000.0,
+            }
+
+
+def _spill_to_journal(query, rows):
+    from attendance_journal import attendance_journal
+    return attendance_journal.append_sql_rows(query, rows)
+
+
+# Shared instance for all log writers
+log_writer = WriteBehindLog(
+    batch_size=env_number('LOG_QUEUE_BATCH_SIZE', 200, int),
+    flush_interval=env_number('LOG_QUEUE_FLUSH_INTERVAL', 1.0),
+    max_queue=env_number('LOG_QUEUE_MAX_SIZE', 5000, int),
+    overflow=os.getenv('LOG_QUEUE_OVERFLOW', 'drop_oldest').strip().lower(),
+    block_timeout=env_number('LOG_QUEUE_BLOCK_TIMEOUT', 0.5),
+    spill=_spill_to_journal,
+)
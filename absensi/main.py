@@ -12,6 +12,15 @@ from simple_face_recognition import SimpleFaceRecognition
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 from backend_api import backend_api
+from log_writer import log_writer
+from attendance_journal import attendance_journal
+from schedule_index import schedule_index
+from checkin_index import checkin_index
+from recognition_worker import cooldown_from_env, pool_from_env
+from camera_pipeline import FrameSlot, pipeline_from_env
+from motion_gate import gate_from_env
+from env_config import env_number
+from quality_governor import governor_from_env
 from relay_control import activate_door, success_beep, denied_beep, cleanup_gpio
 
 class LoginWindow:
@@ -196,13 +205,27 @@ class FaceAttendanceApp:
         # Camera variables
         self.camera = None
         self.camera_running = False
+        self.camera_pipeline = None
         self.current_frame = None
+        # Reused per-frame buffers: raw camera frame, RGBA display frame wrapped by a
+        # PIL image (PIL only shares 4-byte-per-pixel buffers), and the PhotoImage the camera label shows (updated with paste())
+        self._raw_frame = None
+        self._display_rgba = None
+        self._display_image = None
+        self._display_photo = None
+        # Latest rendered RGBA frame; Tk pulls it every 1000 / CAMERA_PREVIEW_FPS ms,
+        # so frames rendered while the UI thread is busy replace each other instead of queuing
+        self.display_channel = FrameSlot()
+        self._display_seen = 0
+        self._display_poll_id = None
+        self.display_poll_ms = max(10, int(1000 / max(1.0, env_number('CAMERA_PREVIEW_FPS', 25))))
         
         # Get employee info for current user
         self.get_current_employee_info()
-        # Track last recognition trigger time per user to avoid spamming
-        self._last_recognition_trigger = {}
-        self._recognition_cooldown_sec = 3.0
+        # Per-user cooldown (expiring entries) to avoid spamming, and a fixed
+        # worker pool that coalesces queued events per user
+        self._recognition_cooldown = cooldown_from_env()
+        self.recognition_pool = pool_from_env(self._process_recognition_async)
         
         self.setup_ui()
         
@@ -223,6 +246,8 @@ class FaceAttendanceApp:
         # Create main notebook for tabs
         self.notebook = ttk.Notebook(self.window)
         self.notebook.pack(fill="both", expand=True, padx=10, pady=10)
+        # The camera preview is only rendered while the Absensi tab is showing
+        self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
         
         # Create tabs
         self.create_attendance_tab()
@@ -233,6 +258,7 @@ class FaceAttendanceApp:
         # Attendance tab
         attendance_frame = ctk.CTkFrame(self.notebook)
         self.notebook.add(attendance_frame, text="Absensi")
+        self.attendance_frame = attendance_frame
         
         # Left panel for camera
         left_panel = ctk.CTkFrame(attendance_frame)
@@ -266,6 +292,10 @@ class FaceAttendanceApp:
         )
         self.stop_camera_btn.pack(side="left", padx=5, pady=10)
         
+        # Per-stage throughput/latency of the camera pipeline
+        self.pipeline_status_label = ctk.CTkLabel(left_panel, text="", justify="left", anchor="w")
+        self.pipeline_status_label.pack(fill="x", padx=10, pady=(0, 10))
+        
         # Right panel for information
         right_panel = ctk.CTkFrame(attendance_frame)
         right_panel.pack(side="right", fill="y", padx=(5, 10), pady=10)
@@ -277,6 +307,9 @@ class FaceAttendanceApp:
         self.recognition_info = ctk.CTkTextbox(right_panel, width=300, height=200)
         self.recognition_info.pack(padx=10, pady=10)
         
+        self.recognition_queue_label = ctk.CTkLabel(right_panel, text="Antrian: 0", wraplength=300, justify="left")
+        self.recognition_queue_label.pack(padx=10)
+        
         # Today's attendance
         attendance_label = ctk.CTkLabel(right_panel, text="Absensi Hari Ini", font=ctk.CTkFont(size=16, weight="bold"))
         attendance_label.pack(pady=(20, 5))
@@ -817,6 +850,49 @@ class FaceAttendanceApp:
         )
         refresh_list_btn.pack(side="left", padx=10, pady=10)
         
+        # Today's access roster (rebuilt automatically at startup and midnight)
+        self.refresh_roster_btn = ctk.CTkButton(
+            mgmt_buttons_frame,
+            text="Refresh Roster",
+            command=self.refresh_roster,
+            width=150
+        )
+        self.refresh_roster_btn.pack(side="left", padx=10, pady=10)
+        
+        self.roster_status_label = ctk.CTkLabel(mgmt_buttons_frame, text="Roster: belum dibuat")
+        self.roster_status_label.pack(side="left", padx=10, pady=10)
+        
+    def refresh_roster(self):
+        """Rebuild today's access roster in the background"""
+        self.refresh_roster_btn.configure(state="disabled")
+        self.roster_status_label.configure(text="Roster: memuat...")
+        
+        def build():
+            success = schedule_index.build_roster()
+            self.window.after(0, lambda: self._roster_refreshed(success))
+        
+        threading.Thread(target=build, daemon=True).start()
+        
+    def _roster_refreshed(self, success):
+        self.refresh_roster_btn.configure(state="normal")
+        self.update_roster_status()
+        if success:
+            self.log_recognition("Roster akses hari ini berhasil diperbarui")
+        else:
+            messagebox.showerror("Error", "Gagal memperbarui roster akses")
+        
+    def update_roster_status(self):
+        """Show roster size and build time in the Manajemen tab"""
+        if not hasattr(self, 'roster_status_label'):
+            return
+        info = schedule_index.roster_info()
+        if not info:
+            self.roster_status_label.configure(text="Roster: belum dibuat")
+            return
+        self.roster_status_label.configure(
+            text=f"Roster {info['date']}: {info['users']} pengguna, {info['intervals']} jadwal "
+                 f"(dibuat {info['built_at'].strftime('%H:%M:%S')}, {info['build_ms']:.0f} ms)"
+        )
         
     def get_employee_list(self):
         """Get list of employees for dropdown"""
@@ -853,11 +929,23 @@ class FaceAttendanceApp:
             
             # Load face models
             self.face_system.load_all_face_models()
+            self.face_system.reset_tracking()
             
-            # Start camera thread
-            self.camera_thread = threading.Thread(target=self.camera_loop)
-            self.camera_thread.daemon = True
-            self.camera_thread.start()
+            # Start capture/detect/recognize/decide/display stages
+            self.camera_pipeline = pipeline_from_env(
+                self._read_camera_frame,
+                self.face_system.locate_faces,
+                self.face_system.recognize_faces,
+                self._decide_recognitions,
+                self._display_frame,
+                on_stopped=lambda: self.window.after(0, self.stop_camera),
+                gate=gate_from_env(),
+                grab_frame=self._grab_camera_frame,
+                governor=governor_from_env(self._apply_quality, on_change=self._quality_changed)
+            )
+            self.camera_pipeline.show_display(self._preview_visible())
+            self.camera_pipeline.start()
+            self._display_poll_id = self.window.after(self.display_poll_ms, self._poll_camera_display)
             
             self.log_recognition("Kamera dimulai, face recognition aktif")
             
@@ -867,9 +955,18 @@ class FaceAttendanceApp:
     def stop_camera(self):
         """Stop camera"""
         self.camera_running = False
+        # Let the stages finish before releasing the device they read from
+        if self.camera_pipeline is not None:
+            self.camera_pipeline.stop()
+            self.camera_pipeline = None
         if self.camera:
             self.camera.release()
             self.camera = None
+        if self._display_poll_id is not None:
+            self.window.after_cancel(self._display_poll_id)
+            self._display_poll_id = None
+        self._raw_frame = None
+        self._display_photo = None
         
         # Safe widget configuration with existence check
         try:
@@ -888,83 +985,140 @@ class FaceAttendanceApp:
             print(f"Error in stop_camera: {e}")
             # Widget might have been destroyed, just continue
         
-    def camera_loop(self):
-        """Main camera loop for face recognition"""
-        while self.camera_running:
-            try:
-                ret, frame = self.camera.read()
-                if not ret:
-                    break
-                    
-                # Resize frame for better performance
-                frame = cv2.resize(frame, (640, 480))
-                
-                # Face recognition
-                recognized_employees, face_locations = self.face_system.recognize_face(frame)
-                
-                # Draw rectangles and labels for each detected face
-                for i, (left, top, right, bottom) in enumerate(face_locations):
-                    # Draw rectangle around face
-                    cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-                    
-                    # If this face is recognized, show the name
-                    if i < len(recognized_employees) and recognized_employees[i] is not None:
-                        employee = recognized_employees[i]
-                        # Show only name and normalized confidence (remove raw distance display)
-                        cv2.putText(frame,
-                                  f"{employee['name']} ({employee['confidence']:.2f})", 
-                                  (left, top - 10), 
-                                  cv2.FONT_HERSHEY_SIMPLEX, 
-                                  0.7, (0, 255, 0), 2)
-                        
-                        # Auto-mark attendance if raw LBPH distance under threshold
-                        threshold = self.face_system.lbph_threshold if hasattr(self.face_system, 'lbph_threshold') else 65
-                        raw_conf = employee.get('raw_confidence', 1000)
-                        if raw_conf <= threshold:
-                            # Debounce per-employee to keep UI smooth
-                            eid = employee['employee_id']
-                            now_ts = time.time()
-                            last_ts = self._last_recognition_trigger.get(eid, 0)
-                            if now_ts - last_ts >= self._recognition_cooldown_sec:
-                                self._last_recognition_trigger[eid] = now_ts
-                                # Dispatch processing to background so drawing stays smooth
-                                threading.Thread(
-                                    target=self._process_recognition_async,
-                                    args=(eid, employee['name'], employee['confidence']),
-                                    daemon=True
-                                ).start()
-                    else:
-                        # Unknown face
-                        cv2.putText(frame, 
-                                  "Unknown", 
-                                  (left, top - 10), 
-                                  cv2.FONT_HERSHEY_SIMPLEX, 
-                                  0.7, (0, 0, 255), 2)
-                        
-                # Convert frame for tkinter display
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(frame_rgb)
-                img_tk = ImageTk.PhotoImage(img)
-                
-                # Update display
-                self.window.after(0, lambda: self.update_camera_display(img_tk))
-                
-                time.sleep(0.03)  # ~30 FPS
-                
-            except Exception as e:
-                print(f"Camera loop error: {e}")
-                break
+    def _read_camera_frame(self, out=None):
+        """Capture stage: next camera frame resized for processing into `out`, None when the camera fails"""
+        camera = self.camera
+        if camera is None:
+            return None
+        # Decode into the same raw buffer every frame
+        ret, frame = camera.read(self._raw_frame)
+        if not ret:
+            return None
+        self._raw_frame = frame
+        if out is not None and out.shape != (480, 640) + frame.shape[2:]:
+            out = None
+        # Resize frame for better performance
+        return cv2.resize(frame, (640, 480), dst=out)
+        
+    def _apply_quality(self, settings):
+        """Quality governor: detection settings live on the face system"""
+        self.face_system.detect_scale = settings['detect_scale']
+        if self.face_system.face_tracker is not None:
+            self.face_system.face_tracker.every = settings['track_every']
+        
+    def _quality_changed(self, old_level, new_level, settings, frame_cost):
+        direction = "diturunkan" if new_level > old_level else "dinaikkan"
+        message = (f"Kualitas {direction} ke level {new_level} (biaya {frame_cost:.0f} ms/frame): "
+                   f"skala deteksi {settings['detect_scale']:.2f}, deteksi penuh tiap {settings['track_every']} frame, "
+                   f"recognition tiap {settings['recognize_every']} frame, tampilan {settings['display_scale']:.0%}")
+        print(f"[QUALITY] {message}")
+        self.window.after(0, lambda: self.log_recognition(message))
+        
+    def _grab_camera_frame(self):
+        """Skip one camera frame without decoding it (idle throttling)"""
+        camera = self.camera
+        return camera is not None and camera.grab()
+        
+    def _decide_recognitions(self, recognized_employees):
+        """Decide stage: hand confidently recognized people to the access/attendance workers"""
+        # Auto-mark attendance if raw LBPH distance under threshold
+        threshold = self.face_system.lbph_threshold if hasattr(self.face_system, 'lbph_threshold') else 65
+        for employee in recognized_employees:
+            if employee is None or employee.get('raw_confidence', 1000) > threshold:
+                continue
+            # Tracked faces trigger once their identity is decided, then again after each
+            # cooldown until a check succeeds (a lost or failed check is retried)
+            if not employee.get('decided', True) or employee.get('settled'):
+                continue
+            # Debounce per-employee to keep UI smooth
+            eid = employee['employee_id']
+            if self._recognition_cooldown.try_acquire(eid):
+                # Dispatch processing to the worker pool so drawing stays smooth
+                self.recognition_pool.submit(eid, eid, employee['name'], employee['confidence'],
+                                             employee.get('track_id'))
+        
+    def _display_frame(self, frame, face_locations, recognized_employees):
+        """Display stage: draw the latest faces on the latest frame and publish it for Tk"""
+        # Draw rectangles and labels for each detected face
+        for i, (left, top, right, bottom) in enumerate(face_locations):
+            # Draw rectangle around face
+            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+            
+            # If this face is recognized, show the name
+            if i < len(recognized_employees) and recognized_employees[i] is not None:
+                employee = recognized_employees[i]
+                # Show only name and normalized confidence (remove raw distance display)
+                cv2.putText(frame,
+                          f"{employee['name']} ({employee['confidence']:.2f})", 
+                          (left, top - 10), 
+                          cv2.FONT_HERSHEY_SIMPLEX, 
+                          0.7, (0, 255, 0), 2)
+            else:
+                # Unknown face
+                cv2.putText(frame, 
+                          "Unknown", 
+                          (left, top - 10), 
+                          cv2.FONT_HERSHEY_SIMPLEX, 
+                          0.7, (0, 0, 255), 2)
                 
-    def update_camera_display(self, img_tk):
+        # Convert frame for tkinter display into the channel's spare buffer;
+        # only the newest frame is kept for Tk to pick up
+        rgba = self.display_channel.back_buffer()
+        if rgba is not None and rgba.shape != frame.shape[:2] + (4,):
+            rgba = None
+        rgba = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA, dst=rgba)
+        self.display_channel.publish(rgba, time.perf_counter())
+        
+    def _poll_camera_display(self):
+        """Tk side of the preview: show the newest rendered frame, if any, then reschedule"""
+        self._display_poll_id = None
+        if not self.camera_running:
+            return
+        try:
+            self.update_camera_display()
+        except Exception as e:
+            print(f"Error updating camera display: {e}")
+        self._display_poll_id = self.window.after(self.display_poll_ms, self._poll_camera_display)
+        
+    def update_camera_display(self):
         """Update camera display in GUI"""
-        self.camera_frame.configure(image=img_tk, text="")
-        self.camera_frame.image = img_tk  # Keep a reference
+        self._display_seen, rgba, _ = self.display_channel.copy_newer(self._display_seen, 0, self._display_rgba)
+        if rgba is None:
+            return
+        if rgba is not self._display_rgba:
+            # First frame or new size: wrap the new buffer once
+            self._display_rgba = rgba
+            height, width = rgba.shape[:2]
+            self._display_image = Image.frombuffer('RGBA', (width, height), rgba, 'raw', 'RGBA', 0, 1)
+        photo = self._display_photo
+        if photo is None or (photo.width(), photo.height()) != self._display_image.size:
+            # New size (first frame, or the display scale changed): new PhotoImage
+            photo = ImageTk.PhotoImage(self._display_image)
+            self._display_photo = photo
+            self.camera_frame.configure(image=photo, text="")
+            self.camera_frame.image = photo  # Keep a reference
+        else:
+            photo.paste(self._display_image)
+        
+    def _preview_visible(self):
+        try:
+            return self.notebook.select() == str(self.attendance_frame)
+        except Exception:
+            return True
+        
+    def _on_tab_changed(self, event=None):
+        """Stop rendering the preview while another tab is shown"""
+        if self.camera_pipeline is not None:
+            self.camera_pipeline.show_display(self._preview_visible())
 
-    def _process_recognition_async(self, employee_id, employee_name, confidence):
+    def _process_recognition_async(self, employee_id, employee_name, confidence, track_id=None):
         """Handle access verification and attendance in background to keep camera smooth."""
         try:
             access_result = self.verify_room_access_and_attendance(employee_id, employee_name, confidence)
             if access_result['success']:
+                if track_id is not None:
+                    # Done for this person while they stay tracked
+                    self.face_system.track_identities.settle(track_id, employee_id)
                 # Log clearer message and open door
                 reason = access_result.get('reason', f"Akses diberikan: {employee_name}")
                 self.window.after(0, lambda: self.log_recognition(f"✅ {reason}"))
@@ -1291,6 +1445,46 @@ class FaceAttendanceApp:
             print(f"Error refreshing models list: {e}")
             # Don't show error dialog, just log it
             
+    def _poll_roster_status(self):
+        """Keep the roster label current (builds happen on background threads)"""
+        try:
+            self.update_roster_status()
+        except Exception as e:
+            print(f"Error updating roster status: {e}")
+        self.window.after(60000, self._poll_roster_status)
+        
+    def update_recognition_queue_status(self):
+        """Show recognition queue depth and wait time under the recognition info"""
+        stats = self.recognition_pool.stats()
+        self.recognition_queue_label.configure(
+            text=f"Antrian: {stats['depth']} (diproses {stats['in_flight']}/{stats['workers']}) | "
+                 f"tunggu rata-rata {stats['avg_wait_ms']:.0f} ms, maks {stats['max_wait_ms']:.0f} ms | "
+                 f"digabung {stats['coalesced']}, dibuang {stats['dropped']}"
+        )
+        
+    def update_pipeline_status(self):
+        """Show per-stage throughput and latency of the running camera pipeline"""
+        if self.camera_pipeline is None:
+            self.pipeline_status_label.configure(text="")
+            return
+        stats = self.camera_pipeline.stats()
+        idle = "idle  " if stats['capture']['idle'] else ""
+        if 'quality' in stats:
+            idle += f"L{stats['quality']['level']} ({stats['quality']['frame_cost_ms']:.0f}/{stats['quality']['budget_ms']:.0f} ms)  "
+        self.pipeline_status_label.configure(text=idle + "  ".join(
+            f"{stage}: {stats[stage]['fps']:.1f} fps, {stats[stage]['avg_ms']:.0f} ms"
+            for stage in ('capture', 'detect', 'recognize', 'display')
+        ) + f"  | umur frame {stats['recognize']['avg_age_ms']:.0f} ms"
+          f"  | identitas dari cache {self.face_system.track_identities.stats()['cache_rate']:.0%}")
+        
+    def _poll_recognition_status(self):
+        try:
+            self.update_recognition_queue_status()
+            self.update_pipeline_status()
+        except Exception as e:
+            print(f"Error updating recognition status: {e}")
+        self.window.after(1000, self._poll_recognition_status)
+        
     def run(self):
         # Initialize data
         try:
@@ -1299,15 +1493,20 @@ class FaceAttendanceApp:
         except Exception as e:
             print(f"Error during initialization: {e}")
         
+        # Replay attendance/log events journaled while MySQL was unreachable
+        attendance_journal.start()
+        
+        # Build today's access roster now and at every midnight
+        schedule_index.start_daily_roster()
+        # Load today's check-ins so repeat door events skip the duplicate check
+        threading.Thread(target=checkin_index.warm, daemon=True).start()
+        self.window.after(2000, self._poll_roster_status)
+        self.window.after(1000, self._poll_recognition_status)
+        
         # Set up proper cleanup on window close
         def on_closing():
             try:
-                if hasattr(self, 'camera_running') and self.camera_running:
-                    self.stop_camera()
-                # Cleanup GPIO resources
-                cleanup_gpio()
-            except Exception as e:
-                print(f"Error during cleanup: {e}")
+                self._shutdown()
             finally:
                 try:
                     self.window.destroy()
@@ -1322,14 +1521,32 @@ class FaceAttendanceApp:
         except Exception as e:
             print(f"Error in main loop: {e}")
         finally:
-            # Final cleanup
+            # Final cleanup (no-op if on_closing already ran)
+            self._shutdown()
+    
+    def _shutdown(self):
+        """Stop the camera and background workers and close connections, once"""
+        if getattr(self, '_shut_down', False):
+            return
+        self._shut_down = True
+        steps = (
+            ('camera', lambda: self.camera_running and self.stop_camera()),
+            # Cleanup GPIO resources
+            ('gpio', cleanup_gpio),
+            ('schedule index', schedule_index.stop),
+            ('recognition pool', self.recognition_pool.close),
+            # Door events not yet posted fall back to the DB log queue, so flush them first
+            ('backend api', backend_api.close),
+            # Write out queued log rows (unwritten ones go to the journal), then close connections
+            ('log writer', log_writer.close),
+            ('attendance journal', attendance_journal.close),
+            ('database', simple_db.close),
+        )
+        for name, step in steps:
             try:
-                if hasattr(self, 'camera_running') and self.camera_running:
-                    self.stop_camera()
-                # Cleanup GPIO resources
-                cleanup_gpio()
+                step()
             except Exception as e:
-                print(f"Error in final cleanup: {e}")
+                print(f"Error during cleanup ({name}): {e}")
 
 def main():
     # First show login window
@@ -0,0 +1,111 @@
+"""
+Motion gate for the attendance camera
+Compares each frame with the previous one on a small blurred grey copy
+(scale_width pixels wide). If fewer than min_changed of the pixels moved by
+more than pixel_threshold grey levels, the frame is "quiet" and face
+detection can be skipped. After idle_after seconds without motion the gate
+reports idle, and the capture stage drops to idle_fps until motion is seen
+again; wake-up latency is therefore at most one idle frame (1 / idle_fps).
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from env_config import env_number
+
+
+class MotionGate:
+    def __init__(self, pixel_threshold=25, min_changed=0.005, scale_width=160,
+                 idle_after=10.0, idle_fps=2.0):
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.scale_width = max(16, int(scale_width))
+        self.idle_after = idle_after
+        self.idle_fps = max(0.1, float(idle_fps))
+        self._lock = threading.Lock()
+        self._previous = None
+        self._current = None
+        self._buffers = {}   # reused per-frame arrays, keyed by name
+        self._last_motion = time.monotonic()
+        self.frames = 0
+        self.motion_frames = 0
+        self.last_changed = 0.0
+
+    def _buffer(self, name, shape):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, np.uint8)
+        return buffer
+
+    def _small_gray(self, frame, out):
+        height, width = frame.shape[:2]
+        size = (self.scale_width, max(1, height * self.scale_width // width))
+        shape = (size[1], size[0])
+        small = cv2.resize(frame, size, dst=self._buffer('small', shape + frame.shape[2:]),
+                           interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self._buffer('gray', shape))
+        if out is None or out.shape != shape:
+            out = np.empty(shape, np.uint8)
+        return cv2.GaussianBlur(small, (5, 5), 0, dst=out)
+
+    def update(self, frame, now=None):
+        """True if this frame differs enough from the previous one"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            # The two blurred frames swap roles instead of being reallocated
+            small = self._small_gray(frame, self._current)
+            previous, self._previous, self._current = self._previous, small, self._previous
+            self.frames += 1
+            if previous is None or previous.shape != small.shape:
+                self._last_motion = now
+                self.motion_frames += 1
+                return True
+            diff = cv2.absdiff(small, previous, dst=self._buffer('diff', small.shape))
+            _, mask = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=diff)
+            self.last_changed = cv2.countNonZero(mask) / mask.size
+            if self.last_changed >= self.min_changed:
+                self._last_motion = now
+                self.motion_frames += 1
+                return True
+            return False
+
+    def wake(self, now=None):
+        """Treat now as motion (e.g. a face is still being tracked)"""
+        with self._lock:
+            self._last_motion = time.monotonic() if now is None else now
+
+    def idle(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return now - self._last_motion >= self.idle_after
+
+    def reset(self):
+        with self._lock:
+            self._previous = self._current = None
+            self._last_motion = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'frames': self.frames,
+                'motion_frames': self.motion_frames,
+                'changed': self.last_changed,
+                'idle': time.monotonic() - self._last_motion >= self.idle_after,
+            }
+
+
+def gate_from_env():
+    """MotionGate configured from MOTION_* variables, or None if MOTION_GATE=0"""
+    if os.getenv('MOTION_GATE', '1').strip().lower() in ('0', 'false', 'no'):
+        return None
+    return MotionGate(
+        pixel_threshold=env_number('MOTION_PIXEL_THRESHOLD', 25, int),
+        min_changed=env_number('MOTION_MIN_CHANGED', 0.005),
+        scale_width=env_number('MOTION_SCALE_WIDTH', 160, int),
+        idle_after=env_number('MOTION_IDLE_AFTER', 10.0),
+        idle_fps=env_number('MOTION_IDLE_FPS', 2.0),
+    )
@@ -0,0 +1,154 @@
+"""
+Adaptive quality governor for the camera pipeline
+Keeps the per-frame cost inside a budget of 1000 / QUALITY_TARGET_FPS ms,
+or QUALITY_BUDGET_MS if set, by stepping through LEVELS from best quality
+to cheapest. The cost is smoothed detect time plus recognize time divided
+by recognize_every (recognition only runs on sampled frames). Each level sets the detection
+scale, the full-detection interval of the face tracker, how often tracked
+faces go through recognition, and the display resolution.
+
+Changes are damped: the governor steps down only after `degrade_after`
+consecutive samples above budget * high, steps up only after `upgrade_after`
+consecutive samples below budget * low, and holds a new level for `min_dwell`
+seconds before counting again. The smoothed cost carries over a level change
+(it converges on the new level's cost during the dwell) rather than
+restarting from a single sample.
+
+Detection settings the operator set (FACE_DETECT_SCALE, FACE_TRACK_EVERY)
+become level 0, the governor starts there, and no level uses a larger
+detection scale or a shorter tracking interval than those.
+"""
+import os
+import threading
+import time
+
+from env_config import env_number
+
+LEVELS = (
+    {'detect_scale': 0.75, 'track_every': 3, 'recognize_every': 1, 'display_scale': 1.0},
+    {'detect_scale': 0.5, 'track_every': 5, 'recognize_every': 1, 'display_scale': 1.0},
+    {'detect_scale': 0.5, 'track_every': 8, 'recognize_every': 2, 'display_scale': 0.75},
+    {'detect_scale': 0.4, 'track_every': 10, 'recognize_every': 3, 'display_scale': 0.5},
+    {'detect_scale': 0.33, 'track_every': 15, 'recognize_every': 4, 'display_scale': 0.5},
+)
+
+
+class QualityGovernor:
+    """observe(stage, ms) from the pipeline; apply(settings) is called on every level change"""
+
+    def __init__(self, apply, budget_ms=66.0, start_level=1, high=1.0, low=0.6,
+                 degrade_after=10, upgrade_after=60, min_dwell=3.0, smoothing=0.2,
+                 on_change=None, levels=LEVELS):
+        self._apply = apply
+        self._on_change = on_change
+        self.levels = levels
+        self.budget_ms = budget_ms
+        self.high = high
+        self.low = low
+        self.degrade_after = max(1, int(degrade_after))
+        self.upgrade_after = max(1, int(upgrade_after))
+        self.min_dwell = min_dwell
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._cost = {}      # stage -> smoothed ms
+        self._over = 0
+        self._under = 0
+        self._changed_at = 0.0
+        self.changes = 0
+        self.level = min(max(0, int(start_level)), len(levels) - 1)
+        self._apply(dict(self.levels[self.level]))
+
+    @property
+    def settings(self):
+        """Current level's settings (read without locking by the pipeline stages)"""
+        return self.levels[self.level]
+
+    def frame_cost(self):
+        with self._lock:
+            return sum(self._cost.values())
+
+    def observe(self, stage, ms, now=None):
+        """Record one processing time for `stage` and adjust the level if needed"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            previous = self._cost.get(stage)
+            self._cost[stage] = ms if previous is None else previous + self.smoothing * (ms - previous)
+            cost = sum(self._cost.values())
+            if now - self._changed_at < self.min_dwell:
+                # Let the smoothed cost settle at the new level before judging it
+                return
+            if cost > self.budget_ms * self.high:
+                self._over += 1
+                self._under = 0
+            elif cost < self.budget_ms * self.low:
+                self._under += 1
+                self._over = 0
+            else:
+                self._over = self._under = 0
+
+            step = 0
+            if self._over >= self.degrade_after and self.level < len(self.levels) - 1:
+                step = 1
+            elif self._under >= self.upgrade_after and self.level > 0:
+                step = -1
+            if not step:
+                return
+            old = self.level
+            self.level += step
+            self._over = self._under = 0
+            self._changed_at = now
+            self.changes += 1
+            settings = dict(self.levels[self.level])
+            new = self.level
+        self._apply(settings)
+        if self._on_change:
+            self._on_change(old, new, settings, cost)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'level': self.level,
+                'levels': len(self.levels),
+                'budget_ms': self.budget_ms,
+                'frame_cost_ms': sum(self._cost.values()),
+                'changes': self.changes,
+                **self.levels[self.level],
+            }
+
+
+def capped_levels(levels, detect_scale=None, track_every=None):
+    """levels with level 0 set to the operator's detection settings and no level above them"""
+    capped = []
+    for index, level in enumerate(levels):
+        level = dict(level)
+        if detect_scale is not None:
+            level['detect_scale'] = detect_scale if index == 0 else min(level['detect_scale'], detect_scale)
+        if track_every is not None:
+            level['track_every'] = track_every if index == 0 else max(level['track_every'], track_every)
+        capped.append(level)
+    return tuple(capped)
+
+
+def governor_from_env(apply, on_change=None):
+    """QualityGovernor configured from QUALITY_* variables, or None if QUALITY_GOVERNOR=0"""
+    if os.getenv('QUALITY_GOVERNOR', '1').strip().lower() in ('0', 'false', 'no'):
+        return None
+    budget = env_number('QUALITY_BUDGET_MS', 0.0)
+    if budget <= 0:
+        budget = 1000.0 / max(1.0, env_number('QUALITY_TARGET_FPS', 15.0))
+    # Explicit detection settings are the best quality the governor may use
+    detect_scale = env_number('FACE_DETECT_SCALE', 0.5) if os.getenv('FACE_DETECT_SCALE') else None
+    track_every = env_number('FACE_TRACK_EVERY', 5, int) if os.getenv('FACE_TRACK_EVERY') else None
+    if detect_scale is not None:
+        detect_scale = min(1.0, max(0.1, detect_scale))
+    operator_set = detect_scale is not None or track_every is not None
+    return QualityGovernor(
+        apply,
+        budget_ms=budget,
+        levels=capped_levels(LEVELS, detect_scale, track_every),
+        start_level=env_number('QUALITY_START_LEVEL', 0 if operator_set else 1, int),
+        degrade_after=env_number('QUALITY_DEGRADE_AFTER', 10, int),
+        upgrade_after=env_number('QUALITY_UPGRADE_AFTER', 60, int),
+        min_dwell=env_number('QUALITY_MIN_DWELL', 3.0),
+        on_change=on_change,
+    )
@@ -0,0 +1,194 @@
+"""
+Bounded worker pool for recognition events
+The camera loop hands recognized faces to a fixed number of worker threads
+instead of starting a thread per recognition. Pending events are keyed by
+employee: a newer event for someone already waiting replaces the queued one
+rather than adding a second access check. When the queue is full the
+configured policy applies:
+
+    drop_oldest  evict the longest-waiting event (default; keeps the doorway current)
+    drop_newest  refuse the new event
+    block        wait up to block_timeout for a free slot, then refuse
+
+The per-employee cooldown lives in CooldownMap, which forgets entries once
+their TTL has passed so it stays bounded by the number of recent faces.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from env_config import env_number
+
+POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+
+class CooldownMap:
+    """key -> last trigger time, with entries expiring after ttl seconds"""
+
+    def __init__(self, ttl, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max(1, int(max_size))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # oldest trigger first
+
+    def _prune(self, now):
+        while self._entries:
+            key, stamp = next(iter(self._entries.items()))
+            if now - stamp < self.ttl and len(self._entries) <= self.max_size:
+                break
+            self._entries.popitem(last=False)
+
+    def try_acquire(self, key, now=None):
+        """True (and start a new cooldown) if key is not cooling down"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._prune(now)
+            if key in self._entries:
+                return False
+            self._entries[key] = now
+            self._prune(now)
+            return True
+
+    def __len__(self):
+        with self._lock:
+            self._prune(time.monotonic())
+            return len(self._entries)
+
+
+class RecognitionPool:
+    """Fixed worker threads draining a bounded, per-key coalescing queue"""
+
+    def __init__(self, handler, workers=2, max_queue=16, policy='drop_oldest', block_timeout=0.05,
+                 name='recognition'):
+        if policy not in POLICIES:
+            print(f"[RECOGNITION POOL] Unknown policy {policy!r}, using drop_oldest")
+            policy = 'drop_oldest'
+        self._handler = handler
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.name = name
+
+        self._pending = OrderedDict()   # key -> (args, enqueued_at), oldest first
+        self._cond = threading.Condition()
+        self._threads = []
+        self._in_flight = 0
+        self._closed = False
+        self._stats = {
+            'submitted': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'processed': 0,
+            'errors': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+        }
+
+    def _start_workers(self):
+        """Start the worker threads on first use (caller holds the lock)"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, *args):
+        """Queue handler(*args) for key; returns False if the event was dropped"""
+        with self._cond:
+            if self._closed:
+                return False
+            self._stats['submitted'] += 1
+            if key in self._pending:
+                # Same person still waiting: keep their place, use the newest data
+                self._pending[key] = (args, self._pending[key][1])
+                self._stats['coalesced'] += 1
+                return True
+            if len(self._pending) >= self.max_queue:
+                if self.policy == 'drop_oldest':
+                    self._pending.popitem(last=False)
+                    self._stats['dropped'] += 1
+                elif self.policy == 'block':
+                    self._cond.wait_for(lambda: self._closed or len(self._pending) < self.max_queue,
+                                        self.block_timeout)
+                if self._closed or len(self._pending) >= self.max_queue:
+                    self._stats['dropped'] += 1
+                    return False
+            self._pending[key] = (args, time.monotonic())
+            self._start_workers()
+            self._cond.notify()
+            return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or self._pending)
+                if self._closed and not self._pending:
+                    return
+                key, (args, enqueued_at) = self._pending.popitem(last=False)
+                waited = time.monotonic() - enqueued_at
+                self._stats['wait_total'] += waited
+                self._stats['wait_max'] = max(self._stats['wait_max'], waited)
+                self._in_flight += 1
+                # A slot opened up for a blocked submitter
+                self._cond.notify_all()
+            try:
+                self._handler(*args)
+            except Exception as e:
+                print(f"[RECOGNITION POOL] Handler error for {key}: {e}")
+                with self._cond:
+                    self._stats['errors'] += 1
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._stats['processed'] += 1
+
+    def close(self, timeout=2.0, drain=False):
+        """Stop the workers; queued events are discarded unless drain=True"""
+        with self._cond:
+            if not drain:
+                self._stats['dropped'] += len(self._pending)
+                self._pending.clear()
+            self._closed = True
+            self._cond.notify_all()
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            processed = self._stats['processed']
+            oldest = next(iter(self._pending.values()))[1] if self._pending else None
+            return {
+                'depth': len(self._pending),
+                'in_flight': self._in_flight,
+                'workers': self.workers,
+                'submitted': self._stats['submitted'],
+                'coalesced': self._stats['coalesced'],
+                'dropped': self._stats['dropped'],
+                'processed': processed,
+                'errors': self._stats['errors'],
+                'avg_wait_ms': (self._stats['wait_total'] / processed * 1000.0) if processed else 0.0,
+                'max_wait_ms': self._stats['wait_max'] * 1000.0,
+                'oldest_wait_ms': (now - oldest) * 1000.0 if oldest is not None else 0.0,
+            }
+
+
+def pool_from_env(handler):
+    return RecognitionPool(
+        handler,
+        workers=env_number('RECOGNITION_WORKERS', 2, int),
+        max_queue=env_number('RECOGNITION_QUEUE_SIZE', 16, int),
+        policy=os.getenv('RECOGNITION_QUEUE_POLICY', 'drop_oldest'),
+        block_timeout=env_number('RECOGNITION_QUEUE_BLOCK_TIMEOUT', 0.05),
+    )
+
+
+def cooldown_from_env():
+    return CooldownMap(
+        ttl=env_number('RECOGNITION_COOLDOWN_SEC', 3.0),
+        max_size=env_number('RECOGNITION_COOLDOWN_MAX', 1024, int),
+    )
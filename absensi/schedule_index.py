@@ -0,0 +1,591 @@
+"""
+In-memory schedule index for room access checks
+Class schedules and enrolments are loaded once, with day names normalised and
+times parsed, into per-user, per-weekday interval lists sorted by start time.
+An access check is then a dict lookup plus a bisect with no SQL.
+
+start_daily_roster() additionally materializes "today's roster" (user_id ->
+today's windows) at startup and every midnight; while it is current, checks
+never touch MySQL, not even for unknown users.
+
+The index refreshes incrementally: new enrolment rows are picked up by id,
+dropped enrolments by diffing the ids of active enrolments, and lecturer
+reassignments from a (class id, lecturer id) scan of the classes table; a
+class that was added or deactivated triggers a full rebuild. Users missing
+from the index are looked up on demand (rate limited), and a full rebuild
+also runs in the background every SCHEDULE_INDEX_FULL_REFRESH seconds to
+catch schedule edits.
+"""
+import json
+import threading
+import time
+from bisect import bisect_right
+from datetime import date, datetime, timedelta, time as dt_time
+
+from env_config import env_number
+
+
+# English and Indonesian day names -> datetime.weekday()
+DAY_NUMBERS = {
+    'monday': 0, 'senin': 0,
+    'tuesday': 1, 'selasa': 1,
+    'wednesday': 2, 'rabu': 2,
+    'thursday': 3, 'kamis': 3,
+    'friday': 4, 'jumat': 4, 'jum’at': 4, "jum'at": 4,
+    'saturday': 5, 'sabtu': 5,
+    'sunday': 6, 'minggu': 6,
+}
+
+CLASS_QUERY = """
+SELECT cc.id as class_id, cc.class_name, cc.schedule, cc.lecturer_id,
+       c.course_name, c.course_code
+FROM course_classes cc
+JOIN courses c ON cc.course_id = c.id
+WHERE cc.status IN ('active','ongoing')
+"""
+
+ENROLLMENT_QUERY = """
+SELECT se.id, se.student_id, se.class_id
+FROM student_enrollments se
+WHERE se.status IN ('enrolled','active') AND se.id > %s
+ORDER BY se.id
+"""
+
+ACTIVE_ENROLLMENT_IDS_QUERY = """
+SELECT se.id
+FROM student_enrollments se
+WHERE se.status IN ('enrolled','active')
+"""
+
+CLASS_LECTURER_QUERY = """
+SELECT cc.id as class_id, cc.lecturer_id
+FROM course_classes cc
+WHERE cc.status IN ('active','ongoing')
+"""
+
+USER_ENROLLMENT_QUERY = """
+SELECT se.class_id
+FROM student_enrollments se
+JOIN course_classes cc ON cc.id = se.class_id
+WHERE se.student_id = %s
+  AND cc.status IN ('active','ongoing')
+  AND se.status IN ('enrolled','active')
+"""
+
+
+def normalize_day(name):
+    """Weekday number (Monday=0) for an English or Indonesian day name, or None"""
+    return DAY_NUMBERS.get(str(name or '').strip().lower())
+
+
+def parse_minutes(value):
+    """'HH:MM' or 'HH:MM:SS' -> minutes since midnight, or None"""
+    try:
+        parts = str(value).strip().split(':')
+        hours, minutes = int(parts[0]), int(parts[1])
+    except (ValueError, IndexError):
+        return None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        return None
+    return hours * 60 + minutes
+
+
+def parse_schedule(raw):
+    """Decode course_classes.schedule, which may be JSON-encoded twice"""
+    schedule = raw
+    try:
+        if isinstance(schedule, (bytes, bytearray)):
+            schedule = schedule.decode('utf-8')
+        if isinstance(schedule, str):
+            schedule = json.loads(schedule)
+            if isinstance(schedule, str):
+                schedule = json.loads(schedule)
+    except (ValueError, UnicodeDecodeError):
+        return []
+    return schedule if isinstance(schedule, list) else []
+
+
+def compile_slots(raw_schedule):
+    """Schedule JSON -> list of (weekday, start_min, end_min, day_label, start_str, end_str)"""
+    slots = []
+    for slot in parse_schedule(raw_schedule):
+        if not isinstance(slot, dict):
+            continue
+        day_label = slot.get('day') or slot.get('day_of_week') or ''
+        weekday = normalize_day(day_label)
+        start_str = str(slot.get('start_time', '')).strip()
+        end_str = str(slot.get('end_time', '')).strip()
+        start, end = parse_minutes(start_str), parse_minutes(end_str)
+        if weekday is None or start is None or end is None:
+            print(f"[SCHEDULE INDEX] Skipping invalid slot: {slot}")
+            continue
+        slots.append((weekday, start, end, day_label, start_str, end_str))
+    return slots
+
+
+class ScheduleIndex:
+    """user_id -> weekday -> intervals sorted by start, for access decisions without SQL"""
+
+    def __init__(self, full_refresh_interval=3600.0, incremental_interval=60.0, miss_refresh_interval=60.0):
+        self.full_refresh_interval = full_refresh_interval
+        self.incremental_interval = incremental_interval
+        self.miss_refresh_interval = miss_refresh_interval
+
+        self._lock = threading.RLock()
+        self._refreshing = threading.Lock()
+        self._loaded = False
+        self._classes = {}     # class_id -> {'class_id', 'class_name', 'course_name', 'course_code', 'slots'}
+        self._enrolled = {}    # user_id -> set(class_id)
+        self._lecturing = {}   # user_id -> set(class_id)
+        self._compiled = {}    # user_id -> {weekday: (starts, intervals)}
+        self._enrollments = {}  # enrolment id -> (student_id, class_id), active rows only
+        self._max_enrollment_id = 0
+        self._last_full = 0.0
+        self._last_incremental = 0.0
+        self._miss_checked = {}  # user_id -> monotonic time of last on-demand lookup
+
+        self._roster = None      # {'date', 'classes', 'users', 'windows': user_id -> (starts, intervals)}
+        self._roster_info = None
+        self._roster_building = threading.Lock()
+        self._midnight_timer = None
+        self._listeners = []
+
+    # ------------------------------------------------------------------ build
+
+    def add_change_listener(self, callback):
+        """callback(user_ids) after data changes; user_ids is None when everything may have changed"""
+        self._listeners.append(callback)
+
+    def _notify(self, user_ids=None):
+        for callback in list(self._listeners):
+            try:
+                callback(user_ids)
+            except Exception as e:
+                print(f"[SCHEDULE INDEX] Change listener error: {e}")
+
+    def _class_entry(self, row):
+        return {
+            'class_id': row['class_id'],
+            'class_name': row['class_name'],
+            'course_name': row['course_name'],
+            'course_code': row['course_code'],
+            'slots': compile_slots(row.get('schedule')),
+        }
+
+    def _compile_user(self, user_id):
+        """Rebuild one user's per-weekday intervals (caller holds the lock)"""
+        # Same precedence as the SQL check: enrolled classes, else classes the user lectures
+        class_ids = self._enrolled.get(user_id) or self._lecturing.get(user_id) or set()
+        days = {}
+        for class_id in sorted(class_ids):
+            cls = self._classes.get(class_id)
+            if not cls:
+                continue
+            for order, (weekday, start, end, day_label, start_str, end_str) in enumerate(cls['slots']):
+                days.setdefault(weekday, []).append((start, end, class_id, order, day_label, start_str, end_str))
+        compiled = {}
+        for weekday, intervals in days.items():
+            intervals.sort()
+            compiled[weekday] = ([interval[0] for interval in intervals], intervals)
+        if class_ids:
+            self._compiled[user_id] = compiled
+        else:
+            self._compiled.pop(user_id, None)
+
+        roster = self._roster
+        if roster is not None and roster['classes'] is self._classes:
+            weekday = roster['date'].weekday()
+            users = set(roster['users'])
+            windows = dict(roster['windows'])
+            if class_ids:
+                users.add(user_id)
+            else:
+                users.discard(user_id)
+            if weekday in compiled:
+                windows[user_id] = compiled[weekday]
+            else:
+                windows.pop(user_id, None)
+            # Swap in a new snapshot so lock-free readers never see a half-updated roster
+            self._roster = dict(roster, users=frozenset(users), windows=windows)
+
+    def load(self):
+        """Full (re)build from MySQL; returns False if the database could not be read"""
+        from simple_database import simple_db
+
+        started = time.perf_counter()
+        class_rows = simple_db.execute_query(CLASS_QUERY)
+        enrollment_rows = simple_db.execute_query(ENROLLMENT_QUERY, (0,))
+        if class_rows is None or enrollment_rows is None:
+            print("[SCHEDULE INDEX] Load failed, keeping previous index")
+            return False
+
+        classes = {row['class_id']: self._class_entry(row) for row in class_rows}
+        enrolled, lecturing = {}, {}
+        enrollments = {}
+        max_id = 0
+        for row in enrollment_rows:
+            max_id = max(max_id, row['id'])
+            enrollments[row['id']] = (row['student_id'], row['class_id'])
+            if row['class_id'] in classes:
+                enrolled.setdefault(row['student_id'], set()).add(row['class_id'])
+        for row in class_rows:
+            if row.get('lecturer_id'):
+                lecturing.setdefault(row['lecturer_id'], set()).add(row['class_id'])
+
+        with self._lock:
+            self._classes = classes
+            self._enrolled = enrolled
+            self._lecturing = lecturing
+            self._enrollments = enrollments
+            self._compiled = {}
+            for user_id in set(enrolled) | set(lecturing):
+                self._compile_user(user_id)
+            self._max_enrollment_id = max_id
+            self._miss_checked = {}
+            self._loaded = True
+            self._last_full = self._last_incremental = time.monotonic()
+            users = len(self._compiled)
+            if self._roster is not None:
+                self._materialize_roster(self._roster['date'])
+
+        self._notify(None)
+        elapsed = (time.perf_counter() - started) * 1000.0
+        print(f"[SCHEDULE INDEX] Loaded {len(classes)} classes for {users} users in {elapsed:.1f} ms")
+        return True
+
+    def refresh_new_enrollments(self):
+        """Incremental refresh: apply new and dropped enrolments and lecturer changes"""
+        from simple_database import simple_db
+
+        with self._lock:
+            since = self._max_enrollment_id
+        rows = simple_db.execute_query(ENROLLMENT_QUERY, (since,))
+        active_rows = simple_db.execute_query(ACTIVE_ENROLLMENT_IDS_QUERY)
+        lecturer_rows = simple_db.execute_query(CLASS_LECTURER_QUERY)
+        if rows is None or active_rows is None or lecturer_rows is None:
+            return False
+        with self._lock:
+            classes_changed = {row['class_id'] for row in lecturer_rows} != set(self._classes)
+        if classes_changed:
+            # Classes were added or deactivated: their schedules need the full load
+            return self.load()
+        with self._lock:
+            touched = set()
+            for row in rows:
+                self._max_enrollment_id = max(self._max_enrollment_id, row['id'])
+                self._enrollments[row['id']] = (row['student_id'], row['class_id'])
+                if row['class_id'] in self._classes:
+                    self._enrolled.setdefault(row['student_id'], set()).add(row['class_id'])
+                    touched.add(row['student_id'])
+
+            active_ids = {row['id'] for row in active_rows}
+            dropped = [enrollment_id for enrollment_id in self._enrollments if enrollment_id not in active_ids]
+            for enrollment_id in dropped:
+                self._enrollments.pop(enrollment_id)
+            if dropped:
+                # Rebuild the affected users' class sets from the rows still active
+                remaining = {}
+                for student_id, class_id in self._enrollments.values():
+                    if class_id in self._classes:
+                        remaining.setdefault(student_id, set()).add(class_id)
+                for user_id in set(self._enrolled) - set(remaining):
+                    self._enrolled.pop(user_id)
+                    touched.add(user_id)
+                for user_id, class_ids in remaining.items():
+                    if self._enrolled.get(user_id) != class_ids:
+                        self._enrolled[user_id] = class_ids
+                        touched.add(user_id)
+
+            lecturing = {}
+            for row in lecturer_rows:
+                if row.get('lecturer_id'):
+                    lecturing.setdefault(row['lecturer_id'], set()).add(row['class_id'])
+            for user_id in set(lecturing) | set(self._lecturing):
+                if lecturing.get(user_id) != self._lecturing.get(user_id):
+                    touched.add(user_id)
+            self._lecturing = lecturing
+
+            for user_id in touched:
+                self._compile_user(user_id)
+            self._last_incremental = time.monotonic()
+        if touched:
+            self._notify(touched)
+        if rows or dropped:
+            print(f"[SCHEDULE INDEX] Applied {len(rows)} new and {len(dropped)} dropped enrolments")
+        return True
+
+    def refresh_user(self, user_id):
+        """Reload one user's enrolments (e.g. after an enrolment change)"""
+        from simple_database import simple_db
+
+        rows = simple_db.execute_query(USER_ENROLLMENT_QUERY, (user_id,))
+        if rows is None:
+            return False
+        with self._lock:
+            class_ids = {row['class_id'] for row in rows if row['class_id'] in self._classes}
+            if class_ids:
+                self._enrolled[user_id] = class_ids
+            else:
+                self._enrolled.pop(user_id, None)
+            self._compile_user(user_id)
+            self._miss_checked[user_id] = time.monotonic()
+        self._notify([user_id])
+        return True
+
+    def _refresh_in_background(self, full):
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                if full:
+                    self.load()
+                else:
+                    self.refresh_new_enrollments()
+            except Exception as e:
+                print(f"[SCHEDULE INDEX] Refresh error: {e}")
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, name='schedule-index-refresh', daemon=True).start()
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now - self._last_full >= self.full_refresh_interval:
+            self._refresh_in_background(full=True)
+        elif now - self._last_incremental >= self.incremental_interval:
+            self._refresh_in_background(full=False)
+
+    # ------------------------------------------------------------------ query
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def windows_for(self, user_id, weekday):
+        """Sorted (start_min, end_min, class_id, ...) intervals for user_id on weekday"""
+        with self._lock:
+            compiled = self._compiled.get(user_id)
+            if not compiled or weekday not in compiled:
+                return []
+            return list(compiled[weekday][1])
+
+    def class_info(self, class_id):
+        """{'class_id', 'class_name', 'course_name', 'course_code'} for a known class, else None"""
+        with self._lock:
+            cls = self._classes.get(class_id)
+            if cls is None:
+                return None
+            return {key: cls[key] for key in ('class_id', 'class_name', 'course_name', 'course_code')}
+
+    def next_boundary(self, user_id, now=None):
+        """First slot start or end after now for user_id (next midnight if none is left today).
+
+        Decisions for the user cannot change before this instant unless the
+        schedule data itself changes (see add_change_listener).
+        """
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        roster = self._roster
+        if roster is not None and roster['date'] == now.date():
+            day_windows = roster['windows'].get(user_id)
+            intervals = day_windows[1] if day_windows else ()
+        else:
+            intervals = self.windows_for(user_id, now.weekday())
+
+        boundary = 24 * 60
+        for start, end, *_ in intervals:
+            # A slot covers its start minute through its end minute inclusive
+            for edge in (start, end + 1):
+                if minute < edge < boundary:
+                    boundary = edge
+        return datetime.combine(now.date(), dt_time.min) + timedelta(minutes=boundary)
+
+    def _decide(self, user_id, classes, day_windows, minute):
+        """Access dict from one user's (starts, intervals) for the day"""
+        matches = []
+        if day_windows:
+            starts, intervals = day_windows
+            # Every interval starting at or before now; keep the ones that have not ended
+            for start, end, class_id, order, day_label, start_str, end_str in intervals[:bisect_right(starts, minute)]:
+                if minute <= end:
+                    matches.append((class_id, order, day_label, start_str, end_str))
+        matches.sort()
+
+        access_info = []
+        for class_id, order, day_label, start_str, end_str in matches:
+            cls = classes[class_id]
+            access_info.append({
+                'class_id': class_id,
+                'class_name': cls['class_name'],
+                'course_name': cls['course_name'],
+                'course_code': cls['course_code'],
+                'schedule_day': day_label,
+                'start_time': start_str,
+                'end_time': end_str
+            })
+
+        if not access_info:
+            print(f"[SCHEDULE INDEX] ❌ Access denied for user {user_id}")
+            return {
+                'allowed': False,
+                'classes': [],
+                'sessions': [],
+                'reason': 'No active class schedule now'
+            }
+
+        print(f"[SCHEDULE INDEX] ✅ Access granted for user {user_id}")
+        sessions = [{
+            'session_id': None,
+            'class_id': item['class_id'],
+            'start_time': item['start_time'],
+            'end_time': item['end_time']
+        } for item in access_info]
+        return {
+            'allowed': True,
+            'classes': access_info,
+            'sessions': sessions,
+            'reason': 'Has active class schedule now'
+        }
+
+    def _no_classes(self, user_id):
+        print(f"[SCHEDULE INDEX] No enrolled/active classes found for user {user_id}")
+        return {
+            'allowed': False,
+            'classes': [],
+            'sessions': [],
+            'reason': 'No enrolled classes found'
+        }
+
+    def check(self, user_id, now=None):
+        """Access decision dict for user_id at now, or None if the index is not loaded"""
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+
+        roster = self._roster
+        if roster is not None and roster['date'] == now.date():
+            # Today's roster: plain dict lookups, never touches MySQL on this thread
+            self._maybe_refresh()
+            if user_id not in roster['users']:
+                return self._no_classes(user_id)
+            return self._decide(user_id, roster['classes'], roster['windows'].get(user_id), minute)
+        if roster is not None:
+            # Missed the midnight rebuild (e.g. the clock jumped); serve from the index meanwhile
+            self._rebuild_roster_in_background()
+
+        if not self._loaded and not self.load():
+            return None
+        self._maybe_refresh()
+
+        with self._lock:
+            compiled = self._compiled.get(user_id)
+            missing = compiled is None
+        if missing:
+            last = self._miss_checked.get(user_id, 0.0)
+            if time.monotonic() - last >= self.miss_refresh_interval:
+                self.refresh_user(user_id)
+                with self._lock:
+                    compiled = self._compiled.get(user_id)
+                    self._miss_checked[user_id] = time.monotonic()
+
+        if compiled is None:
+            return self._no_classes(user_id)
+        with self._lock:
+            return self._decide(user_id, self._classes, compiled.get(now.weekday()), minute)
+
+    # ------------------------------------------------------------------ daily roster
+
+    def _materialize_roster(self, day):
+        """Snapshot today's windows from the compiled index (caller holds the lock)"""
+        weekday = day.weekday()
+        windows = {user_id: days[weekday] for user_id, days in self._compiled.items() if weekday in days}
+        self._roster = {
+            'date': day,
+            'classes': self._classes,
+            'users': frozenset(self._compiled),
+            'windows': windows,
+        }
+        return windows
+
+    def build_roster(self, day=None):
+        """Reload enrolments and materialize the roster for day (default today)"""
+        started = time.perf_counter()
+        day = day or date.today()
+        if not self.load() and not self._loaded:
+            print("[SCHEDULE INDEX] Roster build failed: schedule data unavailable")
+            return False
+        with self._lock:
+            windows = self._materialize_roster(day)
+            elapsed = (time.perf_counter() - started) * 1000.0
+            self._roster_info = {
+                'date': day.isoformat(),
+                'built_at': datetime.now(),
+                'build_ms': elapsed,
+                'users': len(windows),
+                'intervals': sum(len(intervals) for _, intervals in windows.values()),
+            }
+        self._notify(None)
+        print(f"[SCHEDULE INDEX] Roster for {day.isoformat()}: {len(windows)} users with classes, "
+              f"built in {elapsed:.1f} ms")
+        return True
+
+    def _rebuild_roster_in_background(self):
+        if not self._roster_building.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.build_roster()
+            except Exception as e:
+                print(f"[SCHEDULE INDEX] Roster build error: {e}")
+            finally:
+                self._roster_building.release()
+
+        threading.Thread(target=run, name='roster-build', daemon=True).start()
+
+    def _schedule_midnight(self):
+        now = datetime.now()
+        next_midnight = datetime.combine(now.date() + timedelta(days=1), dt_time.min)
+        # A second past midnight so date.today() has already rolled over
+        delay = (next_midnight - now).total_seconds() + 1.0
+        self._midnight_timer = threading.Timer(delay, self._on_midnight)
+        self._midnight_timer.daemon = True
+        self._midnight_timer.start()
+
+    def _on_midnight(self):
+        self._rebuild_roster_in_background()
+        self._schedule_midnight()
+
+    def start_daily_roster(self):
+        """Build today's roster now (in the background) and again at every midnight"""
+        self._rebuild_roster_in_background()
+        if self._midnight_timer is None:
+            self._schedule_midnight()
+
+    def stop(self):
+        if self._midnight_timer is not None:
+            self._midnight_timer.cancel()
+            self._midnight_timer = None
+
+    def roster_info(self):
+        """Date, build time/duration and size of the current roster (None before the first build)"""
+        with self._lock:
+            return dict(self._roster_info) if self._roster_info else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'roster': dict(self._roster_info) if self._roster_info else None,
+                'loaded': self._loaded,
+                'classes': len(self._classes),
+                'users': len(self._compiled),
+                'intervals': sum(len(day[1]) for days in self._compiled.values() for day in days.values()),
+                'max_enrollment_id': self._max_enrollment_id,
+            }
+
+
+schedule_index = ScheduleIndex(
+    full_refresh_interval=env_number('SCHEDULE_INDEX_FULL_REFRESH', 3600),
+    incremental_interval=env_number('SCHEDULE_INDEX_INCREMENTAL_REFRESH', 60),
+    miss_refresh_interval=env_number('SCHEDULE_INDEX_MISS_REFRESH', 60),
+)
@@ -1,68 +1,475 @@
 import mysql.connector
 from mysql.connector import Error
 import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
+from env_config import env_number
+
 load_dotenv()
 
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes free within the checkout timeout"""
+
+
+# Client error codes meaning the server could not be reached (or went away mid-query)
+_CONNECTION_ERRNOS = {2002, 2003, 2005, 2006, 2013, 2055}
+
+
+def is_connection_error(exc):
+    """True if exc means MySQL is unreachable rather than the statement being wrong"""
+    if isinstance(exc, PoolTimeoutError):
+        return True
+    return isinstance(exc, Error) and getattr(exc, 'errno', None) in _CONNECTION_ERRNOS
+
+
+class ConnectionPool:
+    """Bounded, thread-safe MySQL connection pool.
+
+    Connections are health-checked on checkout when they have been idle for a
+    while, and recycled once they exceed max_idle seconds unused or max_age
+    seconds since they were opened.
+    """
+
+    def __init__(self, connect, max_size=5, max_idle=300.0, max_age=3600.0,
+                 checkout_timeout=10.0, health_check_after=2.0):
+        self._connect = connect
+        self.max_size = max(1, int(max_size))
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, created_at, last_used)
+        self._in_use = {}     # id(connection) -> created_at
+        self._opening = 0
+        self._closed = False
+
+        self._stats = {
+            'created': 0,
+            'recycled': 0,
+            'failed_health_checks': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _healthy(self, connection, last_used, now):
+        if now - last_used < self.health_check_after:
+            return True
+        try:
+            connection.ping(reconnect=False, attempts=1, delay=0)
+            return connection.is_connected()
+        except Exception:
+            return False
+
+    def acquire(self, timeout=None):
+        """Check out a connection, opening a new one if the pool has room"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        waited = False
+        while True:
+            candidate = None
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+                while True:
+                    if self._idle:
+                        # Most recently used first keeps the rest of the pool ageing out
+                        candidate = self._idle.pop()
+                        break
+                    if len(self._in_use) + self._opening < self.max_size:
+                        self._opening += 1
+                        break
+                    remaining = timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available after {timeout:.1f}s "
+                            f"({len(self._in_use)} in use)"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if candidate is not None:
+                connection, created_at, last_used = candidate
+                now = time.monotonic()
+                if now - created_at > self.max_age or now - last_used > self.max_idle:
+                    self._discard(connection)
+                    with self._cond:
+                        self._stats['recycled'] += 1
+                    continue
+                if not self._healthy(connection, last_used, now):
+                    self._discard(connection)
+                    with self._cond:
+                        self._stats['failed_health_checks'] += 1
+                    continue
+                with self._cond:
+                    self._in_use[id(connection)] = created_at
+                    self._record_checkout(started, waited)
+                return connection
+
+            # Open outside the lock so a slow handshake does not block other threads
+            try:
+                connection = self._connect()
+            except Exception:
+                with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._opening -= 1
+                self._in_use[id(connection)] = time.monotonic()
+                self._stats['created'] += 1
+                self._record_checkout(started, waited)
+            return connection
+
+    def _record_checkout(self, started, waited):
+        wait = time.monotonic() - started
+        self._stats['checkouts'] += 1
+        if waited:
+            self._stats['waits'] += 1
+        self._stats['wait_time_total'] += wait
+        self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait)
+
+    def release(self, connection, broken=False):
+        """Return a connection; broken connections are closed instead of reused"""
+        with self._cond:
+            created_at = self._in_use.pop(id(connection), None)
+        if created_at is None:
+            self._discard(connection)
+            return
+        if not broken:
+            try:
+                # Never hand the next caller an open transaction (or a stale read snapshot)
+                if connection.in_transaction:
+                    connection.rollback()
+                broken = not connection.is_connected()
+            except Exception:
+                broken = True
+        with self._cond:
+            if broken or self._closed:
+                self._discard(connection)
+            else:
+                self._idle.append((connection, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        """Snapshot of pool usage: sizes, checkout counts and wait times (ms)"""
+        with self._cond:
+            checkouts = self._stats['checkouts']
+            return {
+                'max_size': self.max_size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'created': self._stats['created'],
+                'recycled': self._stats['recycled'],
+                'failed_health_checks': self._stats['failed_health_checks'],
+                'checkouts': checkouts,
+                'waits': self._stats['waits'],
+                'timeouts': self._stats['timeouts'],
+                'avg_wait_ms': (self._stats['wait_time_total'] / checkouts * 1000.0) if checkouts else 0.0,
+                'max_wait_ms': self._stats['wait_time_max'] * 1000.0,
+            }
+
+    def close(self):
+        """Close idle connections and stop handing out new ones"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for connection, _, _ in idle:
+            self._discard(connection)
+
+
+def _is_read_query(query):
+    return query.strip().upper().startswith(('SELECT', 'SHOW', 'DESCRIBE'))
+
+
+_VALUES_RE = re.compile(r'\bVALUES\s*\(', re.IGNORECASE)
+_ON_DUPLICATE_RE = re.compile(r'\bON\s+DUPLICATE\s+KEY\b', re.IGNORECASE)
+
+
+def _row_template_end(query, start):
+    """Index just past the parenthesis matching the one at `start`, or None"""
+    depth = 0
+    quote = None
+    index = start
+    while index < len(query):
+        char = query[index]
+        if quote:
+            if char == '\\':
+                index += 1
+            elif char == quote:
+                quote = None
+        elif char in ("'", '"', '`'):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        index += 1
+    return None
+
+
+def _expand_values(query, row_count):
+    """Turn 'INSERT ... VALUES (%s, NOW()) [suffix]' into a row_count-row VALUES list, or None
+
+    Only the row list before any ON DUPLICATE KEY UPDATE clause is expanded
+    (that clause may use VALUES(col) itself); None if it cannot be parsed.
+    """
+    duplicate = _ON_DUPLICATE_RE.search(query)
+    head = query[:duplicate.start()] if duplicate else query
+    match = _VALUES_RE.search(head)
+    if not match:
+        return None
+    start = match.end() - 1
+    end = _row_template_end(head, start)
+    if end is None or head[end:].strip():
+        return None
+    row_template = query[start:end]
+    return query[:start] + ", ".join([row_template] * row_count) + query[end:]
+
+
+class Transaction:
+    """Unit of work bound to one pooled connection (see SimpleDatabaseConnection.transaction)"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lastrowid = None
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        """Run one statement; returns rows for reads, affected row count for writes.
+
+        MySQL errors propagate so the surrounding transaction is rolled back.
+        """
+        print(f"[DB SIMPLE] [TX] Executing query: {query}")
+        print(f"[DB SIMPLE] [TX] With parameters: {params}")
+        cursor = self.connection.cursor(dictionary=True, buffered=True)
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            if _is_read_query(query):
+                return cursor.fetchall()
+            self.rowcount = cursor.rowcount
+            if cursor.lastrowid:
+                self.lastrowid = cursor.lastrowid
+            return cursor.rowcount
+        finally:
+            try:
+                cursor.close()
+            except:
+                pass
+
+
 class SimpleDatabaseConnection:
     def __init__(self):
         self.host = os.getenv('DB_HOST', 'localhost')
         self.user = os.getenv('DB_USER', 'root')
         self.password = os.getenv('DB_PASSWORD', '')
         self.database = os.getenv('DB_NAME', 'elearning')
-        
+        # Bound the TCP connect so an unreachable server fails fast instead of hanging the caller
+        self.connect_timeout = int(env_number('DB_CONNECT_TIMEOUT', 5))
+        self.pool = ConnectionPool(
+            self._connect,
+            max_size=int(env_number('DB_POOL_SIZE', 5)),
+            max_idle=env_number('DB_POOL_MAX_IDLE', 300),
+            max_age=env_number('DB_POOL_MAX_AGE', 3600),
+            checkout_timeout=env_number('DB_POOL_TIMEOUT', 10),
+            health_check_after=env_number('DB_POOL_HEALTHCHECK_AFTER', 2),
+        )
+
+    def _connect(self):
+        return mysql.connector.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            charset='utf8mb4',
+            collation='utf8mb4_general_ci',
+            # Single statements commit themselves (no extra COMMIT/ROLLBACK round trip);
+            # transaction() opens an explicit transaction for multi-statement work
+            autocommit=True,
+            connection_timeout=self.connect_timeout
+        )
+
+    def pool_stats(self):
+        """Connection pool statistics (in use, idle, wait times)"""
+        return self.pool.stats()
+
+    def close(self):
+        """Close pooled connections (call on application shutdown)"""
+        self.pool.close()
+
+    @contextmanager
+    def transaction(self):
+        """Run several statements on one connection and commit once at the end.
+
+            with simple_db.transaction() as tx:
+                tx.execute("INSERT ...", params)
+                new_id = tx.lastrowid
+
+        Any exception inside the block rolls the whole unit back and is re-raised.
+        """
+        connection = self.pool.acquire()
+        broken = False
+        try:
+            connection.start_transaction()
+            tx = Transaction(connection)
+            yield tx
+            connection.commit()
+            print("[DB SIMPLE] [TX] Committed")
+        except BaseException:
+            try:
+                connection.rollback()
+                print("[DB SIMPLE] [TX] Rolled back")
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.pool.release(connection, broken=broken)
+
+    def execute_write(self, query, params=None):
+        """Run one self-committing write in a single round trip.
+
+        Returns (rowcount, lastrowid). Unlike execute_query, MySQL errors
+        propagate so callers can tell a duplicate key (errno 1062) from an
+        unreachable server (is_connection_error).
+        """
+        connection = self.pool.acquire()
+        broken = False
+        try:
+            tx = Transaction(connection)
+            rowcount = tx.execute(query, params)
+            if connection.in_transaction:
+                connection.commit()
+            return rowcount, tx.lastrowid
+        except Exception as e:
+            broken = is_connection_error(e)
+            raise
+        finally:
+            self.pool.release(connection, broken=broken)
+
+    def execute_many(self, query, rows, chunk_size=500):
+        """Bulk insert rows with one multi-row INSERT and one commit per chunk.
+
+        query is a normal single-row template, e.g.
+        "INSERT INTO t (a, b) VALUES (%s, %s)"; it is expanded to
+        "VALUES (%s, %s), (%s, %s), ..." for up to chunk_size rows at a time.
+        Returns the number of rows written. Chunks committed before an error
+        stay committed.
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+        chunk_size = max(1, int(chunk_size))
+        connection = None
+        cursor = None
+        broken = False
+        written = 0
+
+        print(f"[DB SIMPLE] Bulk executing {len(rows)} rows: {query}")
+
+        try:
+            connection = self.pool.acquire()
+            cursor = connection.cursor(buffered=True)
+            for lo in range(0, len(rows), chunk_size):
+                chunk = rows[lo:lo + chunk_size]
+                statement = _expand_values(query, len(chunk))
+                if statement is None:
+                    # Not a single-row VALUES template we can expand: let the driver batch it
+                    cursor.executemany(query, chunk)
+                else:
+                    cursor.execute(statement, tuple(value for row in chunk for value in row))
+                if connection.in_transaction:
+                    connection.commit()
+                written += len(chunk)
+            print(f"[DB SIMPLE] Bulk insert committed {written} rows")
+            return written
+
+        except Error as e:
+            print(f"[DB SIMPLE] MySQL Error in bulk insert after {written} rows: {type(e).__name__}: {e}")
+            if connection:
+                try:
+                    connection.rollback()
+                except:
+                    broken = True
+            return written
+        except Exception as e:
+            print(f"[DB SIMPLE] General Error in bulk insert after {written} rows: {type(e).__name__}: {e}")
+            return written
+        finally:
+            if cursor:
+                try:
+                    cursor.close()
+                except:
+                    pass
+            if connection:
+                self.pool.release(connection, broken=broken)
+
     def execute_query(self, query, params=None):
-        """Execute query with fresh connection each time"""
+        """Execute query on a pooled connection"""
         connection = None
         cursor = None
         result = None
-        
+        broken = False
+
         print(f"[DB SIMPLE] Executing query: {query}")
         print(f"[DB SIMPLE] With parameters: {params}")
-        
+
         try:
-            # Create fresh connection
-            connection = mysql.connector.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                charset='utf8mb4',
-                collation='utf8mb4_general_ci',
-                autocommit=False
-            )
-            
+            connection = self.pool.acquire()
+
             if not connection.is_connected():
                 print("[DB SIMPLE] Failed to connect")
+                broken = True
                 return None
-                
-            print("[DB SIMPLE] Connected successfully")
-            
+
             cursor = connection.cursor(dictionary=True, buffered=True)
-            
+
             if params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
-                
-            if query.strip().upper().startswith(('SELECT', 'SHOW', 'DESCRIBE')):
+
+            if _is_read_query(query):
                 result = cursor.fetchall()
                 print(f"[DB SIMPLE] Query returned {len(result) if result else 0} rows")
             else:
-                connection.commit()
+                if connection.in_transaction:
+                    connection.commit()
                 print("[DB SIMPLE] Query executed and committed")
                 result = True
-                
+
             return result
-                
+
         except Error as e:
             print(f"[DB SIMPLE] MySQL Error: {type(e).__name__}: {e}")
             if connection:
                 try:
                     connection.rollback()
                 except:
-                    pass
+                    broken = True
             return None
         except Exception as e:
             print(f"[DB SIMPLE] General Error: {type(e).__name__}: {e}")
@@ -71,15 +478,10 @@ class SimpleDatabaseConnection:
             if cursor:
                 try:
                     cursor.close()
-                    print("[DB SIMPLE] Cursor closed")
-                except:
-                    pass
-            if connection and connection.is_connected():
-                try:
-                    connection.close()
-                    print("[DB SIMPLE] Connection closed")
                 except:
                     pass
+            if connection:
+                self.pool.release(connection, broken=broken)
 
 # Create simple instance
 simple_db = SimpleDatabaseConnection()
@@ -3,8 +3,19 @@ import numpy as np
 import os
 import pickle
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from simple_database import simple_db
+from checkin_index import checkin_index
+from face_tracker import detect_scaled, scaled_size, tracker_from_env
+from track_identity import identities_from_env
+from env_config import env_number
+from face_gallery import (
+    FaceGallery, DISTANCE_METRICS, GALLERY_FILENAME, GalleryFileError,
+    load_gallery, save_gallery, recognizer_histograms
+)
 
 class SimpleFaceRecognition:
     def __init__(self):
@@ -20,6 +31,34 @@ class SimpleFaceRecognition:
             self.lbph_threshold = float(os.environ.get('LBPH_CONFIDENCE_THRESHOLD', '65'))
         except Exception:
             self.lbph_threshold = 65.0
+        # Gallery distance: chisqr_alt (same scale as LBPH predict, used by the threshold), l1 or l2
+        self.gallery_metric = os.environ.get('FACE_GALLERY_DISTANCE', 'chisqr_alt').strip().lower()
+        if self.gallery_metric not in DISTANCE_METRICS:
+            print(f"Unknown FACE_GALLERY_DISTANCE '{self.gallery_metric}', using chisqr_alt")
+            self.gallery_metric = 'chisqr_alt'
+        # All enrolled histograms, matched in one pass per detected face
+        self.gallery = FaceGallery(metric=self.gallery_metric)
+        # Packed binary copy of every model, memory-mapped at startup instead of parsing .yml files
+        self.gallery_path = os.path.join(self.models_path, GALLERY_FILENAME)
+        self.gallery_float16 = os.environ.get('FACE_GALLERY_FLOAT16', '0').strip().lower() in ('1', 'true', 'yes')
+        self.gallery_verify = os.environ.get('FACE_GALLERY_VERIFY', '0').strip().lower() in ('1', 'true', 'yes')
+        # Threads used to parse .yml models that are not yet in the gallery file
+        self.model_load_workers = max(1, env_number('FACE_MODEL_LOAD_WORKERS', min(4, os.cpu_count() or 1), int))
+        self.last_load_stats = {}
+        # Camera detection runs on a copy scaled by FACE_DETECT_SCALE (e.g. 0.5 = 320x240);
+        # boxes are mapped back and recognition crops the full-resolution grey frame
+        self.detect_scale = min(1.0, max(0.1, env_number('FACE_DETECT_SCALE', 0.5)))
+        self.detect_scale_factor = env_number('FACE_DETECT_SCALE_FACTOR', 1.3)
+        self.detect_min_neighbors = env_number('FACE_DETECT_MIN_NEIGHBORS', 5, int)
+        # Smallest face to report, in full-resolution pixels (0 = cascade minimum)
+        self.detect_min_size = env_number('FACE_DETECT_MIN_SIZE', 0, int)
+        # Camera stream: full detection every FACE_TRACK_EVERY frames, faces tracked in between
+        self.face_tracker = tracker_from_env(self._detect_gray)
+        # Voted identity per tracked face, re-verified every FACE_TRACK_REVERIFY_EVERY frames
+        self.track_identities = identities_from_env()
+        # Per-thread scratch arrays reused by the camera hot path (detection small
+        # frame, 200x200 recognition crop) instead of allocating them per frame
+        self._scratch = threading.local()
         
         # Create directories if they don't exist
         os.makedirs(self.dataset_path, exist_ok=True)
@@ -206,6 +245,7 @@ class SimpleFaceRecognition:
             model_filename = f"employee_{employee_id}_model.yml"
             model_path = os.path.join(self.models_path, model_filename)
             self.recognizer.write(model_path)
+            self._update_gallery_file(employee_id, self.recognizer, model_path)
             
             # Save to database
             model_data = {
@@ -355,8 +395,97 @@ class SimpleFaceRecognition:
             print(f"Error during dataset cleanup: {e}")
             return False
             
+    def _model_candidates(self, rows, timings):
+        """Map employee_id -> {'name', 'path'} for active DB models plus model files found only on disk"""
+        t0 = time.perf_counter()
+        candidates = {}
+        for row in rows:
+            # Resolve model path robustly
+            model_path = self._resolve_path(row['model_path'])
+            if not os.path.exists(model_path):
+                # Fallback: construct path from employee_id
+                eid = str(row['employee_id']).strip()
+                candidate = os.path.join(self.models_path, f"employee_{eid}_model.yml")
+                model_path = self._resolve_path(candidate)
+            candidates[row['employee_id']] = {'name': row['fullname'], 'path': model_path}
+
+        # Fallback scan: load any models present in models directory
+        orphans = {}
+        try:
+            import glob
+            pattern = os.path.join(self.models_path, "employee_*_model.yml")
+            for path in glob.glob(pattern):
+                filename = os.path.basename(path)
+                # Extract employee_id between employee_ and _model.yml
+                start = len("employee_")
+                end = filename.rfind("_model.yml")
+                if end > start:
+                    eid = filename[start:end]
+                    if eid not in candidates:
+                        orphans[eid] = path
+        except Exception as e:
+            print(f"Fallback scan error: {e}")
+        timings['io'] += time.perf_counter() - t0
+
+        if orphans:
+            # One lookup for every file found only on disk instead of a query per file
+            t0 = time.perf_counter()
+            names = {}
+            try:
+                placeholders = ", ".join(["%s"] * len(orphans))
+                user_rows = simple_db.execute_query(
+                    f"SELECT user_id, fullname FROM users WHERE user_id IN ({placeholders})",
+                    tuple(orphans.keys())
+                )
+                names = {str(r['user_id']): r['fullname'] for r in (user_rows or [])}
+            except Exception as e:
+                print(f"Fallback name lookup error: {e}")
+            timings['db'] += time.perf_counter() - t0
+            for eid, path in orphans.items():
+                candidates[eid] = {'name': names.get(eid, eid), 'path': path}
+        return candidates
+
+    @staticmethod
+    def _read_model_histograms(model_path):
+        """Parse one LBPH .yml model and return its histogram samples"""
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.read(model_path)
+        return recognizer_histograms(recognizer)
+
+    def _load_gallery_file(self):
+        """Memory-map the packed gallery file, or return None if it is missing/unusable"""
+        if not os.path.exists(self.gallery_path):
+            return None
+        try:
+            return load_gallery(self.gallery_path, metric=self.gallery_metric, verify=self.gallery_verify)
+        except GalleryFileError as e:
+            print(f"Ignoring gallery file: {e}")
+            return None
+
+    def _save_gallery_file(self, gallery):
+        """Persist the gallery and map it back so its pages are shared; keeps the in-memory copy on failure"""
+        try:
+            save_gallery(gallery, self.gallery_path, float16=self.gallery_float16)
+            return load_gallery(self.gallery_path, metric=self.gallery_metric)
+        except Exception as e:
+            # e.g. Windows refuses to replace a file that is still memory-mapped
+            print(f"Could not write gallery file {self.gallery_path}: {e}")
+            try:
+                os.remove(f"{self.gallery_path}.tmp")
+            except OSError:
+                pass
+            return gallery
+
     def load_all_face_models(self):
-        """Load all face models from database"""
+        """Load all face models from database.
+
+        Pipeline: one metadata query, one batched name lookup for files found
+        only on disk, gallery file mapping, then parallel parsing of any .yml
+        models the gallery file does not already hold. Per-phase timings are
+        kept in self.last_load_stats.
+        """
+        timings = {'db': 0.0, 'io': 0.0, 'parse': 0.0}
+        started = time.perf_counter()
         try:
             query = """
             SELECT ft.employee_id, ft.model_path, u.fullname 
@@ -365,74 +494,88 @@ class SimpleFaceRecognition:
             WHERE ft.status = 'active'
             """
             
+            t0 = time.perf_counter()
             results = simple_db.execute_query(query)
+            timings['db'] += time.perf_counter() - t0
             
             if results:
-                self.known_faces = {}
+                candidates = self._model_candidates(results, timings)
+                t0 = time.perf_counter()
+                stored = self._load_gallery_file()
+                gallery = FaceGallery(metric=self.gallery_metric)
+                known_faces = {}
                 loaded = 0
                 skipped = 0
+                to_parse = []
                 
-                for row in results:
-                    try:
-                        # Load the trained model file
-                        # Resolve model path robustly
-                        model_path = self._resolve_path(row['model_path'])
-                        if not os.path.exists(model_path):
-                            # Fallback: construct path from employee_id
-                            eid = str(row['employee_id']).strip()
-                            candidate = os.path.join(self.models_path, f"employee_{eid}_model.yml")
-                            model_path = self._resolve_path(candidate)
-
-                        if os.path.exists(model_path):
-                            recognizer = cv2.face.LBPHFaceRecognizer_create()
-                            recognizer.read(model_path)
-                            self.known_faces[row['employee_id']] = {
-                                'name': row['fullname'],
-                                'recognizer': recognizer
-                            }
-                            loaded += 1
-                        else:
-                            print(f"Model file not found, skipping: {model_path}")
-                            skipped += 1
-                        
-                    except Exception as e:
-                        print(f"Error loading model for employee {row['employee_id']}: {e}")
+                for employee_id, info in candidates.items():
+                    model_path = info['path']
+                    mtime = os.path.getmtime(model_path) if os.path.exists(model_path) else None
+                    entry = stored.entry(employee_id) if stored is not None else None
+                    # Reuse packed histograms unless the .yml was retrained after they were stored
+                    fresh = entry is not None and (
+                        mtime is None or (entry['source_mtime'] is not None and mtime <= entry['source_mtime'])
+                    )
+                    if fresh:
+                        gallery.add(employee_id, info['name'], entry['histograms'], entry['source_mtime'])
+                        known_faces[employee_id] = {
+                            'name': info['name']
+                        }
+                        loaded += 1
+                    elif mtime is not None:
+                        to_parse.append((employee_id, info['name'], model_path, mtime))
+                    else:
+                        print(f"Model file not found, skipping: {model_path}")
                         skipped += 1
-                        continue
-                        
-                # Fallback scan: load any models present in models directory
-                try:
-                    import glob
-                    pattern = os.path.join(self.models_path, "employee_*_model.yml")
-                    for path in glob.glob(pattern):
-                        try:
-                            filename = os.path.basename(path)
-                            # Extract employee_id between employee_ and _model.yml
-                            start = len("employee_")
-                            end = filename.rfind("_model.yml")
-                            if end > start:
-                                eid = filename[start:end]
-                                if eid not in self.known_faces:
-                                    # Lookup fullname from users table
-                                    user_rows = simple_db.execute_query(
-                                        "SELECT fullname FROM users WHERE user_id = %s",
-                                        (eid,)
-                                    )
-                                    fullname = user_rows[0]['fullname'] if user_rows else eid
-                                    recognizer = cv2.face.LBPHFaceRecognizer_create()
-                                    recognizer.read(path)
-                                    self.known_faces[eid] = {
-                                        'name': fullname,
-                                        'recognizer': recognizer
-                                    }
-                                    loaded += 1
-                        except Exception as e:
-                            print(f"Fallback scan load error for {path}: {e}")
-                            continue
-                except Exception as e:
-                    print(f"Fallback scan error: {e}")
+                timings['io'] += time.perf_counter() - t0
+
+                if to_parse:
+                    # OpenCV releases the GIL while reading models, so threads parse in parallel
+                    t0 = time.perf_counter()
+                    workers = max(1, min(self.model_load_workers, len(to_parse)))
+                    with ThreadPoolExecutor(max_workers=workers) as pool:
+                        futures = [pool.submit(self._read_model_histograms, item[2]) for item in to_parse]
+                        for (employee_id, name, model_path, mtime), future in zip(to_parse, futures):
+                            try:
+                                hists = future.result()
+                                if hists is None:
+                                    raise ValueError("model has no histograms")
+                                gallery.add(employee_id, name, hists, source_mtime=mtime)
+                                known_faces[employee_id] = {
+                                    'name': name
+                                }
+                                loaded += 1
+                            except Exception as e:
+                                print(f"Error loading model for employee {employee_id}: {e}")
+                                skipped += 1
+                    timings['parse'] += time.perf_counter() - t0
 
-                print(f"Loaded {loaded} face models, skipped {skipped}")
+                t0 = time.perf_counter()
+                if stored is not None and not to_parse and set(stored.employee_ids()) == set(known_faces):
+                    # Gallery file is up to date: keep the memory-mapped copy, only refresh names
+                    for employee_id, face in known_faces.items():
+                        stored.rename(employee_id, face['name'])
+                    gallery = stored
+                elif len(gallery) > 0:
+                    gallery = self._save_gallery_file(gallery)
+                timings['io'] += time.perf_counter() - t0
+                        
+                # Swap in the new gallery at once so the camera thread never sees a partial load
+                self.known_faces = known_faces
+                self.gallery = gallery
+                self.last_load_stats = {
+                    'loaded': loaded,
+                    'skipped': skipped,
+                    'parsed_yml': len(to_parse),
+                    'db_ms': timings['db'] * 1000.0,
+                    'io_ms': timings['io'] * 1000.0,
+                    'parse_ms': timings['parse'] * 1000.0,
+                    'total_ms': (time.perf_counter() - started) * 1000.0,
+                }
+                print(f"Loaded {loaded} face models ({len(to_parse)} from .yml), skipped {skipped}")
+                print(f"Model load timings: DB {timings['db'] * 1000.0:.1f} ms, "
+                      f"I/O {timings['io'] * 1000.0:.1f} ms, parse {timings['parse'] * 1000.0:.1f} ms "
+                      f"({workers if to_parse else 0} workers), total {self.last_load_stats['total_ms']:.1f} ms")
                 return loaded > 0
             else:
                 print("No face models found in database")
@@ -441,67 +584,122 @@ class SimpleFaceRecognition:
         except Exception as e:
             print(f"Error loading face models: {e}")
             return False
+
+    def _update_gallery_file(self, employee_id, recognizer, model_path):
+        """Merge a freshly trained model into the gallery file"""
+        try:
+            stored = self._load_gallery_file() or FaceGallery(metric=self.gallery_metric)
+            previous = stored.entry(employee_id)
+            name = previous['name'] if previous else str(employee_id)
+            stored.add_recognizer(employee_id, name, recognizer, source_mtime=os.path.getmtime(model_path))
+            save_gallery(stored, self.gallery_path, float16=self.gallery_float16)
+            print(f"Gallery file updated for employee {employee_id}")
+        except Exception as e:
+            # Not fatal: the .yml model is still picked up on the next load
+            print(f"Warning: could not update gallery file for {employee_id}: {e}")
             
+
     def recognize_face(self, frame):
         """Recognize face in given frame"""
+        gray, face_locations, track_ids = self.locate_faces(frame)
+        recognized_employees = self.recognize_faces(gray, face_locations, track_ids)
+        return recognized_employees, face_locations
+    
+    def detect_faces(self, frame):
+        """Detect faces; returns (grayscale frame, [(left, top, right, bottom), ...])"""
+        gray, face_locations, _ = self.locate_faces(frame)
+        return gray, face_locations
+    
+    def locate_faces(self, frame, gray=None):
+        """Like detect_faces, plus a track id per face (None when tracking is off)
+        
+        gray, if given with the frame's size, receives the grayscale conversion.
+        """
+        # Convert to grayscale
+        if gray is not None and gray.shape != frame.shape[:2]:
+            gray = None
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        
+        if self.face_tracker is not None:
+            face_locations, track_ids = self.face_tracker.locate_tracked(frame, gray)
+            return gray, face_locations, track_ids
+        face_locations = self._detect_gray(gray)
+        return gray, face_locations, [None] * len(face_locations)
+    
+    def _detect_gray(self, gray):
+        """Full Haar detection, as [(left, top, right, bottom), ...] in gray's coordinates"""
+        scale = self.detect_scale
+        small = getattr(self._scratch, 'small', None)
+        width, height = scaled_size(gray.shape, scale)
+        if scale < 1.0 and (small is None or small.shape != (height, width)):
+            small = self._scratch.small = np.empty((height, width), np.uint8)
+        return detect_scaled(self.face_cascade, gray, scale, self.detect_scale_factor,
+                             self.detect_min_neighbors, self.detect_min_size, buffer=small)
+    
+    def reset_tracking(self):
+        """Drop tracked faces and their cached identities (e.g. when the camera restarts)"""
+        if self.face_tracker is not None:
+            self.face_tracker.reset()
+            self.track_identities.clear()
+    
+    def recognize_faces(self, gray, face_locations, track_ids=None):
+        """Match each detected face against the gallery (None for unknown faces)
+        
+        With track ids, tracked faces reuse their voted identity instead of
+        being matched every frame (see TrackIdentities).
+        """
         if len(self.known_faces) == 0:
             self.load_all_face_models()
-            
-        # Convert to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         
-        # Detect faces
-        faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+        if track_ids and None not in track_ids:
+            return self.track_identities.resolve(
+                track_ids, face_locations, lambda i: self._match_face(gray, face_locations[i])
+            )
+        return [self._match_face(gray, location) for location in face_locations]
+    
+    def _match_face(self, gray, face_location):
+        """Gallery match for one face; result dict, or None if unknown"""
+        left, top, right, bottom = face_location
+        face_roi = gray[top:bottom, left:right]
+        face_buffer = getattr(self._scratch, 'face', None)
+        if face_buffer is None:
+            face_buffer = self._scratch.face = np.empty((200, 200), np.uint8)
+        face_resized = cv2.resize(face_roi, (200, 200), dst=face_buffer)
         
-        recognized_employees = []
-        face_locations = []
+        best_match = None
+        best_raw_confidence = float('inf')  # raw LBPH distance (lower is better)
         
-        for (x, y, w, h) in faces:
-            # Store face location in (left, top, right, bottom) format
-            face_locations.append((x, y, x+w, y+h))
-            
-            face_roi = gray[y:y+h, x:x+w]
-            face_resized = cv2.resize(face_roi, (200, 200))
-            
-            best_match = None
-            best_raw_confidence = float('inf')  # raw LBPH distance (lower is better)
-            
-            # Try to recognize with each trained model
-            for employee_id, face_data in self.known_faces.items():
-                try:
-                    recognizer = face_data['recognizer']
-                    label, raw_conf = recognizer.predict(face_resized)
-
-                    # Keep the lowest raw distance across models
-                    if raw_conf < best_raw_confidence:
-                        # Provide a normalized confidence for UI (0..1), higher is better
-                        # Using 1 - raw/100 keeps previous UI behavior
-                        normalized = max(0.0, min(1.0, 1.0 - (raw_conf / 100.0)))
-                        best_raw_confidence = raw_conf
-                        best_match = {
-                            'employee_id': employee_id,
-                            'name': face_data['name'],
-                            'confidence': normalized,
-                            'raw_confidence': raw_conf,
-                            'face_location': (x, y, x+w, y+h)
-                        }
-                        
-                except Exception as e:
-                    print(f"Error during recognition: {e}")
-                    continue
-                    
-            # Add recognized employee (or None for unknown faces)
-            # Decide known/unknown based on LBPH raw distance threshold
-            if best_match and best_raw_confidence <= self.lbph_threshold:
-                recognized_employees.append(best_match)
-            else:
-                recognized_employees.append(None)  # Unknown face
+        # Match the probe once against every enrolled sample
+        try:
+            match = self.gallery.match(face_resized)
+            if match:
+                employee_id, name, raw_conf = match
+                # Provide a normalized confidence for UI (0..1), higher is better
+                # Using 1 - raw/100 keeps previous UI behavior
+                normalized = max(0.0, min(1.0, 1.0 - (raw_conf / 100.0)))
+                best_raw_confidence = raw_conf
+                best_match = {
+                    'employee_id': employee_id,
+                    'name': name,
+                    'confidence': normalized,
+                    'raw_confidence': raw_conf,
+                    'face_location': (left, top, right, bottom)
+                }
+        except Exception as e:
+            print(f"Error during recognition: {e}")
                 
-        return recognized_employees, face_locations
+        # Decide known/unknown based on LBPH raw distance threshold
+        if best_match and best_raw_confidence <= self.lbph_threshold:
+            return best_match
+        return None  # Unknown face
         
     def mark_attendance(self, employee_id, confidence_score):
         """Mark attendance for recognized employee"""
         try:
+            # Repeat entries are answered from the in-memory index of today's check-ins
+            if checkin_index.student_checked_in(employee_id) is not None:
+                return False, "Attendance already marked for today"
+            
             # Check if already marked today
             today = datetime.now().date()
             check_query = """
@@ -512,6 +710,7 @@ class SimpleFaceRecognition:
             existing = simple_db.execute_query(check_query, (employee_id, today))
             
             if existing:
+                checkin_index.add(employee_id, None)
                 return False, "Attendance already marked for today"
                 
             # Get active session for today (we need session_id for student_attendances)
@@ -543,6 +742,7 @@ class SimpleFaceRecognition:
             result = simple_db.execute_query(insert_query, params)
             
             if result:
+                checkin_index.add(employee_id, None, current_time)
                 # Log the attendance attempt
                 self.log_attendance_attempt(employee_id, confidence_score, 'success')
                 return True, "Attendance marked successfully"
@@ -580,6 +780,7 @@ class SimpleFaceRecognition:
                 # Remove from loaded models
                 if employee_id in self.known_faces:
                     del self.known_faces[employee_id]
+                self.gallery.remove(employee_id)
                     
                 print(f"Face model deleted for employee {employee_id}")
                 return True
@@ -0,0 +1,163 @@
+"""
+Identity cache for tracked faces
+A tracked face cannot change identity, so it only needs a gallery match for
+its first few frames. The first `vote_frames` matches of a new track are
+collected and decided by majority (ties broken by the lower average
+distance). After that the decided identity is reused for the rest of the
+track, with one re-verification match every `reverify_every` frames: if the
+re-verification disagrees, the track votes again.
+
+Results are the same per-face dicts (or None for unknown) recognize_faces()
+returns, plus 'track_id', 'decided', 'confirmed' and 'settled'. 'decided' is
+False while the track is still voting; 'confirmed' is True only on the frame
+where a track's identity is decided (or changes). Once the caller has acted
+on a track successfully it calls settle(), and the track's results carry
+'settled' True (until the identity changes), so failed or lost actions can
+be retried while the person stays in view.
+"""
+import threading
+from collections import Counter
+
+from env_config import env_number
+
+
+class _TrackState:
+    __slots__ = ('votes', 'identity', 'since_verify', 'settled')
+
+    def __init__(self):
+        self.votes = []          # per-frame match results while deciding
+        self.identity = None     # decided result dict (None = unknown)
+        self.since_verify = None  # frames since the decision/last re-verification; None while voting
+        self.settled = None      # employee_id the caller acted on successfully
+
+
+class TrackIdentities:
+    """track_id -> decided identity, fed by match(face) only when a match is needed"""
+
+    def __init__(self, vote_frames=3, reverify_every=30):
+        self.vote_frames = max(1, int(vote_frames))
+        self.reverify_every = max(1, int(reverify_every))
+        self._lock = threading.Lock()
+        self._tracks = {}
+        self.matches = 0
+        self.cached = 0
+        self.decisions = 0
+        self.reverify_failures = 0
+
+    @staticmethod
+    def _employee_id(result):
+        return result['employee_id'] if result else None
+
+    def _decide(self, votes):
+        counts = Counter(self._employee_id(vote) for vote in votes)
+        best = max(counts.values())
+        candidates = [eid for eid, count in counts.items() if count == best]
+
+        def avg_distance(eid):
+            distances = [vote['raw_confidence'] for vote in votes if vote and vote['employee_id'] == eid]
+            return sum(distances) / len(distances) if distances else float('inf')
+
+        winner = min(candidates, key=avg_distance)
+        if winner is None:
+            return None
+        winning = [vote for vote in votes if vote and vote['employee_id'] == winner]
+        raw = avg_distance(winner)
+        decided = dict(winning[-1])
+        decided['raw_confidence'] = raw
+        decided['confidence'] = max(0.0, min(1.0, 1.0 - (raw / 100.0)))
+        return decided
+
+    def resolve(self, track_ids, face_locations, match):
+        """Per-face results for this frame; match(index) runs the gallery match for face `index`"""
+        results = []
+        with self._lock:
+            # Tracks not present any more are over
+            live = set(track_ids)
+            for track_id in list(self._tracks):
+                if track_id not in live:
+                    del self._tracks[track_id]
+
+        for index, track_id in enumerate(track_ids):
+            with self._lock:
+                state = self._tracks.setdefault(track_id, _TrackState())
+                needs_match = state.since_verify is None or state.since_verify + 1 >= self.reverify_every
+            if not needs_match:
+                with self._lock:
+                    state.since_verify += 1
+                    self.cached += 1
+                result = dict(state.identity) if state.identity else None
+                if result:
+                    result['face_location'] = face_locations[index]
+                    result['track_id'] = track_id
+                    result['decided'] = True
+                    result['confirmed'] = False
+                    result['settled'] = state.settled == result['employee_id']
+                results.append(result)
+                continue
+
+            current = match(index)
+            with self._lock:
+                self.matches += 1
+                confirmed = False
+                if state.since_verify is not None:
+                    # Re-verification of a decided track
+                    if self._employee_id(current) == self._employee_id(state.identity):
+                        state.since_verify = 0
+                    else:
+                        self.reverify_failures += 1
+                        state.votes = [current]
+                        state.since_verify = None
+                else:
+                    state.votes.append(current)
+                if state.since_verify is None and len(state.votes) >= self.vote_frames:
+                    previous = self._employee_id(state.identity)
+                    state.identity = self._decide(state.votes)
+                    state.votes = []
+                    state.since_verify = 0
+                    self.decisions += 1
+                    confirmed = self._employee_id(state.identity) != previous or previous is None
+                decided = state.since_verify is not None
+
+            if decided:
+                result = dict(state.identity) if state.identity else None
+            else:
+                # Still voting: show this frame's match, but it is not confirmed yet
+                result = dict(current) if current else None
+            if result:
+                result['face_location'] = face_locations[index]
+                result['track_id'] = track_id
+                result['decided'] = decided
+                result['confirmed'] = decided and confirmed
+                result['settled'] = decided and state.settled == result['employee_id']
+            results.append(result)
+        return results
+
+    def settle(self, track_id, employee_id):
+        """The caller's action for this track's identity succeeded; stop asking for it"""
+        with self._lock:
+            state = self._tracks.get(track_id)
+            if state is not None:
+                state.settled = employee_id
+
+    def clear(self):
+        with self._lock:
+            self._tracks.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.matches + self.cached
+            return {
+                'tracks': len(self._tracks),
+                'matches': self.matches,
+                'cached': self.cached,
+                'decisions': self.decisions,
+                'reverify_failures': self.reverify_failures,
+                'cache_rate': self.cached / total if total else 0.0,
+            }
+
+
+def identities_from_env():
+    return TrackIdentities(
+        vote_frames=env_number('FACE_TRACK_VOTE_FRAMES', 3, int),
+        reverify_every=env_number('FACE_TRACK_REVERIFY_EVERY', 30, int),
+    )
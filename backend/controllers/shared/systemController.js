@@ -1,6 +1,7 @@
 import {
     DoorAccessLogs,
-    Users
+    Users,
+    db
 } from "../../models/index.js";
 import { Op } from "sequelize";
 import logger from "../../utils/logger.js";
@@ -303,6 +304,77 @@ export const getDoorAccessLogs = async (req, res) => {
     }
 };
 
+const DOOR_ACCESS_TYPES = ['face_recognition', 'keycard', 'manual_override', 'emergency'];
+const DOOR_ACCESS_STATUSES = ['granted', 'denied', 'forced'];
+const DOOR_LOG_BATCH_MAX = 500;
+
+/**
+ * Record a batch of door access events from the face recognition device (no auth required)
+ * Body: { logs: [{ user_id, access_type, access_status, confidence_score, reason, session_id, accessed_at }] }
+ * All rows are written with one multi-row INSERT; accessed_at keeps the device's local time
+ */
+export const logDoorAccessBatch = async (req, res) => {
+    try {
+        const { logs } = req.body;
+
+        // Validation
+        if (!Array.isArray(logs) || logs.length === 0) {
+            return res.status(400).json({
+                success: false,
+                message: "logs harus berupa array yang tidak kosong"
+            });
+        }
+        if (logs.length > DOOR_LOG_BATCH_MAX) {
+            return res.status(413).json({
+                success: false,
+                message: `Maksimal ${DOOR_LOG_BATCH_MAX} log per permintaan`
+            });
+        }
+
+        const replacements = [];
+        for (const log of logs) {
+            if (!log || !DOOR_ACCESS_TYPES.includes(log.access_type) || !DOOR_ACCESS_STATUSES.includes(log.access_status)) {
+                return res.status(400).json({
+                    success: false,
+                    message: "access_type atau access_status tidak valid"
+                });
+            }
+            // "2025-09-16T14:25:13.123456" -> "2025-09-16 14:25:13", as the device's DB fallback stores it
+            const accessedAt = /^(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})/.exec(log.accessed_at || '');
+            replacements.push(
+                log.user_id ?? null,
+                log.access_type,
+                log.access_status,
+                log.confidence_score ?? null,
+                log.reason ? String(log.reason).slice(0, 200) : null,
+                log.session_id ?? null,
+                accessedAt ? `${accessedAt[1]} ${accessedAt[2]}` : null
+            );
+        }
+
+        const rows = logs.map(() => '(?, ?, ?, ?, ?, ?, COALESCE(?, NOW()))').join(', ');
+        await db.query(`
+            INSERT INTO door_access_logs
+            (user_id, access_type, access_status, confidence_score, reason, session_id, accessed_at)
+            VALUES ${rows}
+        `, { replacements });
+
+        res.status(201).json({
+            success: true,
+            message: "Log akses pintu berhasil disimpan",
+            data: {
+                inserted: logs.length
+            }
+        });
+    } catch (error) {
+        console.error('Log door access batch error:', error);
+        res.status(500).json({
+            success: false,
+            message: "Gagal menyimpan log akses pintu"
+        });
+    }
+};
+
 /**
  * Get room access permissions (Admin only)
  */
@@ -0,0 +1,68 @@
+// Migration script to make (session_id, student_id) unique on student_attendances
+// The face recognition client relies on this key to record a check-in with a single INSERT.
+// The attendance rule is still one check-in per student, per class, per day (across all of
+// that day's sessions); the client's INSERT enforces that itself, the key guards races
+// between concurrent inserts into the same session.
+import db from '../config/Database.js';
+
+const INDEX_NAME = 'student_attendances_session_id_student_id';
+
+const addAttendanceUniqueKey = async () => {
+    try {
+        console.log('🔄 Starting migration: Adding unique (session_id, student_id) key to student_attendances...');
+        
+        const [existing] = await db.query(`
+            SELECT INDEX_NAME, NON_UNIQUE
+            FROM INFORMATION_SCHEMA.STATISTICS 
+            WHERE TABLE_NAME = 'student_attendances' 
+            AND INDEX_NAME = '${INDEX_NAME}' 
+            AND TABLE_SCHEMA = DATABASE()
+            LIMIT 1
+        `);
+        
+        if (existing.length > 0 && Number(existing[0].NON_UNIQUE) === 0) {
+            console.log('ℹ️  Unique key already exists on student_attendances');
+            return;
+        }
+        
+        // Refuse to run while duplicate rows exist; they have to be resolved by hand
+        const [duplicates] = await db.query(`
+            SELECT session_id, student_id, COUNT(*) AS total
+            FROM student_attendances
+            GROUP BY session_id, student_id
+            HAVING COUNT(*) > 1
+        `);
+        
+        if (duplicates.length > 0) {
+            console.error('❌ Duplicate attendance rows found (session_id, student_id, total):');
+            duplicates.forEach(row => console.error(`   ${row.session_id}, ${row.student_id}, ${row.total}`));
+            throw new Error('Remove duplicate student_attendances rows before adding the unique key');
+        }
+        
+        await db.query(`
+            ALTER TABLE student_attendances 
+            ${existing.length > 0 ? `DROP INDEX ${INDEX_NAME},` : ''}
+            ADD UNIQUE KEY ${INDEX_NAME} (session_id, student_id)
+        `);
+        console.log('✅ Successfully added unique key to student_attendances');
+        
+    } catch (error) {
+        console.error('❌ Migration failed:', error);
+        throw error;
+    }
+};
+
+// Run migration if this file is executed directly
+if (import.meta.url === `file://${process.argv[1]}`) {
+    addAttendanceUniqueKey()
+        .then(() => {
+            console.log('🎉 Migration completed successfully!');
+            process.exit(0);
+        })
+        .catch((error) => {
+            console.error('💥 Migration failed:', error);
+            process.exit(1);
+        });
+}
+
+export default addAttendanceUniqueKey;
@@ -165,6 +165,7 @@ const StudentAttendances = db.define('student_attendances', {
     updatedAt: 'updated_at',
     indexes: [
         {
+            unique: true,
             fields: ['session_id', 'student_id']
         },
         {
@@ -1,6 +1,7 @@
 import express from 'express';
 import { createCourseClassDemo, deleteCourseClassDemo, testAuth } from '../../controllers/shared/demoController.js';
 import { checkUserRoomAccess } from '../../controllers/shared/attendanceController.js';
+import { logDoorAccessBatch } from '../../controllers/shared/systemController.js';
 import { verifyUser } from '../../middleware/AuthUser.js';
 
 const router = express.Router();
@@ -12,6 +13,9 @@ router.delete('/demo/courses/classes/:id', deleteCourseClassDemo);
 // Face recognition room access check (no auth required)
 router.post('/attendance/check-access', checkUserRoomAccess);
 
+// Door access logs from the face recognition device, batched (no auth required)
+router.post('/door-access/log', logDoorAccessBatch);
+
 // Test auth endpoint WITH authentication to check session
 router.get('/test-auth', verifyUser, testAuth);
 